@@ -29,7 +29,15 @@ config.set_main_option("sqlalchemy.url", database_url)
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
+from pangeo_forge_orchestrator.deliveries import HookDelivery  # noqa: E402 F401
+from pangeo_forge_orchestrator.idempotency import HookIdempotencyKey  # noqa: E402 F401
+from pangeo_forge_orchestrator.jobs import Job  # noqa: E402 F401
 from pangeo_forge_orchestrator.models import MODELS  # noqa: E402 F401
+from pangeo_forge_orchestrator.stats import (  # noqa: E402 F401
+    RecipeRunDailyStats,
+    RecipeRunHourlyStats,
+    StatsRefresh,
+)
 
 target_metadata = SQLModel.metadata
 
@@ -0,0 +1,42 @@
+"""add job queue
+
+Revision ID: 05d0571acbe7
+Revises: 0499cef6b57a
+Create Date: 2026-10-17 01:30:00.000000
+
+"""
+import sqlalchemy as sa
+import sqlmodel  # noqa: F401
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "05d0571acbe7"
+down_revision = "0499cef6b57a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "job",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("task", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("args", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("installation_id", sa.Integer(), nullable=True),
+        sa.Column("bakery_id", sa.Integer(), nullable=True),
+        sa.Column("status", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("max_attempts", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("run_after", sa.DateTime(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("completed_at", sa.DateTime(), nullable=True),
+        sa.Column("error", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_job_status_run_after", "job", ["status", "run_after"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_job_status_run_after", table_name="job")
+    op.drop_table("job")
@@ -0,0 +1,39 @@
+"""add hourly stats rollup
+
+Revision ID: 2b7f3e9a6c51
+Revises: e5a8c2f47d10
+Create Date: 2026-10-17 05:50:00.000000
+
+"""
+import sqlalchemy as sa
+import sqlmodel  # noqa: F401
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "2b7f3e9a6c51"
+down_revision = "e5a8c2f47d10"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "reciperunhourlystats",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("hour", sa.DateTime(), nullable=False),
+        sa.Column("bakery_id", sa.Integer(), nullable=False),
+        sa.Column("feedstock_id", sa.Integer(), nullable=False),
+        sa.Column("is_test", sa.Boolean(), nullable=False),
+        sa.Column("started", sa.Integer(), nullable=False),
+        sa.Column("completed", sa.Integer(), nullable=False),
+        sa.Column("succeeded", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_reciperunhourlystats_hour"), "reciperunhourlystats", ["hour"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_reciperunhourlystats_hour"), table_name="reciperunhourlystats")
+    op.drop_table("reciperunhourlystats")
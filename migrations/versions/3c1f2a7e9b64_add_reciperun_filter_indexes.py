@@ -0,0 +1,35 @@
+"""add reciperun filter indexes
+
+Revision ID: 3c1f2a7e9b64
+Revises: 05d0571acbe7
+Create Date: 2026-10-17 03:10:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3c1f2a7e9b64"
+down_revision = "05d0571acbe7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_reciperun_feedstock_id_status_conclusion_is_test",
+        "reciperun",
+        ["feedstock_id", "status", "conclusion", "is_test"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_reciperun_bakery_id_status", "reciperun", ["bakery_id", "status"], unique=False
+    )
+    op.create_index("ix_reciperun_started_at", "reciperun", ["started_at"], unique=False)
+    op.create_index("ix_reciperun_completed_at", "reciperun", ["completed_at"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_reciperun_completed_at", table_name="reciperun")
+    op.drop_index("ix_reciperun_started_at", table_name="reciperun")
+    op.drop_index("ix_reciperun_bakery_id_status", table_name="reciperun")
+    op.drop_index("ix_reciperun_feedstock_id_status_conclusion_is_test", table_name="reciperun")
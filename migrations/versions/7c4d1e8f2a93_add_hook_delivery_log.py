@@ -0,0 +1,45 @@
+"""add hook delivery log
+
+Revision ID: 7c4d1e8f2a93
+Revises: 2b7f3e9a6c51
+Create Date: 2026-10-17 06:40:00.000000
+
+"""
+import sqlalchemy as sa
+import sqlmodel  # noqa: F401
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7c4d1e8f2a93"
+down_revision = "2b7f3e9a6c51"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "hookdelivery",
+        sa.Column("guid", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("event", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("action", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("installation_id", sa.Integer(), nullable=True),
+        sa.Column("repository_id", sa.Integer(), nullable=True),
+        sa.Column("repository", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("delivered_at", sa.DateTime(), nullable=False),
+        sa.Column("status_code", sa.Integer(), nullable=False),
+        sa.Column("duration", sa.Float(), nullable=False),
+        sa.Column("payload_sha256", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("payload", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_hookdelivery_guid"), "hookdelivery", ["guid"], unique=False)
+    op.create_index(
+        "ix_hookdelivery_repository__id", "hookdelivery", ["repository", "id"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("ix_hookdelivery_repository__id", table_name="hookdelivery")
+    op.drop_index(op.f("ix_hookdelivery_guid"), table_name="hookdelivery")
+    op.drop_table("hookdelivery")
@@ -0,0 +1,25 @@
+"""add hookdelivery job_id
+
+Revision ID: 9d1c6e4b7a58
+Revises: f3b9d2c71e45
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9d1c6e4b7a58"
+down_revision = "f3b9d2c71e45"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("hookdelivery", sa.Column("job_id", sa.Integer(), nullable=True))
+    op.create_index(op.f("ix_hookdelivery_job_id"), "hookdelivery", ["job_id"], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f("ix_hookdelivery_job_id"), table_name="hookdelivery")
+    op.drop_column("hookdelivery", "job_id")
@@ -0,0 +1,30 @@
+"""add lookup indexes and unique constraints
+
+Revision ID: 9d4e6b1a2c37
+Revises: 3c1f2a7e9b64
+Create Date: 2026-10-17 03:40:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9d4e6b1a2c37"
+down_revision = "3c1f2a7e9b64"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NOTE: these will fail if there are already duplicate bakery names or feedstock specs, which
+    # must then be merged by hand (the app assumes they're unique, and errors on duplicates anyway).
+    op.create_unique_constraint("uq_bakery_name", "bakery", ["name"])
+    op.create_unique_constraint("uq_feedstock_spec", "feedstock", ["spec"])
+    op.create_index(
+        "ix_reciperun_recipe_id_head_sha", "reciperun", ["recipe_id", "head_sha"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("ix_reciperun_recipe_id_head_sha", table_name="reciperun")
+    op.drop_constraint("uq_feedstock_spec", "feedstock", type_="unique")
+    op.drop_constraint("uq_bakery_name", "bakery", type_="unique")
@@ -0,0 +1,26 @@
+"""add hookdelivery redelivery
+
+Revision ID: a1f6d3b8e247
+Revises: 7c4d1e8f2a93
+Create Date: 2026-10-17 07:20:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a1f6d3b8e247"
+down_revision = "7c4d1e8f2a93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "hookdelivery",
+        sa.Column("redelivery", sa.Boolean(), server_default=sa.false(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_column("hookdelivery", "redelivery")
@@ -0,0 +1,33 @@
+"""add hook idempotency keys
+
+Revision ID: c8e2f5a9d614
+Revises: a1f6d3b8e247
+Create Date: 2026-10-17 08:00:00.000000
+
+"""
+import sqlalchemy as sa
+import sqlmodel  # noqa: F401
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c8e2f5a9d614"
+down_revision = "a1f6d3b8e247"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "hookidempotencykey",
+        sa.Column("key", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("claimed_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index(
+        op.f("ix_hookidempotencykey_claimed_at"), "hookidempotencykey", ["claimed_at"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_hookidempotencykey_claimed_at"), table_name="hookidempotencykey")
+    op.drop_table("hookidempotencykey")
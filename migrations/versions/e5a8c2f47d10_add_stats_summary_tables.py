@@ -0,0 +1,44 @@
+"""add stats summary tables
+
+Revision ID: e5a8c2f47d10
+Revises: 9d4e6b1a2c37
+Create Date: 2026-10-17 05:10:00.000000
+
+"""
+import sqlalchemy as sa
+import sqlmodel  # noqa: F401
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e5a8c2f47d10"
+down_revision = "9d4e6b1a2c37"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "reciperundailystats",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("bakery_id", sa.Integer(), nullable=False),
+        sa.Column("status", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("conclusion", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("is_test", sa.Boolean(), nullable=False),
+        sa.Column("has_dataset", sa.Boolean(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "statsrefresh",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("refreshed_at", sa.DateTime(), nullable=False),
+        sa.Column("bakeries", sa.Integer(), nullable=False),
+        sa.Column("feedstocks", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade():
+    op.drop_table("statsrefresh")
+    op.drop_table("reciperundailystats")
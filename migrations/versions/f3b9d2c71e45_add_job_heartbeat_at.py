@@ -0,0 +1,23 @@
+"""add job heartbeat_at
+
+Revision ID: f3b9d2c71e45
+Revises: c8e2f5a9d614
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f3b9d2c71e45"
+down_revision = "c8e2f5a9d614"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("job", sa.Column("heartbeat_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("job", "heartbeat_at")
@@ -1,10 +1,13 @@
+import asyncio
 import os
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
 
-from .database import maybe_create_db_and_tables
+from .cache import ResponseCacheMiddleware
+from .config import watch_config
+from .database import async_engine, maybe_create_db_and_tables
 from .http import http_session
 from .metadata import app_metadata
 from .routers.github_app import github_app_router
@@ -14,6 +17,9 @@ from .routers.stats import stats_router
 
 app = FastAPI(**app_metadata)
 
+# Added first, so that it's innermost, and never caches the headers added by the middleware below.
+app.add_middleware(ResponseCacheMiddleware)
+
 if os.environ.get("PANGEO_FORGE_DEPLOYMENT") in ("prod", "staging"):
     app.add_middleware(HTTPSRedirectMiddleware)
 
@@ -25,6 +31,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -34,6 +41,24 @@ def on_startup():
     http_session.start()
 
 
+@app.on_event("startup")
+async def maybe_start_config_watcher():
+    # Opt-in, because in most deployments the config is only ever changed by a redeploy.
+    if interval := os.environ.get("PANGEO_FORGE_CONFIG_WATCH_INTERVAL"):
+        app.state.config_watcher = asyncio.create_task(watch_config(float(interval)))
+
+
+@app.on_event("shutdown")
+async def maybe_stop_config_watcher():
+    if config_watcher := getattr(app.state, "config_watcher", None):
+        config_watcher.cancel()
+
+
+@app.on_event("shutdown")
+async def close_async_database_connections():
+    await async_engine.dispose()
+
+
 @app.on_event("shutdown")
 def on_shutdown():
     # TODO: make this function async, and await .stop() below
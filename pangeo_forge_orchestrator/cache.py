@@ -0,0 +1,224 @@
+"""A cache for the responses to the public GET routes, which pangeo-forge.org requests constantly.
+Only routes served from the database are cached: those under ``/feedstocks/`` which proxy GitHub
+(deliveries and check runs) change without any write to this app, so would be served stale.
+
+Cached responses are keyed on path and query string, and expire after
+``PANGEO_FORGE_RESPONSE_CACHE_TTL`` seconds (default 60; set to 0 to disable caching). Every
+response to a cacheable route carries an ``ETag``, so clients which send it back as
+``If-None-Match`` get an empty ``304 Not Modified`` if nothing has changed.
+
+Rather than tracking which cached responses depend on which rows, every successful write request
+(including webhooks) invalidates the whole cache, by incrementing a generation number which is part
+of every key. Writes are rare compared to reads, so this is cheap.
+
+By default, responses are cached in the memory of each web process, and a write only invalidates
+the cache of the process which handled it. Other web processes, and the worker process which runs
+jobs (see ``worker.py``), can't invalidate that memory, so until they expire, responses affected by
+their writes may be stale. To share one cache (and its invalidation) between all processes, set
+``PANGEO_FORGE_RESPONSE_CACHE_REDIS_URL``, which requires ``redis`` to be installed.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from .logging import logger
+
+CACHEABLE_PREFIXES = ("/bakeries/", "/feedstocks/", "/recipe_runs/", "/stats/")
+# Routes under ``CACHEABLE_PREFIXES`` which are requested from GitHub
+UNCACHEABLE_PATTERN = re.compile(r"/feedstocks/[^/]+/(deliveries|commits/)")
+
+
+def get_response_cache_ttl() -> float:
+    return float(os.environ.get("PANGEO_FORGE_RESPONSE_CACHE_TTL", 60))
+
+
+class MemoryBackend:
+    """In-memory stand-in for the (small) subset of the Redis API used by ``ResponseCache``.
+
+    :param max_entries: When full, the least recently used entries are evicted first.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if (entry := self._data.get(key)) is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ex: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + ex if ex is not None else float("inf")
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def incr(self, key: str) -> int:
+        value = int(await self.get(key) or 0) + 1
+        await self.set(key, str(value).encode())
+        return value
+
+
+def get_response_cache_backend() -> Any:
+    if url := os.environ.get("PANGEO_FORGE_RESPONSE_CACHE_REDIS_URL"):
+        import redis.asyncio as redis
+
+        return redis.from_url(url)
+    return MemoryBackend()
+
+
+def is_cacheable(path: str) -> bool:
+    return path.startswith(CACHEABLE_PREFIXES) and not UNCACHEABLE_PATTERN.match(path)
+
+
+def accepts_ndjson(scope) -> bool:
+    # NDJSON responses are streamed, so aren't buffered to be cached
+    accept = next((v for k, v in scope["headers"] if k == b"accept"), b"")
+    return b"application/x-ndjson" in accept
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    candidates = [c.strip().removeprefix("W/") for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+class ResponseCache:
+    """Stores the status, headers and body of responses, along with their ``ETag``.
+
+    :param backend: A ``MemoryBackend``, or a ``redis.asyncio.Redis`` client.
+    """
+
+    def __init__(self, backend: Any = None):
+        self.backend = backend or get_response_cache_backend()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def _key(self, path: str, query: str) -> str:
+        generation = int(await self.backend.get("response-cache:generation") or 0)
+        return f"response-cache:{generation}:{path}?{query}"
+
+    async def get(self, path: str, query: str) -> Optional[dict]:
+        cached = await self.backend.get(await self._key(path, query))
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(cached)
+
+    async def set(self, path: str, query: str, response: dict) -> None:
+        key = await self._key(path, query)
+        # Redis only accepts a whole (and positive) number of seconds
+        ttl = max(math.ceil(get_response_cache_ttl()), 1)
+        await self.backend.set(key, json.dumps(response).encode(), ex=ttl)
+
+    async def invalidate(self) -> None:
+        """Make every response cached so far stale. Errors are logged, rather than raised, so that
+        they don't fail the write which triggered the invalidation (after it was committed)."""
+
+        self.invalidations += 1
+        try:
+            await self.backend.incr("response-cache:generation")
+        except Exception as e:
+            logger.error(f"Failed to invalidate response cache: {e!r}")
+
+    def stats(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses, invalidations=self.invalidations)
+
+    def clear(self) -> None:
+        """Reset the counters, and forget every response cached in this process's memory. (To
+        discard the responses cached in Redis, use ``invalidate``.)"""
+
+        if isinstance(self.backend, MemoryBackend):
+            self.backend = MemoryBackend(self.backend.max_entries)
+        self.hits = self.misses = self.invalidations = 0
+
+
+response_cache = ResponseCache()
+
+
+class ResponseCacheMiddleware:
+    """ASGI middleware which serves GET requests for cacheable paths (see ``is_cacheable``) from
+    ``cache``, and invalidates it after every successful request with any other method."""
+
+    def __init__(self, app, cache: ResponseCache = response_cache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or get_response_cache_ttl() <= 0:
+            return await self.app(scope, receive, send)
+        if scope["method"] == "GET":
+            if is_cacheable(scope["path"]) and not accepts_ndjson(scope):
+                return await self.get(scope, receive, send)
+            return await self.app(scope, receive, send)
+        if scope["method"] in ("HEAD", "OPTIONS"):
+            return await self.app(scope, receive, send)
+
+        async def send_and_invalidate(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                # Before responding, so the client can't read the stale data it just replaced.
+                await self.cache.invalidate()
+            await send(message)
+
+        await self.app(scope, receive, send_and_invalidate)
+
+    async def get(self, scope, receive, send):
+        path, query = scope["path"], scope["query_string"].decode("latin-1")
+        if_none_match = next(
+            (v.decode("latin-1") for k, v in scope["headers"] if k == b"if-none-match"), None
+        )
+        try:
+            cached = await self.cache.get(path, query)
+        except Exception as e:
+            logger.error(f"Failed to read response cache: {e!r}")
+            cached = None
+
+        if cached is None:
+            start, body = None, b""
+
+            async def buffer(message):
+                nonlocal start, body
+                if message["type"] == "http.response.start":
+                    start = message
+                else:
+                    body += message.get("body", b"")
+
+            await self.app(scope, receive, buffer)
+            if start["status"] != 200:
+                await send(start)
+                return await send({"type": "http.response.body", "body": body})
+            headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in start["headers"]]
+            cached = dict(headers=headers, body=body.decode("latin-1"), etag=make_etag(body))
+            try:
+                await self.cache.set(path, query, cached)
+            except Exception as e:
+                logger.error(f"Failed to write response cache: {e!r}")
+            x_cache = "miss"
+        else:
+            x_cache = "hit"
+
+        etag = cached["etag"]
+        headers = [(b"etag", etag.encode()), (b"x-cache", x_cache.encode())]
+        if if_none_match and etag_matches(etag, if_none_match):
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            return await send({"type": "http.response.body", "body": b""})
+        headers += [(k.encode("latin-1"), v.encode("latin-1")) for k, v in cached["headers"]]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": cached["body"].encode("latin-1")})
@@ -1,17 +1,26 @@
+import asyncio
 import json
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional
 
 import yaml  # type: ignore
 from pydantic import BaseModel, Extra, Field, SecretStr
 
+from .logging import logger
+
 GCP_PROJECT = "pangeo-forge-4967"
 root = Path(__file__).resolve().parent.parent
 
 
 class FastAPIConfig(BaseModel):
     PANGEO_FORGE_API_KEY: str
+    # Keys accepted in addition to ``PANGEO_FORGE_API_KEY``. During key rotation, the new key is
+    # set as ``PANGEO_FORGE_API_KEY`` and the old one listed here until all clients have migrated.
+    PANGEO_FORGE_ADDITIONAL_API_KEYS: list[str] = []
+
+    def active_api_keys(self) -> list[str]:
+        return [self.PANGEO_FORGE_API_KEY, *self.PANGEO_FORGE_ADDITIONAL_API_KEYS]
 
 
 class GitHubAppConfig(BaseModel):
@@ -152,7 +161,49 @@ def get_fastapi_config() -> FastAPIConfig:
     return FastAPIConfig(**kw["fastapi"])
 
 
-def get_config() -> Config:
+def get_bakery_config_paths() -> list[str]:
+    """Paths to the public bakery config files for the current deployment."""
+
+    bakeries_dir = get_bakeries_dir()
+    return [
+        f"{bakeries_dir}/{p}"
+        for p in os.listdir(bakeries_dir)
+        if p.split(".")[1] == os.environ.get("PANGEO_FORGE_DEPLOYMENT")
+    ]
+
+
+def stat_fingerprint(paths: list[str]) -> tuple:
+    """A cheap summary of the on-disk state of ``paths``. If any of these files is edited, replaced
+    (e.g. decrypted in place by ``sops -d -i``), added, or removed, the fingerprint changes. Only
+    ``os.stat`` is called here; no files are opened or parsed.
+    """
+
+    fingerprint = []
+    for p in sorted(paths):
+        st = os.stat(p)
+        fingerprint.append((p, st.st_ino, st.st_mtime_ns, st.st_size))
+    return tuple(fingerprint)
+
+
+def get_config_fingerprint() -> tuple:
+    """Fingerprint of every file which ``load_config`` reads."""
+
+    paths = [str(get_app_config_path()), str(root / "dataflow-container-image.txt")]
+    paths += get_bakery_config_paths()
+    paths += [f"{get_secrets_dir()}/{p}" for p in get_secret_bakery_args_paths()]
+    return stat_fingerprint(paths)
+
+
+def get_app_config_fingerprint() -> tuple:
+    """Fingerprint of the file which ``get_fastapi_config`` reads."""
+
+    return stat_fingerprint([str(get_app_config_path())])
+
+
+def load_config() -> Config:
+    """Read and parse the full app + bakery config from disk. Most callers should use the cached
+    ``get_config`` instead."""
+
     # bakeries public config files are organized like this
     #   ```
     #   ├── bakeries
@@ -166,16 +217,10 @@ def get_config() -> Config:
     # storage is a different location from production storage (which it ideally should be).
 
     kw = get_app_config_kws()
-    bakeries_dir = get_bakeries_dir()
-    bakery_config_paths = [
-        p
-        for p in os.listdir(bakeries_dir)
-        if p.split(".")[1] == os.environ.get("PANGEO_FORGE_DEPLOYMENT")
-    ]
     bakery_kws = {}
-    for p in bakery_config_paths:
-        with open(f"{bakeries_dir}/{p}") as f:
-            bakery_kws[p.split(".")[0]] = yaml.safe_load(f)
+    for p in get_bakery_config_paths():
+        with open(p) as f:
+            bakery_kws[os.path.basename(p).split(".")[0]] = yaml.safe_load(f)
 
     for p in get_secret_bakery_args_paths():
         bakery_name = p.split(".")[1]
@@ -192,3 +237,62 @@ def get_config() -> Config:
     bakeries = {k: Bakery(**v) for k, v in bakery_kws.items()}
 
     return Config(**kw, bakeries=bakeries)
+
+
+# Config cache ------------------------------------------------------------------------------------
+# ``get_config`` is called several times while handling each webhook, so rather than re-reading
+# and re-parsing every YAML file each time, we parse once and hold the result in memory. The cache
+# is invalidated explicitly (``clear_config_cache``), or by ``maybe_reload_config`` if the
+# fingerprint of the files on disk has changed, which ``watch_config`` can check periodically.
+
+_config_cache: dict[str, Any] = {}
+
+
+def get_config() -> Config:
+    """Get the app + bakery config, loading it from disk only if it is not already cached. The
+    returned object is shared, so callers which need to modify it must make a copy first."""
+
+    if "config" not in _config_cache:
+        reload_config()
+    return _config_cache["config"]
+
+
+def reload_config() -> Config:
+    """Unconditionally (re-)load the config from disk and replace the cached copy."""
+
+    # Take the fingerprint *before* reading, so that if a file changes mid-load, the next call to
+    # ``maybe_reload_config`` will see a mismatch and reload again.
+    fingerprint = get_config_fingerprint()
+    config = load_config()
+    _config_cache.update(config=config, fingerprint=fingerprint)
+    return config
+
+
+def clear_config_cache() -> None:
+    """Drop the cached config, so it is re-read from disk on the next call to ``get_config``."""
+
+    _config_cache.clear()
+
+
+def maybe_reload_config() -> bool:
+    """Reload the config if the files it was loaded from have changed. Returns ``True`` if the
+    config was reloaded."""
+
+    if "config" in _config_cache and _config_cache["fingerprint"] == get_config_fingerprint():
+        return False
+    reload_config()
+    return True
+
+
+async def watch_config(interval: float) -> None:
+    """Check every ``interval`` seconds whether the config files have changed, and if so, reload
+    them. Intended to be run as a long-lived task alongside the app."""
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if maybe_reload_config():
+                logger.info("Config files changed on disk; reloaded config.")
+        except Exception:
+            # Keep serving the last good config if e.g. a file is mid-edit and fails to parse.
+            logger.exception("Failed to reload config.")
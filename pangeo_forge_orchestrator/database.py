@@ -1,7 +1,13 @@
 import os
+from datetime import datetime, timezone
+from typing import Any, TypeVar
 
-from sqlalchemy.pool import NullPool
-from sqlmodel import Session, SQLModel, create_engine  # noqa: F401
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session as _Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+from sqlmodel import Session, SQLModel, create_engine, select  # noqa: F401
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 
 def get_database_url_from_env():
@@ -27,12 +33,62 @@ if database_url.startswith("postgresql:"):
     connect_args = dict(options="-c timezone=utc")
 
 
-# Temporarily using the NullPool here to workaround error being raised in tests:
-# `sqlalchemy.exc.TimeoutError: QueuePool limit of size 5 overflow 10 reached, connection timed out`
-# ...for which I am not able to find the "real" solution for. NullPool comes with a performance
-# cost, but at the moment we are dealing with sufficiently small request volume that it shouldn't be
-# noticable in production.
-engine = create_engine(database_url, echo=False, connect_args=connect_args, poolclass=NullPool)
+def get_async_database_url(database_url: str) -> str:
+    """Swap the sync drivers used by ``engine`` for their asyncio counterparts."""
+
+    if database_url.startswith("sqlite:"):
+        return database_url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if database_url.startswith("postgresql:"):
+        return database_url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    return database_url  # pragma: no cover
+
+
+def get_pool_kwargs_from_env(poolclass=QueuePool) -> dict:
+    """Connection pool settings for ``engine``, each of which can be tuned per deployment via env
+    var. Note that each gunicorn worker has its own pool, so the total number of connections the
+    app can open is ``n_workers * (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW)``, which must stay
+    below the connection limit of the database plan.
+    """
+
+    return dict(
+        poolclass=poolclass,
+        # Connections kept open, and reused across requests, after they are first needed.
+        pool_size=int(os.environ.get("DATABASE_POOL_SIZE", 5)),
+        # Additional connections opened (and closed again once returned) during bursts.
+        max_overflow=int(os.environ.get("DATABASE_MAX_OVERFLOW", 10)),
+        # Seconds to wait for a connection when the pool and overflow are all in use.
+        pool_timeout=float(os.environ.get("DATABASE_POOL_TIMEOUT", 30)),
+        # Seconds after which a connection is replaced, to stay ahead of server-side idle timeouts.
+        pool_recycle=int(os.environ.get("DATABASE_POOL_RECYCLE", 30 * 60)),
+        # Test connections with a lightweight ping on checkout, so dropped connections (e.g. after a
+        # database restart or failover) are replaced transparently, rather than failing a request.
+        pool_pre_ping=os.environ.get("DATABASE_POOL_PRE_PING", "true").lower() in ("1", "true"),
+    )
+
+
+engine = create_engine(
+    database_url,
+    echo=False,
+    connect_args=connect_args,
+    **get_pool_kwargs_from_env(),
+)
+
+
+# The async engine shares ``engine``'s database, for use by routes which run on the event loop
+# (i.e. the GitHub App routes and their background tasks), where blocking database calls would
+# otherwise stall every other request handled by the same worker.
+async_database_url = get_async_database_url(database_url)
+if async_database_url.startswith("sqlite+aiosqlite:"):
+    # aiosqlite connections are bound to the event loop they were opened on, and sqlite connections
+    # are cheap anyway, so don't pool them. (The test suite runs a new event loop for each test.)
+    async_engine = create_async_engine(async_database_url, echo=False, poolclass=NullPool)
+else:
+    async_engine = create_async_engine(
+        async_database_url,
+        echo=False,
+        connect_args=dict(server_settings={"timezone": "utc"}),
+        **get_pool_kwargs_from_env(poolclass=AsyncAdaptedQueuePool),
+    )
 
 
 def get_session():
@@ -40,6 +96,91 @@ def get_session():
         yield session
 
 
+async def get_async_session():
+    # Without ``expire_on_commit=False``, accessing attributes of a model after committing it would
+    # trigger an implicit (and therefore, under asyncio, unsupported) refresh from the database.
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+TableModel = TypeVar("TableModel", bound=SQLModel)
+
+
+def as_naive_utc(value: Any) -> Any:
+    """Timestamps are stored as naive UTC (the columns are ``TIMESTAMP WITHOUT TIME ZONE``), and
+    asyncpg refuses to write tz-aware datetimes to them, so convert any tz-aware ``value``. Other
+    values are returned unchanged."""
+
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def normalize_datetimes(model: SQLModel) -> SQLModel:
+    """Convert the tz-aware datetime fields of ``model`` to naive UTC, in place."""
+
+    for name in model.__fields__:
+        value = getattr(model, name, None)
+        if (naive := as_naive_utc(value)) is not value:
+            setattr(model, name, naive)
+    return model
+
+
+@event.listens_for(_Session, "before_flush")
+def normalize_flushed_datetimes(session, flush_context, instances):
+    # Applies to every ORM write, sync or async (whose sessions wrap a sync ``Session``), e.g. of
+    # models built ``from_orm`` request bodies or GitHub timestamps, which may carry an offset.
+    for model in (*session.new, *session.dirty):
+        if isinstance(model, SQLModel):
+            normalize_datetimes(model)
+
+
+async def bulk_create(
+    db_session: AsyncSession,
+    table: type[TableModel],
+    rows: list[TableModel],
+    chunk_size: int = 1000,
+) -> list[TableModel]:
+    """Insert ``rows`` (instances of the table model ``table``) in a single transaction, and return
+    (new, detached) instances of them as stored, with their ``id``s. Either all rows are created, or
+    none of them are.
+
+    On Postgres, each ``chunk_size`` rows are inserted by a single ``INSERT ... RETURNING``
+    statement, rather than one round trip per row. (Chunking keeps each statement within the limit
+    on bind parameters.) SQLAlchemy 1.4 does not support ``RETURNING`` on SQLite, so there the rows
+    are inserted one at a time (and read back in a single query), which is cheap for an in-process
+    database anyway.
+    """
+
+    if not rows:
+        return []
+    # The ``INSERT ... RETURNING`` below bypasses the ORM, and so `normalize_flushed_datetimes`.
+    rows = [normalize_datetimes(row) for row in rows]  # type: ignore
+    try:
+        if db_session.bind.dialect.full_returning:  # type: ignore
+            created = []
+            for i in range(0, len(rows), chunk_size):
+                values = [row.dict(exclude={"id"}) for row in rows[i : i + chunk_size]]
+                statement = insert(table).values(values).returning(*table.__table__.columns)
+                created += [table.from_orm(r) for r in await db_session.execute(statement)]
+        else:
+            db_session.add_all(rows)
+            await db_session.flush()
+            ids = [row.id for row in rows]
+            statement = (
+                select(table)
+                .where(table.id.in_(ids))  # type: ignore
+                .execution_options(populate_existing=True)
+            )
+            stored = {r.id: r for r in (await db_session.exec(statement)).all()}  # type: ignore
+            created = [table.from_orm(stored[id]) for id in ids]
+        await db_session.commit()
+    except Exception:
+        await db_session.rollback()
+        raise
+    return created
+
+
 def maybe_create_db_and_tables():
     # sqlite does not really work with migrations, so here we create the db fresh
     # if we are using sqlite, we are probably in the test environment
@@ -0,0 +1,310 @@
+"""A log of the webhooks received by the GitHub App, from which deliveries can be listed without
+paging through GitHub's API.
+
+Every delivery which passes signature verification is recorded as a row in the ``hookdelivery``
+table once it has been handled, along with the status code it was answered with and how long that
+took. Deliveries handled by a job after being acknowledged are recorded when they're enqueued, and
+their status code is updated once the job has finished (see ``record_job_outcome``). The payload itself is only kept if ``PANGEO_FORGE_RETAIN_HOOK_PAYLOADS`` is set (its hash is
+always kept), because payloads are large, and only needed to replay deliveries (see
+``POST /github/hooks/replay``). Replays are logged too, as redeliveries.
+
+Logged durations are also the acknowledgement latency of deliveries, which is summarized as a
+histogram by ``get_hook_latency``, along with the latency of deliveries handled by jobs after they
+were acknowledged (see ``fast_ack_hooks`` in ``routers/github_app.py``).
+"""
+
+import json
+import math
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pydantic import BaseModel
+from pydantic import Field as PydanticField
+from sqlalchemy import Index, update
+from sqlmodel import Field, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .database import as_naive_utc
+from .jobs import Job, JobStatus
+
+
+class HookDeliveryBase(SQLModel):
+    """A webhook delivery received by the GitHub App. Where they overlap, fields are named as in
+    GitHub's webhook deliveries API.
+
+    :param guid: The ``X-GitHub-Delivery`` header, which GitHub keeps for redeliveries. Not sent
+      with the dataflow events from our Cloud Function.
+    :param event: The ``X-GitHub-Event`` header.
+    :param action: The payload's ``action``, if any.
+    :param installation_id: The GitHub App installation the delivery came from, if any.
+    :param repository_id: The GitHub id of the repository the delivery came from, if any.
+    :param repository: The full name of the repository the delivery came from, if any.
+    :param delivered_at: When the delivery was received.
+    :param status_code: The HTTP status code the delivery was answered with.
+    :param duration: How long the delivery took to handle, in seconds.
+    :param payload_sha256: Hex digest of the payload, as sent.
+    :param redelivery: Whether this is a replay of an earlier delivery.
+    :param job_id: The job which handles the delivery, if it was acknowledged before being handled.
+    """
+
+    guid: Optional[str] = Field(default=None, index=True)
+    event: str
+    action: Optional[str] = None
+    installation_id: Optional[int] = None
+    repository_id: Optional[int] = None
+    repository: Optional[str] = None
+    delivered_at: datetime
+    status_code: int
+    duration: float
+    payload_sha256: str
+    redelivery: bool = False
+    job_id: Optional[int] = Field(default=None, index=True)
+
+
+class HookDelivery(HookDeliveryBase, table=True):
+    """A logged webhook delivery.
+
+    :param payload: The JSON-encoded payload, as parsed, if payloads are being retained.
+    """
+
+    __table_args__ = (Index("ix_hookdelivery_repository__id", "repository", "id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    payload: Optional[str] = None
+
+
+class HookDeliveryRead(HookDeliveryBase):
+    id: int
+
+
+class ReplayRequest(BaseModel):
+    """Which logged deliveries to replay (see ``list_replayable``), and how.
+
+    :param limit: The maximum number of deliveries to replay.
+    :param repeat: How many times to replay each delivery, e.g. to generate load for benchmarking.
+    :param rate: Replays are started at this rate (per second), whether or not earlier replays have
+      finished.
+    :param dry_run: If ``True``, return the deliveries which would be replayed, without replaying.
+    """
+
+    ids: Optional[list[int]] = None
+    since: Optional[datetime] = None
+    failed: bool = False
+    event: Optional[str] = None
+    limit: int = PydanticField(100, ge=1, le=1000)
+    repeat: int = PydanticField(1, ge=1, le=100)
+    rate: float = PydanticField(5, gt=0, le=100)
+    dry_run: bool = False
+
+
+class ReplayResult(BaseModel):
+    delivery_id: int
+    status_code: int
+    duration: float
+
+
+class ReplayResponse(BaseModel):
+    """The deliveries selected for replay, and (unless it was a dry run) the result of each replay,
+    with percentiles of their durations, in seconds."""
+
+    deliveries: list[HookDeliveryRead]
+    results: list[ReplayResult]
+    duration_p50: Optional[float] = None
+    duration_p95: Optional[float] = None
+
+    @classmethod
+    def from_results(cls, selected: list, results: list[ReplayResult]) -> "ReplayResponse":
+        durations = sorted(r.duration for r in results)
+
+        def percentile(p: int) -> float:
+            # nearest rank
+            return durations[math.ceil(p / 100 * len(durations)) - 1]
+
+        return cls(
+            deliveries=selected,
+            results=results,
+            duration_p50=percentile(50) if durations else None,
+            duration_p95=percentile(95) if durations else None,
+        )
+
+
+def retain_hook_payloads() -> bool:
+    return os.environ.get("PANGEO_FORGE_RETAIN_HOOK_PAYLOADS", "false").lower() in ("1", "true")
+
+
+async def record(
+    db_session: AsyncSession,
+    *,
+    guid: Optional[str],
+    event: str,
+    payload: dict,
+    payload_sha256: str,
+    delivered_at: datetime,
+    status_code: int,
+    duration: float,
+    redelivery: bool = False,
+    job_id: Optional[int] = None,
+) -> HookDelivery:
+    """Add a delivery to the log."""
+
+    repository = payload.get("repository") or {}
+    delivery = HookDelivery(
+        guid=guid,
+        event=event,
+        action=payload.get("action"),
+        installation_id=(payload.get("installation") or {}).get("id"),
+        repository_id=repository.get("id"),
+        repository=repository.get("full_name"),
+        delivered_at=delivered_at,
+        status_code=status_code,
+        duration=duration,
+        payload_sha256=payload_sha256,
+        redelivery=redelivery,
+        job_id=job_id,
+        payload=json.dumps(payload) if retain_hook_payloads() else None,
+    )
+    db_session.add(delivery)
+    await db_session.commit()
+    return delivery
+
+
+async def record_job_outcome(db_session: AsyncSession, job_id: int, status_code: int) -> None:
+    """Once the job handling a delivery has finished (or failed for good), update the delivery's
+    ``status_code`` to the one it would have been answered with, had it been handled before it was
+    acknowledged. So that, e.g., deliveries whose job failed are replayed with ``failed``."""
+
+    await db_session.execute(
+        update(HookDelivery)
+        .where(HookDelivery.job_id == job_id)  # type: ignore
+        .values(status_code=status_code)
+    )
+    await db_session.commit()
+
+
+async def list_deliveries(
+    db_session: AsyncSession,
+    limit: int,
+    cursor: Optional[int] = None,
+    repository: Optional[str] = None,
+) -> list[HookDelivery]:
+    """Return up to ``limit`` deliveries, newest first.
+
+    :param cursor: Only return deliveries older than this one (i.e., with a lower id).
+    :param repository: Only return deliveries from the repository with this full name.
+    """
+
+    statement = select(HookDelivery).order_by(HookDelivery.id.desc()).limit(limit)  # type: ignore
+    if cursor is not None:
+        statement = statement.where(HookDelivery.id < cursor)
+    if repository is not None:
+        statement = statement.where(HookDelivery.repository == repository)
+    return (await db_session.exec(statement)).all()
+
+
+async def list_replayable(
+    db_session: AsyncSession,
+    limit: int,
+    ids: Optional[list[int]] = None,
+    since: Optional[datetime] = None,
+    failed: bool = False,
+    event: Optional[str] = None,
+) -> list[HookDelivery]:
+    """Return up to ``limit`` deliveries with retained payloads, oldest first.
+
+    :param ids: Only return deliveries with these ids.
+    :param since: Only return deliveries received at or after this time.
+    :param failed: Only return deliveries which were answered with an error status.
+    :param event: Only return deliveries of this event.
+    """
+
+    statement = (
+        select(HookDelivery)
+        .where(HookDelivery.payload.isnot(None))  # type: ignore
+        .order_by(HookDelivery.id)
+        .limit(limit)
+    )
+    if ids is not None:
+        statement = statement.where(HookDelivery.id.in_(ids))  # type: ignore
+    if since is not None:
+        statement = statement.where(HookDelivery.delivered_at >= as_naive_utc(since))
+    if failed:
+        statement = statement.where(HookDelivery.status_code >= 400)
+    if event is not None:
+        statement = statement.where(HookDelivery.event == event)
+    return (await db_session.exec(statement)).all()
+
+
+# Upper bounds of latency histogram buckets, in seconds. The last (unbounded) bucket is "+Inf".
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+class LatencyHistogram(BaseModel):
+    """A histogram of latencies, in seconds.
+
+    :param count: The number of latencies observed.
+    :param sum: Their total.
+    :param buckets: The number of latencies less than or equal to each bucket's upper bound (i.e.,
+      cumulative, as Prometheus histograms are), keyed by the upper bound.
+    """
+
+    count: int
+    sum: float
+    buckets: dict[str, int]
+
+    @classmethod
+    def from_latencies(cls, latencies: list[float]) -> "LatencyHistogram":
+        buckets = {f"{le:g}": sum(1 for x in latencies if x <= le) for le in LATENCY_BUCKETS}
+        return cls(
+            count=len(latencies), sum=sum(latencies), buckets=buckets | {"+Inf": len(latencies)}
+        )
+
+
+class HookLatency(BaseModel):
+    """Latency histograms for the stages of handling webhook deliveries received since ``since``.
+
+    :param ack: From receiving a delivery to acknowledging it. For deliveries which are handled
+      before they're acknowledged, this includes handling them.
+    :param queued: From acknowledging a delivery to starting to handle it, for deliveries handled by
+      jobs after they were acknowledged.
+    :param processing: From starting to handle a delivery to finishing (or finally failing), for
+      deliveries handled by jobs after they were acknowledged.
+    """
+
+    since: datetime
+    ack: LatencyHistogram
+    queued: LatencyHistogram
+    processing: LatencyHistogram
+
+
+async def get_hook_latency(
+    db_session: AsyncSession, since: Optional[datetime] = None
+) -> HookLatency:
+    """Return latency histograms for deliveries received since ``since`` (default: an hour ago)."""
+
+    since = as_naive_utc(since) if since else datetime.utcnow() - timedelta(hours=1)
+
+    durations = (
+        await db_session.exec(
+            select(HookDelivery.duration).where(HookDelivery.delivered_at >= since)
+        )
+    ).all()
+    handled = (
+        await db_session.exec(
+            select(Job.created_at, Job.started_at, Job.completed_at).where(
+                Job.task == "handle_hook",
+                Job.created_at >= since,
+                Job.status.in_((JobStatus.completed, JobStatus.failed)),  # type: ignore
+            )
+        )
+    ).all()
+    return HookLatency(
+        since=since,
+        ack=LatencyHistogram.from_latencies(list(durations)),
+        queued=LatencyHistogram.from_latencies(
+            [(started - created).total_seconds() for created, started, _ in handled]
+        ),
+        processing=LatencyHistogram.from_latencies(
+            [(completed - started).total_seconds() for _, started, completed in handled]
+        ),
+    )
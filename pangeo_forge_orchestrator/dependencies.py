@@ -1,2 +1,2 @@
-from .database import get_session  # noqa: F401
+from .database import get_async_session, get_session  # noqa: F401
 from .security import check_authentication_header  # noqa: F401
@@ -0,0 +1,142 @@
+"""Deduplication of webhook deliveries, so that those which are delivered more than once (GitHub
+retries and redeliveries, or dataflow events resent by our Cloud Function) aren't handled twice.
+
+Each delivery which can be identified has an idempotency key: its ``X-GitHub-Delivery`` guid, or
+for dataflow events (which have none), its recipe run id and conclusion. Before a delivery is
+handled, its key is claimed by inserting it into the ``hookidempotencykey`` table, whose primary key
+it is, so only the first of any concurrent duplicates can claim it. Recently claimed keys are also
+kept in memory, so that most duplicates are acknowledged without a database round trip. If handling
+fails, the key is released again, so that the delivery can be retried. (Deliveries handled by a job
+after being acknowledged keep their key while the job may still be retried.) Keys expire after
+``PANGEO_FORGE_HOOK_IDEMPOTENCY_TTL`` seconds (default: 7 days), and are pruned by the worker.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+class HookIdempotencyKey(SQLModel, table=True):
+    """A claimed idempotency key.
+
+    :param key: The idempotency key, as returned by ``get_idempotency_key``.
+    :param claimed_at: When the key was claimed.
+    """
+
+    key: str = Field(primary_key=True)
+    claimed_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+def get_idempotency_ttl() -> timedelta:
+    return timedelta(seconds=float(os.environ.get("PANGEO_FORGE_HOOK_IDEMPOTENCY_TTL", 7 * 86400)))
+
+
+def get_idempotency_key(event: str, guid: Optional[str], payload: dict) -> Optional[str]:
+    """Return the key identifying duplicates of this delivery, or ``None`` if there's none."""
+
+    if event == "dataflow":
+        if payload.get("action") == "completed" and "recipe_run_id" in payload:
+            return f"dataflow:{payload['recipe_run_id']}:{payload.get('conclusion')}"
+        return None
+    return f"github:{guid}" if guid else None
+
+
+class RecentKeys:
+    """The most recently claimed idempotency keys, in memory.
+
+    :param max_entries: When full, the least recently used keys are forgotten first.
+    """
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._claimed_at: OrderedDict[str, float] = OrderedDict()
+        self.hits = 0
+
+    def __contains__(self, key: str) -> bool:
+        claimed_at = self._claimed_at.get(key)
+        if claimed_at is None:
+            return False
+        if time.time() - claimed_at >= get_idempotency_ttl().total_seconds():
+            del self._claimed_at[key]
+            return False
+        self._claimed_at.move_to_end(key)
+        return True
+
+    def add(self, key: str) -> None:
+        self._claimed_at[key] = time.time()
+        self._claimed_at.move_to_end(key)
+        while len(self._claimed_at) > self.max_entries:
+            self._claimed_at.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        self._claimed_at.pop(key, None)
+
+    def clear(self) -> None:
+        self._claimed_at.clear()
+        self.hits = 0
+
+
+recent_keys = RecentKeys()
+
+
+async def claim(db_session: AsyncSession, key: str, remember: bool = True) -> bool:
+    """Claim ``key``, returning ``False`` if it has already been claimed (i.e., the delivery it
+    identifies is a duplicate).
+
+    :param remember: Whether to keep the key in this process's memory, if claimed. Keys which may
+      be released by another process (e.g. a worker running the job which handles the delivery)
+      mustn't be, as they'd still be taken for claimed here after they were released.
+    """
+
+    if key in recent_keys:
+        recent_keys.hits += 1
+        return False
+
+    db_session.add(HookIdempotencyKey(key=key))
+    try:
+        await db_session.commit()
+    except IntegrityError:
+        await db_session.rollback()
+        # The key has been claimed before, but that claim may have expired without being pruned,
+        # in which case we take it over. Conditionally, so only one concurrent duplicate can.
+        now = datetime.utcnow()
+        result = await db_session.execute(
+            update(HookIdempotencyKey)
+            .where(HookIdempotencyKey.key == key)
+            .where(HookIdempotencyKey.claimed_at < now - get_idempotency_ttl())
+            .values(claimed_at=now)
+        )
+        await db_session.commit()
+        if result.rowcount == 0:  # type: ignore
+            # Not remembered, as the process which holds the claim may yet release it.
+            return False
+
+    if remember:
+        recent_keys.add(key)
+    return True
+
+
+async def release(db_session: AsyncSession, key: str) -> None:
+    """Release a claimed ``key``, so that the delivery it identifies can be handled again."""
+
+    recent_keys.discard(key)
+    await db_session.execute(delete(HookIdempotencyKey).where(HookIdempotencyKey.key == key))
+    await db_session.commit()
+
+
+async def prune(db_session: AsyncSession) -> int:
+    """Delete expired keys, returning how many there were."""
+
+    cutoff = datetime.utcnow() - get_idempotency_ttl()
+    result = await db_session.execute(
+        delete(HookIdempotencyKey).where(HookIdempotencyKey.claimed_at < cutoff)
+    )
+    await db_session.commit()
+    return result.rowcount  # type: ignore
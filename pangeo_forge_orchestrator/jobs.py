@@ -0,0 +1,290 @@
+"""A durable queue for background work, such as the tasks triggered by GitHub App webhooks.
+
+Jobs are rows in the ``job`` table. Enqueueing a job commits it to the database before the webhook
+which triggered it is acknowledged, so it survives restarts of the process which received the
+webhook. Jobs are then claimed and run by worker processes (see ``worker.py``). On Postgres, claims
+use ``SELECT ... FOR UPDATE SKIP LOCKED``, so any number of workers can poll the queue concurrently
+without contending for (or double-claiming) the same job. SQLite does not support row locks, so
+there the claim relies on a conditional ``UPDATE`` instead, which is sufficient for tests. A
+claimed job's lease is renewed while it runs, and if it lapses (because the worker died), the job
+is requeued, if it has attempts left.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import Index, and_, func, or_, update
+from sqlmodel import Field, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+class JobStatus(str, Enum):
+    """Categorical choices for ``Job.status``."""
+
+    queued = "queued"
+    in_progress = "in_progress"
+    completed = "completed"
+    failed = "failed"
+
+
+class Job(SQLModel, table=True):
+    """A queued (or previously run) background task.
+
+    :param task: The name of the task function to call.
+    :param args: JSON-encoded list of positional arguments for the task.
+    :param installation_id: The GitHub App installation on behalf of which the task runs.
+    :param bakery_id: The bakery this task deploys to, if any. Used to limit concurrency per bakery.
+    :param status: One of the options defined in ``JobStatus``.
+    :param attempts: How many times this job has been claimed.
+    :param max_attempts: After this many attempts, a failing job is not retried again.
+    :param created_at: When the job was enqueued.
+    :param run_after: The job will not be claimed before this time (used for retry backoff).
+    :param started_at: When the job was most recently claimed.
+    :param heartbeat_at: When the lease of the job's current attempt was last renewed.
+    :param completed_at: When the job completed or (finally) failed.
+    :param error: The error raised by the most recent failed attempt, if any.
+    """
+
+    __table_args__ = (Index("ix_job_status_run_after", "status", "run_after"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    task: str
+    args: str = "[]"
+    installation_id: Optional[int] = None
+    bakery_id: Optional[int] = None
+    status: JobStatus = JobStatus.queued
+    attempts: int = 0
+    max_attempts: int = 3
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    run_after: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+
+def run_jobs_inline() -> bool:
+    """If True, jobs are run by the web process which enqueued them, immediately after responding
+    to the request, rather than by a separate worker process. Inline jobs are not retried. This is
+    convenient for tests and local development, which otherwise require a running worker."""
+
+    return os.environ.get("PANGEO_FORGE_INLINE_JOBS", "false").lower() in ("1", "true")
+
+
+def get_bakery_concurrency() -> int:
+    """The maximum number of jobs which may run concurrently for any one bakery."""
+
+    return int(os.environ.get("PANGEO_FORGE_JOBS_PER_BAKERY", 4))
+
+
+def get_job_lease() -> timedelta:
+    """An in progress job whose lease has not been renewed (see ``renew_lease``) for this long is
+    assumed to have been abandoned (i.e. its worker was killed). Leases are renewed while jobs run,
+    so this doesn't limit how long a job may take."""
+
+    return timedelta(seconds=float(os.environ.get("PANGEO_FORGE_JOB_LEASE", 10 * 60)))
+
+
+def get_lease_renewal_interval() -> float:
+    """Seconds between renewals of a running job's lease."""
+
+    return max(get_job_lease().total_seconds() / 4, 0.1)
+
+
+def backoff(attempts: int, base: float = 30, cap: float = 60 * 60) -> timedelta:
+    """Exponential delay before retrying a job which has failed ``attempts`` times."""
+
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), cap))
+
+
+async def enqueue(
+    db_session: AsyncSession,
+    task: str,
+    args: list[Any],
+    *,
+    installation_id: Optional[int] = None,
+    bakery_id: Optional[int] = None,
+    max_attempts: int = 3,
+) -> Job:
+    job = Job(
+        task=task,
+        args=json.dumps(args),
+        installation_id=installation_id,
+        bakery_id=bakery_id,
+        max_attempts=max_attempts,
+    )
+    db_session.add(job)
+    await db_session.commit()
+    await db_session.refresh(job)
+    return job
+
+
+async def claim(db_session: AsyncSession, job_id: Optional[int] = None) -> Optional[Job]:
+    """Claim the next job which is ready to run, or return None if there are none.
+
+    :param job_id: If given, claim only this specific job (if it's ready to run).
+    """
+
+    now = datetime.utcnow()
+    statement = select(Job).where(Job.status == JobStatus.queued, Job.run_after <= now)
+    if job_id is not None:
+        statement = statement.where(Job.id == job_id)
+    else:
+        busy_bakeries = (
+            select(Job.bakery_id)
+            .where(Job.status == JobStatus.in_progress, Job.bakery_id.isnot(None))  # type: ignore
+            .group_by(Job.bakery_id)
+            .having(func.count() >= get_bakery_concurrency())
+        )
+        statement = statement.where(
+            or_(Job.bakery_id.is_(None), Job.bakery_id.not_in(busy_bakeries))  # type: ignore
+        )
+    statement = statement.order_by(Job.run_after, Job.id).limit(1).with_for_update(skip_locked=True)
+    job = (await db_session.exec(statement)).first()  # type: ignore
+    if job is None:
+        await db_session.commit()  # release the (empty) transaction
+        return None
+
+    result = await db_session.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == JobStatus.queued)  # type: ignore
+        .values(
+            status=JobStatus.in_progress,
+            attempts=Job.attempts + 1,
+            started_at=now,
+            heartbeat_at=now,
+        )
+    )
+    await db_session.commit()
+    if result.rowcount != 1:  # type: ignore
+        return None  # another worker claimed it first
+    await db_session.refresh(job)
+    return job
+
+
+async def complete(db_session: AsyncSession, job: Job) -> None:
+    job.status = JobStatus.completed
+    job.completed_at = datetime.utcnow()
+    job.error = None
+    db_session.add(job)
+    await db_session.commit()
+
+
+async def fail(db_session: AsyncSession, job: Job, error: str, retry: bool = True) -> None:
+    """Record a failed attempt, and requeue the job (after a backoff) if it can be retried."""
+
+    job.error = error
+    if retry and job.attempts < job.max_attempts:
+        job.status = JobStatus.queued
+        job.run_after = datetime.utcnow() + backoff(job.attempts)
+    else:
+        job.status = JobStatus.failed
+        job.completed_at = datetime.utcnow()
+    db_session.add(job)
+    await db_session.commit()
+
+
+async def renew_lease(db_session: AsyncSession, job_id: int) -> None:
+    await db_session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == JobStatus.in_progress)  # type: ignore
+        .values(heartbeat_at=datetime.utcnow())
+    )
+    await db_session.commit()
+
+
+async def release(db_session: AsyncSession, job: Job) -> None:
+    """Return a job to the queue without counting the interrupted attempt."""
+
+    job.status = JobStatus.queued
+    job.attempts -= 1
+    db_session.add(job)
+    await db_session.commit()
+
+
+async def requeue_abandoned(db_session: AsyncSession) -> int:
+    """Make in progress jobs which have outlived their lease available to be claimed again (or mark
+    them as failed, if they are out of attempts). Returns the number of jobs affected."""
+
+    cutoff = datetime.utcnow() - get_job_lease()
+    abandoned = (
+        Job.status == JobStatus.in_progress,
+        or_(
+            Job.heartbeat_at < cutoff,
+            and_(Job.heartbeat_at.is_(None), Job.started_at < cutoff),  # claimed before leases
+        ),
+    )
+    requeued = await db_session.execute(
+        update(Job)
+        .where(*abandoned, Job.attempts < Job.max_attempts)  # type: ignore
+        .values(status=JobStatus.queued, error="Abandoned by worker.")
+    )
+    failed = await db_session.execute(
+        update(Job)
+        .where(*abandoned)  # type: ignore
+        .values(
+            status=JobStatus.failed,
+            error="Abandoned by worker.",
+            completed_at=datetime.utcnow(),
+        )
+    )
+    await db_session.commit()
+    return requeued.rowcount + failed.rowcount  # type: ignore
+
+
+class JobQueueStats(BaseModel):
+    """Summary of the job queue.
+
+    :param counts: Number of jobs in each ``JobStatus``.
+    :param queued_by_task: Number of queued jobs for each task.
+    :param in_progress_by_bakery: Number of in progress jobs for each bakery id.
+    :param oldest_queued_age: Seconds since the oldest queued job was enqueued.
+    :param mean_latency: Mean seconds from enqueue to (most recent) start, for jobs started in the
+      last hour.
+    """
+
+    counts: dict[JobStatus, int]
+    queued_by_task: dict[str, int]
+    in_progress_by_bakery: dict[int, int]
+    oldest_queued_age: Optional[float]
+    mean_latency: Optional[float]
+
+
+async def get_queue_stats(db_session: AsyncSession) -> JobQueueStats:
+    now = datetime.utcnow()
+
+    async def grouped_counts(column, *where) -> dict:
+        statement = select(column, func.count()).where(*where).group_by(column)
+        return {k: v for k, v in (await db_session.exec(statement)).all()}  # type: ignore
+
+    counts = {s: 0 for s in JobStatus} | await grouped_counts(Job.status)
+    queued_by_task = await grouped_counts(Job.task, Job.status == JobStatus.queued)
+    in_progress_by_bakery = await grouped_counts(
+        Job.bakery_id,
+        Job.status == JobStatus.in_progress,
+        Job.bakery_id.isnot(None),  # type: ignore
+    )
+    oldest_queued = (
+        await db_session.exec(
+            select(func.min(Job.created_at)).where(Job.status == JobStatus.queued)  # type: ignore
+        )
+    ).one()
+    recently_started = (
+        await db_session.exec(
+            select(Job.created_at, Job.started_at).where(
+                Job.started_at >= now - timedelta(hours=1)  # type: ignore
+            )
+        )
+    ).all()
+    latencies = [(started - created).total_seconds() for created, started in recently_started]
+    return JobQueueStats(
+        counts=counts,
+        queued_by_task=queued_by_task,
+        in_progress_by_bakery=in_progress_by_bakery,
+        oldest_queued_age=(now - oldest_queued).total_seconds() if oldest_queued else None,
+        mean_latency=sum(latencies) / len(latencies) if latencies else None,
+    )
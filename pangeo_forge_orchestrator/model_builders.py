@@ -1,7 +1,11 @@
+import inspect
 import types
+from collections.abc import Callable
 from dataclasses import dataclass
-from typing import Optional, Union
+from datetime import datetime
+from typing import Any, Literal, Optional, Union
 
+from fastapi import Query
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -18,11 +22,21 @@ class RelationBuilder:
     :param back_populates: The name of the field in the related table to back populate. This field
       name must exist as a ``sqlmodel.Relationship`` attribute of the model referenced in the
       provided ``annotation``.
+    :param load: How the related rows are loaded when reading a single object for an extended
+      response: in the same query (``"joined"``, best for one-to-one relationships) or in one
+      additional query (``"selectin"``). Either way, the number of queries doesn't depend on the
+      number of related rows. This does not change how the relationship is loaded elsewhere,
+      which is lazily, on first access.
+    :param max_items: For one-to-many relationships, if given, extended responses include at most
+      this many related rows (the most recently created, loaded by one additional query), so their
+      size is bounded. They are listed in ascending ``id`` order, as unbounded relations are.
     """
 
     field: str
     annotation: Union[SQLModel, list[str]]
     back_populates: str
+    load: Literal["joined", "selectin"] = "selectin"
+    max_items: Optional[int] = None
 
 
 # Model generator + container -------------------------------------------------------------
@@ -58,6 +72,8 @@ class MultipleModels:
       https://sqlmodel.tiangolo.com/tutorial/fastapi/relationships/#models-with-relationships.
     :param relations: An optional list of ``RelationBuilder``s. If present, used to generate
        ``sqlmodel.Relationship`` attributes on the table class in ``self.make_table_cls``.
+    :param table_args: Optional ``__table_args__`` for the table class, e.g. a tuple of
+      ``sqlalchemy.Index``es. Note that indexes defined here must also be added by a migration.
     """
 
     path: str
@@ -66,11 +82,14 @@ class MultipleModels:
     descriptive_name: str
     extended_response: Optional[SQLModel] = None
     relations: Optional[list[RelationBuilder]] = None
+    table_args: Optional[tuple] = None
 
     def __post_init__(self):
         self.creation: SQLModel = self.make_creator_cls()
         self.table: SQLModel = self.make_table_cls()
         self.update: SQLModel = self.make_updater_cls()
+        self.batch_update: SQLModel = self.make_batch_updater_cls()
+        self.filters: Callable[..., list] = self.make_filters()
 
     @staticmethod
     def make_cls_name(base: type, rename_base_to: str) -> str:
@@ -110,6 +129,15 @@ class MultipleModels:
         attrs = {**defaults, "__annotations__": annotations}
         return type(cls_name, (SQLModel,), attrs)
 
+    def make_batch_updater_cls(self) -> SQLModel:
+        """From the update model, make and return a model for one item in the body of a batch
+        update request. This is the update model, plus a required ``id`` field identifying the row
+        to update, and with the substring ``"Base"`` in the class name replaced by the substring
+        ``"BatchUpdate"``.
+        """
+        cls_name = self.make_cls_name(self.base, "BatchUpdate")
+        return type(cls_name, (self.update,), {"__annotations__": {"id": int}})
+
     def make_table_cls(self) -> SQLModel:
         """From a base model, make and return a table model. As described in
         https://sqlmodel.tiangolo.com/tutorial/fastapi/multiple-models/#the-hero-table-model,
@@ -123,6 +151,8 @@ class MultipleModels:
         attrs = dict(id=Field(default=None, primary_key=True))
         annotations = dict(id=Union[int, None])
         attrs |= dict(__annotations__=annotations)
+        if self.table_args:
+            attrs["__table_args__"] = self.table_args
         if self.relations:
             for r in self.relations:
                 attrs[r.field] = Relationship(back_populates=r.back_populates)
@@ -133,3 +163,71 @@ class MultipleModels:
         return types.new_class(
             cls_name, (self.base,), dict(table=True), lambda ns: ns.update(attrs)
         )
+
+    def make_filters(self) -> Callable[..., list]:
+        """From the base model, make and return a FastAPI dependency which takes query parameters
+        for filtering the table, and returns the corresponding list of SQL ``WHERE`` clauses. For
+        each field of the base model, there is a query parameter of the same name, which (for
+        ``bool`` fields) matches rows with the given value, or (for other fields) may be repeated
+        to match rows with any of the given values. ``datetime`` fields instead get a pair of
+        parameters, ``<field>__gte`` and ``<field>__lt``, which bound a time range.
+        """
+        params = []
+        for name, field in self.base.__fields__.items():
+            type_ = field.outer_type_
+            if type_ is datetime:
+                bounds = [("gte", "at or after"), ("lt", "before")]
+                params += [
+                    inspect.Parameter(
+                        f"{name}__{op}",
+                        inspect.Parameter.KEYWORD_ONLY,
+                        default=Query(
+                            None, description=f"Only rows with `{name}` {desc} this time"
+                        ),
+                        annotation=Optional[datetime],
+                    )
+                    for op, desc in bounds
+                ]
+            elif type_ is bool:
+                params.append(
+                    inspect.Parameter(
+                        name,
+                        inspect.Parameter.KEYWORD_ONLY,
+                        default=Query(None, description=f"Only rows with this `{name}`"),
+                        annotation=Optional[bool],
+                    )
+                )
+            else:
+                params.append(
+                    inspect.Parameter(
+                        name,
+                        inspect.Parameter.KEYWORD_ONLY,
+                        default=Query(None, description=f"Only rows with (any of) this `{name}`"),
+                        annotation=Optional[list[type_]],  # type: ignore
+                    )
+                )
+
+        def filters(**query: Any) -> list:
+            # Not imported with this module, because ``database`` needs ``DATABASE_URL`` to import.
+            from .database import as_naive_utc
+
+            clauses = []
+            for key, value in query.items():
+                if value is None:
+                    continue
+                name, _, op = key.partition("__")
+                column = getattr(self.table, name)
+                value = as_naive_utc(value)
+                if op == "gte":
+                    clauses.append(column >= value)
+                elif op == "lt":
+                    clauses.append(column < value)
+                elif isinstance(value, list):
+                    clauses.append(column.in_(value))
+                else:
+                    clauses.append(column == value)
+            return clauses
+
+        # FastAPI reads the query parameters of a dependency from its signature
+        filters.__signature__ = inspect.Signature(params)  # type: ignore
+        return filters
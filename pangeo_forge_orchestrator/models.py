@@ -2,6 +2,7 @@ from datetime import datetime
 from enum import Enum
 from typing import Optional
 
+from sqlalchemy import Index, UniqueConstraint
 from sqlmodel import Field, SQLModel
 
 from .model_builders import MultipleModels, RelationBuilder
@@ -18,7 +19,7 @@ class BakeryBase(SQLModel):
     """
 
     region: str  # TODO: Categorical constraint.
-    name: str  # TODO: Unique constraint.
+    name: str
     description: str
 
 
@@ -169,6 +170,10 @@ class RecipeRunReadWithBakeryAndFeedstock(RecipeRunRead):
 
 # Mutliple models -----------------------------------------------------------------------
 
+# Feedstocks and bakeries can have thousands of recipe runs, so their extended responses only
+# include the most recent; the rest can be paged through at `/recipe_runs/?feedstock_id=...` etc.
+MAX_NESTED_RECIPE_RUNS = 100
+
 
 bakery_models = MultipleModels(
     path="/bakeries/",
@@ -176,11 +181,14 @@ bakery_models = MultipleModels(
     base=BakeryBase,
     response=BakeryRead,
     extended_response=BakeryReadWithRecipeRuns,
+    # Bakeries are looked up by name (from a feedstock's `meta.yaml`) on every deployment
+    table_args=(UniqueConstraint("name", name="uq_bakery_name"),),
     relations=[
         RelationBuilder(
             field="recipe_runs",
             annotation=list["RecipeRun"],  # type: ignore # noqa: F821
             back_populates="bakery",
+            max_items=MAX_NESTED_RECIPE_RUNS,
         ),
     ],
 )
@@ -190,11 +198,14 @@ feedstock_models = MultipleModels(
     base=FeedstockBase,
     response=FeedstockRead,
     extended_response=FeedstockReadWithRecipeRuns,
+    # Feedstocks are looked up by spec (i.e. repo name) on every deployment
+    table_args=(UniqueConstraint("spec", name="uq_feedstock_spec"),),
     relations=[
         RelationBuilder(
             field="recipe_runs",
             annotation=list["RecipeRun"],  # type: ignore # noqa: F821
             back_populates="feedstock",
+            max_items=MAX_NESTED_RECIPE_RUNS,
         ),
     ],
 )
@@ -204,16 +215,33 @@ recipe_run_models = MultipleModels(
     base=RecipeRunBase,
     response=RecipeRunRead,
     extended_response=RecipeRunReadWithBakeryAndFeedstock,
+    # Support the filters on `/recipe_runs/` which the dashboard uses most (the first of which
+    # also serves `/feedstocks/{id}/datasets`), and the `/run` slash command lookup
+    table_args=(
+        Index(
+            "ix_reciperun_feedstock_id_status_conclusion_is_test",
+            "feedstock_id",
+            "status",
+            "conclusion",
+            "is_test",
+        ),
+        Index("ix_reciperun_bakery_id_status", "bakery_id", "status"),
+        Index("ix_reciperun_started_at", "started_at"),
+        Index("ix_reciperun_completed_at", "completed_at"),
+        Index("ix_reciperun_recipe_id_head_sha", "recipe_id", "head_sha"),
+    ),
     relations=[
         RelationBuilder(
             field="bakery",
             annotation=bakery_models.table,
             back_populates="recipe_runs",
+            load="joined",
         ),
         RelationBuilder(
             field="feedstock",
             annotation=feedstock_models.table,
             back_populates="recipe_runs",
+            load="joined",
         ),
     ],
 )
@@ -1,30 +1,44 @@
+import asyncio
 import hashlib
 import hmac
+import inspect
 import json
 import os
 import subprocess
 import tempfile
 import time
-from datetime import datetime
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from enum import Enum
 from textwrap import dedent
 from typing import Any, Optional
 from urllib.parse import parse_qs, urlparse
 
 import aiohttp
 import jwt
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from gidgethub import BadRequest, GitHubBroken, RateLimitExceeded
 from gidgethub.aiohttp import GitHubAPI
-from gidgethub.apps import get_installation_access_token
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
-from sqlmodel import Session, SQLModel, select
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from .. import deliveries, idempotency, jobs
+from ..cache import response_cache
 from ..config import get_config
-from ..dependencies import get_session as get_database_session
+from ..database import async_engine, bulk_create
+from ..dependencies import check_authentication_header, get_async_session
 from ..http import http_session
 from ..logging import logger
 from ..models import MODELS
 
 ACCEPT = "application/vnd.github+json"
+NDJSON = "application/x-ndjson"
 FRONTEND_DASHBOARD_URL = "https://pangeo-forge.org/dashboard"
 DEFAULT_BACKEND_NETLOC = "api.pangeo-forge.org"
 
@@ -52,38 +66,284 @@ def html_url_to_repo_full_name(html_url: str) -> str:
     return html_url.replace("https://github.com/", "")
 
 
+class AppJWTCache:
+    """GitHub App JWTs are valid for 10 minutes, and signing one is an RSA private key operation,
+    so rather than signing a new JWT for every request to GitHub, we reuse each one for most of its
+    lifetime. The parsed private key is also kept, so the PEM is only deserialized once.
+
+    :param lifetime: Seconds until a newly signed JWT expires. GitHub's maximum is 10 minutes.
+    :param reuse_for: Seconds for which a signed JWT is reused. Must be sufficiently less than
+      ``lifetime`` that a JWT returned at the end of this period won't expire before it's used.
+    """
+
+    def __init__(self, lifetime: int = 10 * 60, reuse_for: int = 8 * 60):
+        self.lifetime = lifetime
+        self.reuse_for = reuse_for
+        self._private_key: Optional[tuple[str, Any]] = None  # (pem, parsed key)
+        self._jwt: Optional[tuple[int, int, str]] = None  # (app id, issued at, encoded jwt)
+        self.hits = 0
+        self.signs = 0
+
+    def _get_private_key(self, pem: str) -> Any:
+        if self._private_key is None or self._private_key[0] != pem:
+            parsed = load_pem_private_key(bytes(pem, encoding="utf-8"), password=None)
+            self._private_key = (pem, parsed)
+        return self._private_key[1]
+
+    def get(self) -> str:
+        github_app = get_config().github_app
+        now = int(time.time())
+        if self._jwt:
+            app_id, issued_at, encoded = self._jwt
+            if app_id == github_app.id and now - issued_at < self.reuse_for:
+                self.hits += 1
+                return encoded
+
+        payload = {
+            "iat": now,
+            "exp": now + self.lifetime,
+            "iss": github_app.id,
+        }
+        private_key = self._get_private_key(github_app.private_key)
+        encoded = jwt.encode(payload, private_key, algorithm="RS256")
+        self._jwt = (github_app.id, now, encoded)
+        self.signs += 1
+        return encoded
+
+    def stats(self) -> dict:
+        return dict(hits=self.hits, signs=self.signs)
+
+    def clear(self):
+        self._private_key = None
+        self._jwt = None
+        self.hits = self.signs = 0
+
+
+app_jwts = AppJWTCache()
+
+
 def get_jwt() -> str:
     """Adapted from https://github.com/Mariatta/gh_app_demo"""
 
-    github_app = get_config().github_app
-    payload = {
-        "iat": int(time.time()),
-        "exp": int(time.time()) + (10 * 60),
-        "iss": github_app.id,
-    }
-    return jwt.encode(payload, github_app.private_key, algorithm="RS256")
-
-
-async def get_access_token(gh: GitHubAPI) -> str:
-    github_app = get_config().github_app
-    async for installation in gh.getiter("/app/installations", jwt=get_jwt(), accept=ACCEPT):
-        installation_id = installation["id"]
-        # Even if installed on multiple repos within the account, I believe installations are
-        # one per account (organization or user), so as long as apps are only ever deployed in
-        # the account they were created in, there should only ever be one installation_id per app.
-        # Currently, this assumption holds, because named deployments are made from private apps
-        # owned by the pangeo-forge org, and only deployed in pangeo-forge, and dev apps are made
-        # by developers, and only deployed in on repos they own. If we were to change this
-        # paradigm, the assumption that the first installation returned by this `getiter` call is
-        # the only installation (and therefore the one we want), would change.
-        break
-    token_response = await get_installation_access_token(
-        gh,
-        installation_id=installation_id,
-        app_id=github_app.id,
-        private_key=github_app.private_key,
+    return app_jwts.get()
+
+
+# Installation access tokens ----------------------------------------------------------------------
+
+
+@dataclass
+class CachedToken:
+    token: str
+    expires_at: float  # unix timestamp
+
+
+async def mint_installation_token(gh: GitHubAPI, installation_id: int) -> dict:
+    """Ask GitHub for a new installation access token. Returns the full response, which includes
+    both the ``token`` and its ``expires_at`` timestamp."""
+
+    # Equivalent to `gidgethub.apps.get_installation_access_token`, except that it uses our cached
+    # JWT, rather than signing a new one.
+    return await gh.post(
+        f"/app/installations/{installation_id}/access_tokens",
+        data=b"",
+        jwt=get_jwt(),
+        accept=ACCEPT,
     )
-    return token_response["token"]
+
+
+class InstallationTokenCache:
+    """Installation access tokens are valid for an hour, so rather than minting a new one every
+    time we talk to GitHub, we hold onto each token until shortly before it expires. When a token
+    enters its ``refresh_window``, it is still returned, but a replacement is minted in the
+    background, so that callers (almost) never wait on GitHub for a token. Concurrent requests for
+    the same installation's token share a single in-flight mint.
+
+    :param expiry_margin: Cached tokens which expire within this many seconds are never returned.
+    :param refresh_window: Cached tokens which expire within this many seconds are refreshed in the
+      background.
+    """
+
+    def __init__(self, expiry_margin: float = 60, refresh_window: float = 5 * 60):
+        self.expiry_margin = expiry_margin
+        self.refresh_window = refresh_window
+        self._tokens: dict[int, CachedToken] = {}
+        self._pending: dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.mints = 0
+
+    async def get(self, gh: GitHubAPI, installation_id: int) -> str:
+        now = time.time()
+        cached = self._tokens.get(installation_id)
+        if cached and cached.expires_at - now > self.expiry_margin:
+            self.hits += 1
+            if cached.expires_at - now <= self.refresh_window:
+                self._refresh(gh, installation_id)
+            return cached.token
+
+        self.misses += 1
+        # Shielded, so that if this caller is cancelled, the mint still completes for other callers.
+        cached = await asyncio.shield(self._refresh(gh, installation_id))
+        return cached.token
+
+    def _refresh(self, gh: GitHubAPI, installation_id: int) -> asyncio.Future:
+        if (pending := self._pending.get(installation_id)) is None:
+            pending = asyncio.ensure_future(self._mint(gh, installation_id))
+            pending.add_done_callback(self._log_failure)
+            self._pending[installation_id] = pending
+        return pending
+
+    async def _mint(self, gh: GitHubAPI, installation_id: int) -> CachedToken:
+        try:
+            response = await mint_installation_token(gh, installation_id)
+            if expires_at := response.get("expires_at"):
+                expiry = datetime.strptime(expires_at, "%Y-%m-%dT%H:%M:%SZ")
+                expiry_timestamp = expiry.replace(tzinfo=timezone.utc).timestamp()
+            else:
+                expiry_timestamp = time.time() + 60 * 60
+            cached = CachedToken(token=response["token"], expires_at=expiry_timestamp)
+            self._tokens[installation_id] = cached
+            self.mints += 1
+            return cached
+        finally:
+            del self._pending[installation_id]
+
+    @staticmethod
+    def _log_failure(pending: asyncio.Future):
+        # Background refreshes have no caller awaiting them, so make sure failures are visible.
+        if not pending.cancelled() and (e := pending.exception()):
+            logger.error(f"Failed to mint installation access token: {e!r}")
+
+    def stats(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses, mints=self.mints, cached=len(self._tokens))
+
+    def evict(self, installation_id: int):
+        self._tokens.pop(installation_id, None)
+
+    def clear(self):
+        self._tokens.clear()
+        self.hits = self.misses = self.mints = 0
+
+
+installation_tokens = InstallationTokenCache()
+
+
+class InstallationIndex:
+    """Remembers which GitHub App installations exist, and which installation each repo belongs
+    to, so that minting an installation access token doesn't require first paging through
+    ``/app/installations``. Kept current by ``installation`` and ``installation_repositories``
+    webhook events (see ``handle_installation_event``).
+
+    Installations are one per account (organization or user), so as long as an app is only
+    deployed in the account it was created in, there is only one installation, and it is the one
+    we want. This holds for named deployments (private apps owned by, and installed in, the
+    pangeo-forge org) and dev apps (installed only on repos owned by the developer). For apps with
+    more than one installation, the installation for a given repo is looked up (and remembered)
+    the first time a token for that repo is requested, and a repo must be given, because any one
+    installation could be for the wrong account.
+    """
+
+    def __init__(self):
+        self._installation_ids: Optional[list[int]] = None
+        self._repos: dict[str, int] = {}  # lowercase repo full name -> installation id
+        self.lookups = 0
+
+    async def get_installation_ids(self, gh: GitHubAPI) -> list[int]:
+        if self._installation_ids is None:
+            self.lookups += 1
+            self._installation_ids = [
+                installation["id"]
+                async for installation in gh.getiter(
+                    "/app/installations", jwt=get_jwt(), accept=ACCEPT
+                )
+            ]
+        return self._installation_ids
+
+    async def get_installation_id(self, gh: GitHubAPI, repo_full_name: Optional[str] = None) -> int:
+        if repo_full_name and (installation_id := self._repos.get(repo_full_name.lower())):
+            return installation_id
+
+        installation_ids = await self.get_installation_ids(gh)
+        if len(installation_ids) == 1:
+            return installation_ids[0]
+        if not repo_full_name:
+            raise ValueError(
+                f"GitHub App has {len(installation_ids)} installations, so a repo is needed to "
+                "choose which one to use."
+            )
+
+        self.lookups += 1
+        response = await gh.getitem(
+            f"/repos/{repo_full_name}/installation", jwt=get_jwt(), accept=ACCEPT
+        )
+        self.add_repos(response["id"], [repo_full_name])
+        return response["id"]
+
+    def add_installation(self, installation_id: int):
+        if self._installation_ids is not None and installation_id not in self._installation_ids:
+            self._installation_ids.append(installation_id)
+
+    def remove_installation(self, installation_id: int):
+        if self._installation_ids is not None and installation_id in self._installation_ids:
+            self._installation_ids.remove(installation_id)
+        self._repos = {k: v for k, v in self._repos.items() if v != installation_id}
+
+    def add_repos(self, installation_id: int, repo_full_names: list[str]):
+        self._repos |= {name.lower(): installation_id for name in repo_full_names}
+
+    def remove_repos(self, repo_full_names: list[str]):
+        for name in repo_full_names:
+            self._repos.pop(name.lower(), None)
+
+    def clear(self):
+        self._installation_ids = None
+        self._repos.clear()
+        self.lookups = 0
+
+
+app_installations = InstallationIndex()
+
+
+async def get_access_token(
+    gh: GitHubAPI,
+    repo_full_name: Optional[str] = None,
+    installation_id: Optional[int] = None,
+) -> str:
+    """Get an installation access token. If known (e.g. from a webhook payload), pass the
+    ``installation_id``. Otherwise, it's looked up by ``repo_full_name``, which may only be omitted
+    if the app has a single installation (see ``InstallationIndex``)."""
+
+    if installation_id is None:
+        installation_id = await app_installations.get_installation_id(gh, repo_full_name)
+    return await installation_tokens.get(gh, installation_id)
+
+
+class AppWebhookURLCache:
+    """The GitHub App's webhook url is needed for every Dataflow job name and dashboard link, but
+    almost never changes, so we hold onto it for ``ttl`` seconds, rather than asking GitHub for it
+    each time. The cache is also cleared by ``meta`` webhook events (i.e., hook deletion).
+    """
+
+    def __init__(self, ttl: float = 60 * 60):
+        self.ttl = ttl
+        self._url: Optional[tuple[float, str]] = None  # (fetched at, url)
+        self.fetches = 0
+
+    async def get(self, gh: GitHubAPI) -> str:
+        now = time.monotonic()
+        if self._url and now - self._url[0] < self.ttl:
+            return self._url[1]
+        response = await gh.getitem("/app/hook/config", jwt=get_jwt(), accept=ACCEPT)
+        self._url = (now, response["url"])
+        self.fetches += 1
+        return response["url"]
+
+    def clear(self):
+        self._url = None
+        self.fetches = 0
+
+
+app_webhook_url = AppWebhookURLCache()
 
 
 async def get_app_webhook_url(gh: GitHubAPI) -> str:
@@ -94,12 +354,11 @@ async def get_app_webhook_url(gh: GitHubAPI) -> str:
         return f"https://{heroku_app_name}.herokuapp.com/github/hooks/"
     else:
         # This is not a Review App, so we can query the GitHub App webhook url.
-        response = await gh.getitem("/app/hook/config", jwt=get_jwt(), accept=ACCEPT)
-        return response["url"]
+        return await app_webhook_url.get(gh)
 
 
 async def get_repo_id(repo_full_name: str, gh: GitHubAPI) -> str:
-    token = await get_access_token(gh)
+    token = await get_access_token(gh, repo_full_name=repo_full_name)
     repo_response = await gh.getitem(
         f"/repos/{repo_full_name}",
         oauth_token=token,
@@ -108,10 +367,11 @@ async def get_repo_id(repo_full_name: str, gh: GitHubAPI) -> str:
     return repo_response["id"]
 
 
-async def list_accessible_repos(gh: GitHubAPI) -> list[str]:
-    """Get all repos accessible to the GitHub App installation."""
+async def list_accessible_repos(gh: GitHubAPI, repo_full_name: Optional[str] = None) -> list[str]:
+    """Get all repos accessible to the GitHub App installation (which, if the app has more than
+    one, is the one for ``repo_full_name``)."""
 
-    token = await get_access_token(gh)
+    token = await get_access_token(gh, repo_full_name=repo_full_name)
     repo_response = await gh.getitem(
         "/installation/repositories",
         oauth_token=token,
@@ -121,7 +381,7 @@ async def list_accessible_repos(gh: GitHubAPI) -> list[str]:
 
 
 async def repo_id_and_spec_from_feedstock_id(
-    id: int, gh: GitHubAPI, db_session: Session
+    id: int, gh: GitHubAPI, db_session: AsyncSession
 ) -> tuple[str, str]:
     """Given a feedstock id, return the corresponding GitHub repo id and feedstock spec.
 
@@ -133,11 +393,18 @@ async def repo_id_and_spec_from_feedstock_id(
     :param id: The feedstock's id in the Pangeo Forge database.
     """
 
-    feedstock = db_session.get(MODELS["feedstock"].table, id)
+    feedstock = await db_session.get(MODELS["feedstock"].table, id)
     if not feedstock:
         raise HTTPException(status_code=404, detail=f"Id {id} not found in feedstock table.")
 
-    accessible_repos = await list_accessible_repos(gh)
+    try:
+        accessible_repos = await list_accessible_repos(gh, feedstock.spec)
+    except BadRequest as e:
+        # With more than one installation, the repo's installation is looked up, which 404s if
+        # the app isn't installed there.
+        if e.status_code != 404:
+            raise
+        accessible_repos = []
 
     if feedstock.spec in accessible_repos:
         repo_id = await get_repo_id(repo_full_name=feedstock.spec, gh=gh)
@@ -157,7 +424,7 @@ async def maybe_specify_feedstock_subdir(
     """If this is staged-recipes, add the --feedstock-subdir option to the command."""
 
     if "staged-recipes" in api_url:
-        token = await get_access_token(gh)
+        token = await get_access_token(gh, repo_full_name=api_url.split("/repos/")[-1])
         files = await gh.getitem(
             f"{api_url}/pulls/{pr_number}/files",
             oauth_token=token,
@@ -187,6 +454,63 @@ def get_storage_subpath_identifier(feedstock_spec: str, recipe_run: SQLModel):
     return f"{prefix}/{recipe_run.recipe_id}.{recipe_run.dataset_type}"
 
 
+async def iter_github_hook_deliveries(
+    gh: GitHubAPI, limit: int, before: Optional[int] = None, repository_id: Optional[int] = None
+) -> AsyncIterator[dict]:
+    """Up to ``limit`` of the GitHub App's webhook deliveries, newest first, which are requested
+    from GitHub a page at a time as they're iterated over (and only until ``limit`` is reached).
+
+    :param before: Only yield deliveries older than the one with this id. ``GitHubAPI`` doesn't
+      expose GitHub's own page cursors, so the newer deliveries are paged through again to get here.
+    :param repository_id: Only yield deliveries originating from this repository.
+    """
+
+    count = 0
+    async for d in gh.getiter("/app/hook/deliveries?per_page=100", jwt=get_jwt(), accept=ACCEPT):
+        if before is not None and d["id"] >= before:
+            continue
+        if repository_id is None or d["repository_id"] == repository_id:
+            yield d
+            count += 1
+            if count == limit:
+                break
+
+
+class DeliverySource(str, Enum):
+    local = "local"
+    github = "github"
+
+
+async def iter_logged_hook_deliveries(logged: list[deliveries.HookDelivery]):
+    for d in logged:
+        yield jsonable_encoder(deliveries.HookDeliveryRead.from_orm(d))
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None:
+        return None
+    if not cursor.isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Cursor {cursor!r} is not a delivery id.",
+        )
+    return int(cursor)
+
+
+async def hook_deliveries_response(request: Request, deliveries: AsyncIterator[dict], limit: int):
+    """If the client accepts NDJSON, stream ``deliveries`` as they're fetched, one per line.
+    Otherwise, respond with a JSON list of them. If the page is full, the id of its last delivery
+    is the cursor for the next page, which is returned in the ``X-Next-Cursor`` header."""
+
+    if NDJSON in request.headers.get("accept", ""):
+        return StreamingResponse(
+            (json.dumps(d) + "\n" async for d in deliveries), media_type=NDJSON
+        )
+    page = [d async for d in deliveries]
+    headers = {"X-Next-Cursor": str(page[-1]["id"])} if len(page) == limit else {}
+    return JSONResponse(page, headers=headers)
+
+
 # Routes ------------------------------------------------------------------------------------------
 
 
@@ -197,17 +521,38 @@ def get_storage_subpath_identifier(feedstock_spec: str, recipe_run: SQLModel):
 )
 async def get_feedstock_hook_deliveries(
     id: int,
-    db_session: Session = Depends(get_database_session),
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of deliveries to return"),
+    cursor: Optional[str] = Query(
+        None,
+        description=(
+            "Return the deliveries older than this one, e.g. the X-Next-Cursor header of the "
+            "previous page (the id of its last delivery)."
+        ),
+    ),
+    source: DeliverySource = Query(
+        DeliverySource.github,
+        description=(
+            "Request deliveries from GitHub, or list those logged by this app (whose ids are local, "
+            "so can't be looked up at /github/hooks/deliveries/{id})"
+        ),
+    ),
+    db_session: AsyncSession = Depends(get_async_session),
     http_session: aiohttp.ClientSession = Depends(http_session),
 ):
+    if source == DeliverySource.local:
+        feedstock = await db_session.get(MODELS["feedstock"].table, id)
+        if not feedstock:
+            raise HTTPException(status_code=404, detail=f"Id {id} not found in feedstock table.")
+        logged = await deliveries.list_deliveries(
+            db_session, limit, parse_cursor(cursor), feedstock.spec
+        )
+        return await hook_deliveries_response(request, iter_logged_hook_deliveries(logged), limit)
+
     gh = get_github_session(http_session)
     repo_id, _ = await repo_id_and_spec_from_feedstock_id(id, gh, db_session)
-    deliveries = []
-    async for d in gh.getiter("/app/hook/deliveries", jwt=get_jwt(), accept=ACCEPT):
-        if d["repository_id"] == repo_id:
-            deliveries.append(d)
-
-    return deliveries
+    github = iter_github_hook_deliveries(gh, limit, parse_cursor(cursor), repository_id=repo_id)
+    return await hook_deliveries_response(request, github, limit)
 
 
 @github_app_router.get(
@@ -218,13 +563,13 @@ async def get_feedstock_hook_deliveries(
 async def get_feedstock_check_runs(
     id: int,
     commit_sha: str,
-    db_session: Session = Depends(get_database_session),
+    db_session: AsyncSession = Depends(get_async_session),
     http_session: aiohttp.ClientSession = Depends(http_session),
 ):
     gh = get_github_session(http_session)
     _, feedstock_spec = await repo_id_and_spec_from_feedstock_id(id, gh, db_session)
 
-    token = await get_access_token(gh)
+    token = await get_access_token(gh, repo_full_name=feedstock_spec)
     check_runs = await gh.getitem(
         f"/repos/{feedstock_spec}/commits/{commit_sha}/check-runs",
         accept=ACCEPT,
@@ -239,11 +584,11 @@ async def get_feedstock_check_runs(
     summary="Endpoint to which Pangeo Forge GitHub App posts payloads.",
     tags=["github_app", "admin"],
 )
-async def receive_github_hook(  # noqa: C901
+async def receive_github_hook(
     request: Request,
     background_tasks: BackgroundTasks,
     http_session: aiohttp.ClientSession = Depends(http_session),
-    db_session: Session = Depends(get_database_session),
+    db_session: AsyncSession = Depends(get_async_session),
 ):
     # Hash signature validation documentation:
     # https://docs.github.com/en/developers/webhooks-and-events/webhooks/securing-your-webhooks#validating-payloads-from-github
@@ -251,18 +596,168 @@ async def receive_github_hook(  # noqa: C901
     payload_bytes = await request.body()
     await verify_hash_signature(request, payload_bytes)
 
-    # NOTE: Background task functions cannot use FastAPI's Depends to resolve session
-    # dependencies. We can resolve these dependencies (i.e., github session, database session)
-    # here in the route function and then pass them through to the background task as kwargs.
-    # See: https://github.com/tiangolo/fastapi/issues/4956#issuecomment-1140313872.
-    gh = get_github_session(http_session)
-    session_kws = dict(gh=gh, db_session=db_session)
-    token = await get_access_token(gh)
-    gh_kws = dict(oauth_token=token, accept=ACCEPT)
-
     event = request.headers.get("X-GitHub-Event")
     payload = await parse_payload(request, payload_bytes, event)
 
+    return await handle_and_log_github_hook(
+        guid=request.headers.get("X-GitHub-Delivery"),
+        event=event,
+        payload=payload,
+        payload_sha256=hashlib.sha256(payload_bytes).hexdigest(),
+        gh=get_github_session(http_session),
+        background_tasks=background_tasks,
+        db_session=db_session,
+    )
+
+
+async def handle_and_log_github_hook(
+    *,
+    guid: Optional[str],
+    event: str,
+    payload: dict,
+    payload_sha256: str,
+    redelivery: bool = False,
+    **handler_kws,
+):
+    """Handle a webhook payload with ``handle_github_hook``, then add it to the delivery log,
+    whether or not it was handled successfully. Duplicates of deliveries which have already been
+    handled are acknowledged without being handled again, unless they're deliberate
+    ``redelivery``s (see ``idempotency.py``)."""
+
+    delivered_at, start = datetime.utcnow(), time.perf_counter()
+    status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    key = None if redelivery else idempotency.get_idempotency_key(event, guid, payload)
+    # If handled by a job, the key is released by whichever process runs the job, if it fails.
+    deferred = fast_ack_hooks() and event in DEFERRABLE_EVENTS
+    job_id = None
+    try:
+        if key is not None and not await idempotency.claim(
+            handler_kws["db_session"], key, remember=not deferred
+        ):
+            logger.info(f"Ignoring duplicate webhook delivery {key}")
+            response = {"status": "duplicate"}
+        else:
+            try:
+                if deferred:
+                    job = await enqueue_task(
+                        handle_hook,
+                        event,
+                        payload,
+                        key,
+                        db_session=handler_kws["db_session"],
+                        background_tasks=handler_kws["background_tasks"],
+                        installation_id=payload.get("installation", {}).get("id"),
+                    )
+                    job_id = job.id
+                    response = {"status": "queued", "job_id": job_id}
+                else:
+                    response = await handle_github_hook(event=event, payload=payload, **handler_kws)
+            except BaseException:
+                if key is not None:
+                    await release_idempotency_key(key)
+                raise
+        status_code = status.HTTP_202_ACCEPTED
+        return response
+    except HTTPException as e:
+        status_code = e.status_code
+        raise
+    finally:
+        try:
+            # In a session of its own, because the handler's session may have been left unusable
+            # by an error.
+            async with AsyncSession(async_engine, expire_on_commit=False) as log_session:
+                await deliveries.record(
+                    log_session,
+                    guid=guid,
+                    event=event,
+                    payload=payload,
+                    payload_sha256=payload_sha256,
+                    delivered_at=delivered_at,
+                    status_code=status_code,
+                    duration=time.perf_counter() - start,
+                    redelivery=redelivery,
+                    job_id=job_id,
+                )
+        except Exception as e:
+            logger.error(f"Failed to record webhook delivery: {e!r}")
+
+
+def fast_ack_hooks() -> bool:
+    """If True, webhooks which need GitHub API calls to handle are acknowledged as soon as they've
+    been verified and enqueued, then handled by a ``handle_hook`` job. Otherwise they're handled
+    before they're acknowledged, which risks exceeding GitHub's 10 second timeout for deliveries
+    (after which GitHub considers them failed, and may retry them) when GitHub's API is slow."""
+
+    return os.environ.get("PANGEO_FORGE_FAST_ACK_HOOKS", "false").lower() in ("1", "true")
+
+
+# Events whose handlers call GitHub's API, and so which are handled by a job in fast-ack mode. All
+# other events are handled without calling GitHub (see `handle_github_hook`).
+DEFERRABLE_EVENTS = ("pull_request", "issue_comment", "dataflow")
+
+
+async def release_idempotency_key(key: str):
+    try:
+        async with AsyncSession(async_engine, expire_on_commit=False) as db_session:
+            await idempotency.release(db_session, key)
+    except Exception as e:
+        logger.error(f"Failed to release webhook idempotency key {key}: {e!r}")
+
+
+async def handle_github_hook(  # noqa: C901
+    *,
+    event: str,
+    payload: dict,
+    gh: GitHubAPI,
+    background_tasks: BackgroundTasks,
+    db_session: AsyncSession,
+):
+    """Handle a (verified and parsed) webhook payload, by dispatching it to the handler for its
+    ``event``."""
+
+    if event in ("installation", "installation_repositories"):
+        # Handled before minting a token, in case this event removes the installation.
+        return handle_installation_event(event=event, payload=payload)
+    elif event == "meta":
+        # The app's webhook was deleted (and probably recreated), so forget the cached url.
+        app_webhook_url.clear()
+        return {"status": "ok"}
+    elif event == "check_suite":
+        # We create check runs directly using the head_sha from the assocaited PR.
+        # TBH, I'm not sure if/how it would be better to use this object, but we get a lot
+        # of these requests from GitHub, so just conveying that we expect that here, for now.
+        return {"status": "ok"}
+    elif event not in DEFERRABLE_EVENTS:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="No handling implemented for this event type.",
+        )
+
+    # GitHub webhook payloads tell us which installation they came from, so we don't have to
+    # look it up. Dataflow events from our Cloud Function don't have this.
+    installation_id = payload.get("installation", {}).get("id")
+    # Longer running work is enqueued as jobs (see `enqueue_task`), rather than done before we
+    # respond to the webhook. These kwargs are what's needed to enqueue them.
+    job_kws = dict(
+        db_session=db_session,
+        background_tasks=background_tasks,
+        installation_id=installation_id,
+    )
+    if event == "dataflow":
+        # Handled without a token, because the installation is only known once the recipe run's
+        # feedstock has been found.
+        return await handle_dataflow_event(
+            payload=payload,
+            gh=gh,
+            db_session=db_session,
+            job_kws=job_kws,
+        )
+
+    if installation_id and (repo := payload.get("repository")):
+        app_installations.add_repos(installation_id, [repo["full_name"]])
+    token = await get_access_token(gh, installation_id=installation_id)
+    gh_kws = dict(oauth_token=token, accept=ACCEPT)
+
     # TODO: maybe bring this back as a way to filter which PRs run on which apps.
     # With addition of `pforgetest` org, might not be necessary, however. TBD.
     # logger.info("Checking to see if PR has {label} label...")
@@ -276,49 +771,80 @@ async def receive_github_hook(  # noqa: C901
     if event == "pull_request":
         return await handle_pr_event(
             payload=payload,
-            background_tasks=background_tasks,
-            session_kws=session_kws,
+            job_kws=job_kws,
             gh=gh,
             gh_kws=gh_kws,
         )
-    elif event == "issue_comment":
+    else:  # event == "issue_comment"
         return await handle_pr_comment_event(
             payload=payload,
             gh=gh,
-            background_tasks=background_tasks,
-            session_kws=session_kws,
+            job_kws=job_kws,
             gh_kws=gh_kws,
             db_session=db_session,
         )
-    elif event == "dataflow":
-        return await handle_dataflow_event(
-            payload=payload,
-            db_session=db_session,
-            background_tasks=background_tasks,
-            gh_kws=gh_kws,
-            gh=gh,
-        )
 
-    elif event == "check_suite":
-        # We create check runs directly using the head_sha from the assocaited PR.
-        # TBH, I'm not sure if/how it would be better to use this object, but we get a lot
-        # of these requests from GitHub, so just conveying that we expect that here, for now.
-        return {"status": "ok"}
 
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_501_NOT_IMPLEMENTED,
-            detail="No handling implemented for this event type.",
-        )
+async def handle_hook(
+    event: str,
+    payload: dict,
+    idempotency_key: Optional[str],
+    *,
+    gh: GitHubAPI,
+    db_session: AsyncSession,
+):
+    """Handle a webhook payload which was acknowledged before being handled (see
+    ``fast_ack_hooks``). Like a webhook handled before it's acknowledged, tokens are minted by the
+    handler, for the installation it finds the event came from (which dataflow events don't say). Its ``idempotency_key`` stays claimed while the job is queued or may be
+    retried, so that redeliveries aren't handled as well, and is only released once the job has
+    failed for good (see ``job_finished``), so that it can be redelivered."""
+
+    # Jobs enqueued by the handler are run (if they're run inline) once it's finished, as they are
+    # after responding to a webhook which is handled before it's acknowledged.
+    background_tasks = BackgroundTasks()
+    await handle_github_hook(
+        event=event,
+        payload=payload,
+        gh=gh,
+        background_tasks=background_tasks,
+        db_session=db_session,
+    )
+    await background_tasks()
+
+
+def handle_installation_event(*, event: str, payload: dict):
+    """Keep ``app_installations`` current as the app is installed, uninstalled, or given access
+    to more (or fewer) repos."""
+
+    action = payload["action"]
+    installation_id = payload["installation"]["id"]
+    logger.info(f"Received {event} event with {action = } for {installation_id = }")
+
+    if event == "installation":
+        if action == "created":
+            app_installations.add_installation(installation_id)
+            repos = [r["full_name"] for r in payload.get("repositories", [])]
+            app_installations.add_repos(installation_id, repos)
+        elif action in ("deleted", "suspend"):
+            app_installations.remove_installation(installation_id)
+            installation_tokens.evict(installation_id)
+        elif action == "unsuspend":
+            app_installations.add_installation(installation_id)
+    elif event == "installation_repositories":
+        added = [r["full_name"] for r in payload.get("repositories_added", [])]
+        removed = [r["full_name"] for r in payload.get("repositories_removed", [])]
+        app_installations.add_repos(installation_id, added)
+        app_installations.remove_repos(removed)
+
+    return {"status": "ok"}
 
 
 async def handle_dataflow_event(
     *,
     payload: dict,
-    db_session: Session,
-    background_tasks: BackgroundTasks,
     gh: GitHubAPI,
-    gh_kws: dict,
+    db_session: AsyncSession,
+    job_kws: dict,
 ):
     logger.info(f"Received dataflow webhook with {payload = }")
 
@@ -331,18 +857,26 @@ async def handle_dataflow_event(
                 detail=f"No handling implemented for {payload['conclusion'] = }.",
             )
 
-        recipe_run = db_session.exec(
-            select(MODELS["recipe_run"].table).where(
-                MODELS["recipe_run"].table.id == int(payload["recipe_run_id"])
+        recipe_run = (
+            await db_session.exec(
+                select(MODELS["recipe_run"].table).where(
+                    MODELS["recipe_run"].table.id == int(payload["recipe_run_id"])
+                )
             )
         ).one()
-        feedstock = db_session.exec(
-            select(MODELS["feedstock"].table).where(
-                MODELS["feedstock"].table.id == recipe_run.feedstock_id
+        feedstock = (
+            await db_session.exec(
+                select(MODELS["feedstock"].table).where(
+                    MODELS["feedstock"].table.id == recipe_run.feedstock_id
+                )
             )
         ).one()
-        bakery = db_session.exec(
-            select(MODELS["bakery"].table).where(MODELS["bakery"].table.id == recipe_run.bakery_id)
+        bakery = (
+            await db_session.exec(
+                select(MODELS["bakery"].table).where(
+                    MODELS["bakery"].table.id == recipe_run.bakery_id
+                )
+            )
         ).one()
 
         recipe_run.status = "completed"
@@ -357,18 +891,25 @@ async def handle_dataflow_event(
                 root_path=root_path
             )
         db_session.add(recipe_run)
-        db_session.commit()
+        await db_session.commit()
+
+        # The triage jobs act on the feedstock's repo, so authenticate them as its installation.
+        installation_id = await app_installations.get_installation_id(gh, feedstock.spec)
+        job_kws = job_kws | {"installation_id": installation_id}
 
         # Wow not every day you google a error and see a comment on it by Guido van Rossum
         # https://github.com/python/mypy/issues/1174#issuecomment-175854832
-        args: list[SQLModel] = [recipe_run]  # type: ignore
+        args: list[SQLModel] = [recipe_run, feedstock.spec]  # type: ignore
         if recipe_run.is_test:
-            args.append(feedstock.spec)  # type: ignore
             logger.info(f"Calling `triage_test_run_complete` with {args=}")
-            background_tasks.add_task(triage_test_run_complete, *args, gh=gh, gh_kws=gh_kws)
+            await enqueue_task(
+                triage_test_run_complete, *args, bakery_id=recipe_run.bakery_id, **job_kws
+            )
         else:
             logger.info(f"Calling `triage_prod_run_complete` with {args=}")
-            background_tasks.add_task(triage_prod_run_complete, *args, gh=gh, gh_kws=gh_kws)
+            await enqueue_task(
+                triage_prod_run_complete, *args, bakery_id=recipe_run.bakery_id, **job_kws
+            )
 
 
 async def handle_pr_comment_event(
@@ -376,9 +917,8 @@ async def handle_pr_comment_event(
     payload: dict,
     gh: GitHubAPI,
     gh_kws: dict,
-    background_tasks: BackgroundTasks,
-    session_kws: dict,
-    db_session: Session,
+    job_kws: dict,
+    db_session: AsyncSession,
 ):
     """Handle a pull request comment event.
 
@@ -390,11 +930,9 @@ async def handle_pr_comment_event(
         The authenticated GitHub API client.
     gh_kws : dict
         The keyword arguments to pass to the GitHub API client.
-    background_tasks : BackgroundTasks
-        The FastAPI background tasks object.
-    session_kws : dict
-        The keyword arguments to pass to the SQLAlchemy session.
-    db_session : Session
+    job_kws : dict
+        The keyword arguments to pass to ``enqueue_task``.
+    db_session : AsyncSession
         The SQLAlchemy session.
 
     """
@@ -438,7 +976,7 @@ async def handle_pr_comment_event(
         )
         # TODO: handle error if there is no matching result. this would arise if the slash
         # command arg was a recipe_id that doesn't exist for this feedstock + head_sha combo.
-        matching_recipe_run = db_session.exec(statement).one()
+        matching_recipe_run = (await db_session.exec(statement)).one()
         logger.debug(matching_recipe_run)
         args = (  # type: ignore
             pr["head"]["repo"]["html_url"],
@@ -450,7 +988,9 @@ async def handle_pr_comment_event(
             reactions_url,
         )
         logger.info(f"Creating run_recipe_test task with args: {args}")
-        background_tasks.add_task(run_recipe_test, *args, **session_kws, gh_kws=gh_kws)
+        await enqueue_task(
+            run_recipe_test, *args, bakery_id=matching_recipe_run.bakery_id, **job_kws
+        )
 
 
 async def handle_pr_event(
@@ -458,8 +998,7 @@ async def handle_pr_event(
     payload: dict,
     gh_kws: dict[str, Any],
     gh: GitHubAPI,
-    session_kws: dict[str, Any],
-    background_tasks: BackgroundTasks,
+    job_kws: dict[str, Any],
 ):
     """Process a PR event."""
 
@@ -481,7 +1020,7 @@ async def handle_pr_event(
             pr["base"]["repo"]["url"],
             pr["base"]["repo"]["full_name"],
         )
-        background_tasks.add_task(synchronize, *args, **session_kws, gh_kws=gh_kws)
+        await enqueue_task(synchronize, *args, **job_kws)
         return {"status": "ok", "background_tasks": [{"task": "synchronize", "args": args}]}
 
     elif action == "closed" and pr["merged"]:
@@ -517,7 +1056,7 @@ async def handle_pr_event(
                 pr["base"]["repo"]["url"],
             )
             logger.info(f"Calling create_feedstock with args {args}")
-            background_tasks.add_task(create_feedstock_repo, *args, **session_kws, gh_kws=gh_kws)
+            await enqueue_task(create_feedstock_repo, *args, **job_kws)
         else:
             # this is not staged recipes, but make sure it's a feedstock, and not some other repo
             if not pr["base"]["repo"]["full_name"].endswith("-feedstock"):
@@ -536,7 +1075,7 @@ async def handle_pr_event(
                 pr["base"]["repo"]["url"],
                 pr["base"]["ref"],
             )
-            background_tasks.add_task(deploy_prod_run, *args, **session_kws, gh_kws=gh_kws)
+            await enqueue_task(deploy_prod_run, *args, **job_kws)
 
 
 async def parse_payload(request, payload_bytes, event):
@@ -574,14 +1113,33 @@ async def verify_hash_signature(request: Request, payload_bytes: bytes) -> None:
     summary="Get all webhook deliveries, not filtered by originating feedstock repo.",
     tags=["github_app", "public"],
 )
-async def get_deliveries(http_session: aiohttp.ClientSession = Depends(http_session)):
-    gh = get_github_session(http_session)
-
-    deliveries = []
-    async for d in gh.getiter("/app/hook/deliveries", jwt=get_jwt(), accept=ACCEPT):
-        deliveries.append(d)
+async def get_deliveries(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of deliveries to return"),
+    cursor: Optional[str] = Query(
+        None,
+        description=(
+            "Return the deliveries older than this one, e.g. the X-Next-Cursor header of the "
+            "previous page (the id of its last delivery)."
+        ),
+    ),
+    source: DeliverySource = Query(
+        DeliverySource.github,
+        description=(
+            "Request deliveries from GitHub, or list those logged by this app (whose ids are local, "
+            "so can't be looked up at /github/hooks/deliveries/{id})"
+        ),
+    ),
+    db_session: AsyncSession = Depends(get_async_session),
+    http_session: aiohttp.ClientSession = Depends(http_session),
+):
+    if source == DeliverySource.local:
+        logged = await deliveries.list_deliveries(db_session, limit, parse_cursor(cursor))
+        return await hook_deliveries_response(request, iter_logged_hook_deliveries(logged), limit)
 
-    return deliveries
+    gh = get_github_session(http_session)
+    github = iter_github_hook_deliveries(gh, limit, parse_cursor(cursor))
+    return await hook_deliveries_response(request, github, limit)
 
 
 @github_app_router.get(
@@ -599,9 +1157,183 @@ async def get_delivery(
     return delivery["response"] if response_only else delivery
 
 
+@github_app_router.post(
+    "/github/hooks/replay",
+    response_model=deliveries.ReplayResponse,
+    summary="Replay logged webhook deliveries through the webhook handlers.",
+    tags=["github_app", "admin"],
+)
+async def replay_hook_deliveries(
+    replay: deliveries.ReplayRequest,
+    background_tasks: BackgroundTasks,
+    db_session: AsyncSession = Depends(get_async_session),
+    http_session: aiohttp.ClientSession = Depends(http_session),
+    authorized_user=Depends(check_authentication_header),
+):
+    selected = await deliveries.list_replayable(
+        db_session, replay.limit, replay.ids, replay.since, replay.failed, replay.event
+    )
+    if replay.dry_run:
+        return deliveries.ReplayResponse(deliveries=selected, results=[])
+    gh = get_github_session(http_session)
+
+    async def replay_one(logged: deliveries.HookDelivery) -> deliveries.ReplayResult:
+        start = time.perf_counter()
+        status_code = status.HTTP_202_ACCEPTED
+        # Replays run concurrently, so each needs a session of its own
+        async with AsyncSession(async_engine, expire_on_commit=False) as replay_session:
+            try:
+                await handle_and_log_github_hook(
+                    guid=logged.guid,
+                    event=logged.event,
+                    payload=json.loads(logged.payload),  # type: ignore
+                    payload_sha256=logged.payload_sha256,
+                    redelivery=True,
+                    gh=gh,
+                    background_tasks=background_tasks,
+                    db_session=replay_session,
+                )
+            except HTTPException as e:
+                status_code = e.status_code
+            except Exception as e:
+                logger.error(f"Replay of webhook delivery {logged.id} failed: {e!r}")
+                status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        duration = time.perf_counter() - start
+        return deliveries.ReplayResult(
+            delivery_id=logged.id, status_code=status_code, duration=duration
+        )
+
+    # Replays are started on a fixed schedule, rather than each after the last has finished, so
+    # that (when generating load) slow handling shows up as longer durations, not a lower rate.
+    tasks = []
+    start = time.monotonic()
+    for i, logged in enumerate(selected * replay.repeat):
+        await asyncio.sleep(max(0, start + i / replay.rate - time.monotonic()))
+        tasks.append(asyncio.create_task(replay_one(logged)))
+    results = await asyncio.gather(*tasks)
+
+    return deliveries.ReplayResponse.from_results(selected, results)
+
+
+@github_app_router.get(
+    "/github/hooks/latency",
+    response_model=deliveries.HookLatency,
+    summary="Get histograms of how long webhooks take to be acknowledged, and handled.",
+    tags=["github_app", "admin"],
+)
+async def get_hook_latency(
+    since: Optional[datetime] = None,
+    db_session: AsyncSession = Depends(get_async_session),
+    authorized_user=Depends(check_authentication_header),
+):
+    return await deliveries.get_hook_latency(db_session, since)
+
+
+@github_app_router.get(
+    "/github/jobs/stats",
+    response_model=jobs.JobQueueStats,
+    summary="Get the depth and latency of the queue of jobs triggered by webhooks.",
+    tags=["github_app", "admin"],
+)
+async def get_job_queue_stats(
+    db_session: AsyncSession = Depends(get_async_session),
+    authorized_user=Depends(check_authentication_header),
+):
+    return await jobs.get_queue_stats(db_session)
+
+
 # Background task helpers -------------------------------------------------------------------------
 
 
+def get_bake_concurrency() -> int:
+    """How many recipe runs may be submitted to the same bakery at once (by this process)."""
+
+    return int(os.environ.get("PANGEO_FORGE_BAKE_CONCURRENCY", 4))
+
+
+class BakeryLimiter:
+    """Semaphores bounding how many recipe runs are submitted to each bakery at once, shared by all
+    tasks in this process. They're created lazily, for the running event loop, because asyncio
+    primitives can't be shared between loops (and the tests run a new loop for each test).
+    """
+
+    def __init__(self):
+        self._semaphores: dict[str, tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = {}
+
+    def __call__(self, bakery_name: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if bakery_name not in self._semaphores or self._semaphores[bakery_name][0] is not loop:
+            self._semaphores[bakery_name] = (loop, asyncio.Semaphore(get_bake_concurrency()))
+        return self._semaphores[bakery_name][1]
+
+    def clear(self):
+        self._semaphores.clear()
+
+
+bake_slots = BakeryLimiter()
+
+
+def get_runner_timeout() -> float:
+    """Seconds after which a ``pangeo-forge-runner`` subprocess is killed."""
+
+    return float(os.environ.get("PANGEO_FORGE_RUNNER_TIMEOUT", 30 * 60))
+
+
+def get_runner_line_limit() -> int:
+    """Bytes in the longest line of ``pangeo-forge-runner`` output which can be read. Results (e.g.
+    expanded meta) and tracebacks are each output as a single JSON line, so this is much larger
+    than asyncio's default of 64 KiB."""
+
+    return int(os.environ.get("PANGEO_FORGE_RUNNER_LINE_LIMIT", 64 * 2**20))
+
+
+async def stream_runner_output(cmd: list[str]) -> AsyncIterator[dict]:
+    """Run a ``pangeo-forge-runner ... --json`` command without blocking the event loop, yielding
+    each JSON log line as it is emitted. This is an async alternative to ``subprocess.check_output``
+    which raises the same errors: ``CalledProcessError`` if the command fails, and
+    ``TimeoutExpired`` if it runs longer than ``get_runner_timeout()``. In both cases, the error's
+    ``output`` holds all lines read. If the calling task is cancelled, the subprocess is killed.
+    So is a subprocess which outputs a line longer than ``get_runner_line_limit()``, which is then
+    reported as a failure, as if by the runner (i.e., as a ``"failed"`` line in the error's output).
+    """
+
+    timeout, limit = get_runner_timeout(), get_runner_line_limit()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, limit=limit)
+    assert proc.stdout is not None  # for mypy
+    lines = []
+    try:
+        while True:
+            try:
+                line = await asyncio.wait_for(proc.stdout.readline(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                raise subprocess.TimeoutExpired(cmd, timeout, output=b"".join(lines))
+            except ValueError:
+                # `readline` raises this (not `LimitOverrunError`) if the line is over the limit.
+                # Callers conclude their check runs (etc.) from the runner's "failed" line, so add
+                # one for this failure.
+                exc_info = f"pangeo-forge-runner output a line longer than {limit} bytes."
+                lines.append(json.dumps({"status": "failed", "exc_info": exc_info}).encode())
+                proc.kill()
+                # `wait` doesn't return until stdout is closed, so read what's left in the pipe.
+                await proc.stdout.read()
+                break
+            if not line:
+                break  # eof
+            lines.append(line)
+            if line.strip():
+                yield json.loads(line)
+        returncode = await proc.wait()
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.communicate()
+
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd, output=b"".join(lines))
+
+
 async def make_dataflow_job_name(recipe_run: SQLModel, gh: GitHubAPI):
     github_app_webhook_url = await get_app_webhook_url(gh)
     # Encode webhook url + recipe run id so that:
@@ -657,13 +1389,15 @@ async def run(
     feedstock_subdir: Optional[str] = None,
     *,
     gh: GitHubAPI,
-    db_session: Session,
+    db_session: AsyncSession,
 ):
     statement = select(MODELS["bakery"].table).where(
         MODELS["bakery"].table.id == recipe_run.bakery_id
     )
-    bakery = db_session.exec(statement).one()
-    bakery_config = get_config().bakeries[bakery.name]
+    bakery = (await db_session.exec(statement)).one()
+    # `get_config` returns a cached object shared by all callers, and we are about to modify the
+    # bakery config for this specific recipe run, so we need our own copy of it.
+    bakery_config = get_config().bakeries[bakery.name].copy(deep=True)
 
     subpath = get_storage_subpath_identifier(feedstock_spec, recipe_run)
     # root paths are an interesting configuration edge-case because they combine some stable
@@ -708,21 +1442,21 @@ async def run(
         # so if we don't update it now, we won't capture how long the pipeline actually took.
         recipe_run.started_at = datetime.utcnow().replace(microsecond=0)
         db_session.add(recipe_run)
-        db_session.commit()
+        await db_session.commit()
         try:
-            out = subprocess.check_output(cmd)
-            logger.debug(f"Command output is {out.decode('utf-8')}")
-            for line in out.splitlines():
-                p = json.loads(line)
+            async for p in stream_runner_output(cmd):
+                logger.debug(f"Command output: {p}")
                 if p.get("status") == "submitted":
                     message = json.loads(recipe_run.message or "{}") | dict(
                         job_name=p["job_name"], job_id=p["job_id"]
                     )
                     recipe_run.message = json.dumps(message)
                     db_session.add(recipe_run)
-                    db_session.commit()
+                    await db_session.commit()
 
-        except subprocess.CalledProcessError as e:
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            if isinstance(e, subprocess.TimeoutExpired):
+                trace = str(e)
             for line in e.output.splitlines():
                 p = json.loads(line)
                 if p.get("status") == "failed":
@@ -738,8 +1472,8 @@ async def run(
             message = json.loads(recipe_run.message or "{}")
             recipe_run.message = json.dumps(message | {"trace": trace})
             db_session.add(recipe_run)
-            db_session.commit()
-            db_session.refresh(recipe_run)
+            await db_session.commit()
+            await db_session.refresh(recipe_run)
             raise e  # raise the error, so that the calling function knows what happened
 
 
@@ -754,7 +1488,7 @@ async def synchronize(
     base_full_name: str,
     *,
     gh: GitHubAPI,
-    db_session: Session,
+    db_session: AsyncSession,
     gh_kws: dict,
 ):
     logger.info(f"Synchronizing {head_html_url} at {head_sha}.")
@@ -789,7 +1523,23 @@ async def synchronize(
     if feedstock_subdir:
         cmd.append(f"--feedstock-subdir={feedstock_subdir}")
     try:
-        out = subprocess.check_output(cmd)
+        async for p in stream_runner_output(cmd):
+            # patch for https://github.com/pangeo-forge/pangeo-forge-orchestrator/issues/132
+            if ("status" in p) and p["status"] == "completed":
+                meta = p["meta"]
+    except subprocess.TimeoutExpired as e:
+        update_request = dict(
+            status="completed",
+            conclusion="failure",
+            completed_at=f"{datetime.utcnow().replace(microsecond=0).isoformat()}Z",
+            output=dict(title="Synchronize timed out", summary=str(e)),
+        )
+        await gh.patch(
+            f"{base_api_url}/check-runs/{checks_response['id']}",
+            data=update_request,
+            **gh_kws,
+        )
+        raise e
     except subprocess.CalledProcessError as e:
         for line in e.output.splitlines():
             p = json.loads(line)
@@ -816,12 +1566,6 @@ async def synchronize(
         # CalledProcessError's output *should* have a line where "status" == "failed", but just in
         # case it doesn't, raise a NotImplementedError here to prevent moving forward.
         raise NotImplementedError from e
-
-    for line in out.splitlines():
-        p = json.loads(line)
-        # patch for https://github.com/pangeo-forge/pangeo-forge-orchestrator/issues/132
-        if ("status" in p) and p["status"] == "completed":
-            meta = p["meta"]
     logger.debug(meta)
 
     # TODO[IMPORTANT]:
@@ -836,11 +1580,11 @@ async def synchronize(
         feedstock_statement = select(MODELS["feedstock"].table).where(
             MODELS["feedstock"].table.spec == base_full_name
         )
-        feedstock = db_session.exec(feedstock_statement).one()
+        feedstock = (await db_session.exec(feedstock_statement)).one()
         bakery_statement = select(MODELS["bakery"].table).where(
             MODELS["bakery"].table.name == meta["bakery"]["id"]
         )
-        bakery = db_session.exec(bakery_statement).one()
+        bakery = (await db_session.exec(bakery_statement)).one()
     except (MultipleResultsFound, NoResultFound) as e:
         if isinstance(e, NoResultFound):
             output = dict(
@@ -898,13 +1642,11 @@ async def synchronize(
         for recipe in meta["recipes"]
     ]
 
-    created = []
-    for nm in new_models:
-        db_model = MODELS["recipe_run"].table.from_orm(nm)
-        db_session.add(db_model)
-        db_session.commit()
-        db_session.refresh(db_model)
-        created.append(db_model)
+    created = await bulk_create(
+        db_session,
+        MODELS["recipe_run"].table,
+        [MODELS["recipe_run"].table.from_orm(nm) for nm in new_models],
+    )
     summary = f"Recipe runs created at commit `{head_sha}`:"
     backend_app_webhook_url = await get_app_webhook_url(gh)
     backend_netloc = urlparse(backend_app_webhook_url).netloc
@@ -936,7 +1678,7 @@ async def run_recipe_test(
     reactions_url: str,
     *,
     gh: GitHubAPI,
-    db_session: Session,
+    db_session: AsyncSession,
     gh_kws: dict,
 ):
     """ """
@@ -952,7 +1694,7 @@ async def run_recipe_test(
     # a point of user engagement & a details link to recipe run page on pangeo-forge.org
     try:
         await run(*args, **kws, gh=gh, db_session=db_session)
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
         await gh.post(reactions_url, data={"content": "confused"}, **gh_kws)
         # We don't need to update the recipe_run in the database or handle the trace here,
         # because that's taken care of inside `run`.
@@ -1012,6 +1754,7 @@ async def triage_test_run_complete(
 
 async def triage_prod_run_complete(
     recipe_run: SQLModel,
+    feedstock_spec: str,
     *,
     gh: GitHubAPI,
     gh_kws: dict,
@@ -1019,7 +1762,7 @@ async def triage_prod_run_complete(
     deployment_id = json.loads(recipe_run.message)["deployment_id"]
     environment_url = json.loads(recipe_run.message)["environment_url"]
     await gh.post(
-        f"/repos/{recipe_run.feedstock.spec}/deployments/{deployment_id}/statuses",
+        f"/repos/{feedstock_spec}/deployments/{deployment_id}/statuses",
         # Here's a fun thing we can do because our recipe run model fields are modeled on the
         # GitHub API: pass the recipe_run.conclusion directly through to deployment state.
         data=dict(
@@ -1039,7 +1782,7 @@ async def create_feedstock_repo(
     base_repo_api_url: str,
     *,
     gh: GitHubAPI,
-    db_session: Session,
+    db_session: AsyncSession,
     gh_kws: dict,
 ):
     # (1) check changed files, if we're in a subdir of recipes, then proceed
@@ -1106,7 +1849,7 @@ async def create_feedstock_repo(
     new_fstock_model = MODELS["feedstock"].creation(spec=feedstock_spec)
     db_model = MODELS["feedstock"].table.from_orm(new_fstock_model)
     db_session.add(db_model)
-    db_session.commit()
+    await db_session.commit()
     # (8) merge PR - this deploys prod run via another call to /github/hooks route
     merged = await gh.put(f"/repos/{feedstock_spec}/pulls/{open_pr['number']}/merge", **gh_kws)
     # (9) delete PR branch
@@ -1154,7 +1897,7 @@ async def deploy_prod_run(
     base_ref: str,
     *,
     gh: GitHubAPI,
-    db_session: Session,
+    db_session: AsyncSession,
     gh_kws: dict,
 ):
     # (1) expand meta
@@ -1167,16 +1910,13 @@ async def deploy_prod_run(
     ]
     logger.info(f"Calling subprocess {cmd}")
     try:
-        out = subprocess.check_output(cmd)
-    except subprocess.CalledProcessError as e:
+        async for p in stream_runner_output(cmd):
+            # patch for https://github.com/pangeo-forge/pangeo-forge-orchestrator/issues/132
+            if ("status" in p) and p["status"] == "completed":
+                meta = p["meta"]
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
         # TODO: report this error to users somehow
         raise e
-
-    for line in out.splitlines():
-        p = json.loads(line)
-        # patch for https://github.com/pangeo-forge/pangeo-forge-orchestrator/issues/132
-        if ("status" in p) and p["status"] == "completed":
-            meta = p["meta"]
     logger.debug(f"Retrieved meta: {meta}")
 
     # (2) find the feedstock and bakery in the database
@@ -1184,30 +1924,41 @@ async def deploy_prod_run(
         feedstock_statement = select(MODELS["feedstock"].table).where(
             MODELS["feedstock"].table.spec == base_full_name
         )
-        feedstock = db_session.exec(feedstock_statement).one()
+        feedstock = (await db_session.exec(feedstock_statement)).one()
         bakery_statement = select(MODELS["bakery"].table).where(
             MODELS["bakery"].table.name == meta["bakery"]["id"]
         )
-        bakery = db_session.exec(bakery_statement).one()
+        bakery = (await db_session.exec(bakery_statement)).one()
     except NoResultFound as e:
         # TODO: notify the user of this somehow
         raise e
     logger.debug(f"Found feedstock: {feedstock}")
     logger.debug(f"Found bakery: {bakery}")
 
-    # (3) create recipe runs for every recipe in meta
-    created = []
-    for recipe in meta["recipes"]:
-        gh_deployment = await gh.post(
-            f"{base_api_url}/deployments",
-            data=dict(
-                ref=base_ref,
-                environment=recipe["id"],
-            ),
-            **gh_kws,
-        )
-        logger.debug(f"Created github deployment: {gh_deployment}")
-        model = MODELS["recipe_run"].creation(
+    # TODO: using urllib.parse.parse_qs / urlencode here would be more robust
+    # NOTE: redundant with one other block above. could combine into one function.
+    backend_app_webhook_url = await get_app_webhook_url(gh)
+    backend_netloc = urlparse(backend_app_webhook_url).netloc
+
+    # (3) create a deployment for every recipe in meta. feedstocks can have dozens of recipes, so
+    # we make these requests concurrently (but not so many at once as to get rate limited).
+    recipes = meta["recipes"]
+    deployment_slots = asyncio.Semaphore(get_bake_concurrency())
+
+    async def create_deployment(recipe: dict) -> dict:
+        async with deployment_slots:
+            return await gh.post(
+                f"{base_api_url}/deployments",
+                data=dict(ref=base_ref, environment=recipe["id"]),
+                **gh_kws,
+            )
+
+    gh_deployments = await asyncio.gather(*(create_deployment(r) for r in recipes))
+    logger.debug(f"Created github deployments: {gh_deployments}")
+
+    # (4) create recipe runs for every recipe in meta, all at once
+    new_models = [
+        MODELS["recipe_run"].creation(
             recipe_id=recipe["id"],
             bakery_id=bakery.id,
             feedstock_id=feedstock.id,
@@ -1218,54 +1969,261 @@ async def deploy_prod_run(
             dataset_type="zarr",
             message=json.dumps({"deployment_id": gh_deployment["id"]}),
         )
+        for recipe, gh_deployment in zip(recipes, gh_deployments)
+    ]
+    created = await bulk_create(
+        db_session,
+        MODELS["recipe_run"].table,
+        [MODELS["recipe_run"].table.from_orm(nm) for nm in new_models],
+    )
+    logger.debug(f"Created recipe runs: {created}")
+
+    # (5) deploy every recipe run, concurrently, up to the limit for this bakery. A session can't
+    # be used by more than one task at once, so each deployment gets its own.
+    n_deployed = 0
+
+    async def deploy(recipe_run_id: int):
+        nonlocal n_deployed
+        async with bake_slots(bakery.name):
+            async with AsyncSession(db_session.bind, expire_on_commit=False) as recipe_db_session:
+                recipe_run = await recipe_db_session.get(MODELS["recipe_run"].table, recipe_run_id)
+                await deploy_recipe_run(
+                    base_html_url,
+                    merge_commit_sha,
+                    recipe_run,
+                    feedstock,
+                    base_api_url,
+                    backend_netloc,
+                    gh=gh,
+                    db_session=recipe_db_session,
+                    gh_kws=gh_kws,
+                )
+        n_deployed += 1
+        logger.info(f"Deployed recipe run {recipe_run_id} ({n_deployed}/{len(created)})")
 
-        db_model = MODELS["recipe_run"].table.from_orm(model)
-        db_session.add(db_model)
-        db_session.commit()
-        db_session.refresh(db_model)
-        logger.debug(f"Created recipe run: {gh_deployment}")
-        created.append(db_model)
-
-    # (4) deploy every recipe run; `recipe_run.is_test=False` ensures `run` won't prune.
-    for recipe_run in created:
-        args = (base_html_url, merge_commit_sha, recipe_run, feedstock.spec)
-        logger.info(f"Calling run with args: {args}")
-        try:
-            await run(*args, gh=gh, db_session=db_session)  # type: ignore
-        except subprocess.CalledProcessError:
-            deployment_id = json.loads(recipe_run.message)["deployment_id"]
-            await gh.post(
-                f"{base_api_url}/deployments/{deployment_id}/statuses",
-                data=dict(status="failure"),
-                **gh_kws,
-            )
-        # Don't update recipe_run as "failed" here, that's handled inside `run`.
-        # Don't update recipe_run as "in_progress" here, that's handled inside `run`.
-        # (4.5) Update deployment with link to recipe run page
-        logger.debug("HEREEEEEEEEEEEEEEEEEe")
-        logger.debug(recipe_run.message)
+    results = await asyncio.gather(*(deploy(rr.id) for rr in created), return_exceptions=True)
+    # One deployment failing shouldn't stop the others, but we don't want to swallow the error.
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+async def deploy_recipe_run(
+    base_html_url: str,
+    merge_commit_sha: str,
+    recipe_run: SQLModel,
+    feedstock: SQLModel,
+    base_api_url: str,
+    backend_netloc: str,
+    *,
+    gh: GitHubAPI,
+    db_session: AsyncSession,
+    gh_kws: dict,
+):
+    """Submit one of the recipe runs created by ``deploy_prod_run``, and update its deployment."""
+
+    # `recipe_run.is_test=False` ensures `run` won't prune.
+    args = (base_html_url, merge_commit_sha, recipe_run, feedstock.spec)
+    logger.info(f"Calling run with args: {args}")
+    try:
+        await run(*args, gh=gh, db_session=db_session)  # type: ignore
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
         deployment_id = json.loads(recipe_run.message)["deployment_id"]
-        environment_url = (
-            "https://pangeo-forge.org/dashboard/"
-            f"recipe-run/{recipe_run.id}?feedstock_id={feedstock.id}"
-        )
-        # TODO: using urllib.parse.parse_qs / urlencode here would be more robust
-        # NOTE: redundant with one other block above. could combine into one function.
-        backend_app_webhook_url = await get_app_webhook_url(gh)
-        backend_netloc = urlparse(backend_app_webhook_url).netloc
-        if backend_netloc != DEFAULT_BACKEND_NETLOC:
-            environment_url += f"&orchestratorEndpoint={backend_netloc}"
         await gh.post(
             f"{base_api_url}/deployments/{deployment_id}/statuses",
-            data=dict(
-                state="in_progress",
-                environment_url=environment_url,
-            ),
+            data=dict(status="failure"),
             **gh_kws,
         )
-        message = json.loads(recipe_run.message)
-        # save environment url for reuse when job completes, in `triage_prod_run_complete`
-        recipe_run.message = json.dumps(message | {"environment_url": environment_url})
-        db_session.add(recipe_run)
-        db_session.commit()
-        db_session.refresh(recipe_run)
+    # Don't update recipe_run as "failed" here, that's handled inside `run`.
+    # Don't update recipe_run as "in_progress" here, that's handled inside `run`.
+    # Update deployment with link to recipe run page
+    logger.debug(recipe_run.message)
+    deployment_id = json.loads(recipe_run.message)["deployment_id"]
+    environment_url = (
+        "https://pangeo-forge.org/dashboard/"
+        f"recipe-run/{recipe_run.id}?feedstock_id={feedstock.id}"
+    )
+    if backend_netloc != DEFAULT_BACKEND_NETLOC:
+        environment_url += f"&orchestratorEndpoint={backend_netloc}"
+    await gh.post(
+        f"{base_api_url}/deployments/{deployment_id}/statuses",
+        data=dict(
+            state="in_progress",
+            environment_url=environment_url,
+        ),
+        **gh_kws,
+    )
+    message = json.loads(recipe_run.message)
+    # save environment url for reuse when job completes, in `triage_prod_run_complete`
+    recipe_run.message = json.dumps(message | {"environment_url": environment_url})
+    db_session.add(recipe_run)
+    await db_session.commit()
+    await db_session.refresh(recipe_run)
+
+
+# Jobs --------------------------------------------------------------------------------------------
+
+# Tasks which can be enqueued by `enqueue_task`, by name.
+JOB_TASKS = {
+    task.__name__: task
+    for task in (
+        handle_hook,
+        synchronize,
+        run_recipe_test,
+        triage_test_run_complete,
+        triage_prod_run_complete,
+        create_feedstock_repo,
+        deploy_prod_run,
+    )
+}
+
+# Tasks which are safe to run again from the start, because their only lasting effect (posting to
+# GitHub, or enqueueing other jobs) is their last step. The others create check runs, recipe runs,
+# deployments or Dataflow jobs as they go, which would be duplicated, so are only attempted once.
+RETRYABLE_TASKS = ("handle_hook", "triage_test_run_complete", "triage_prod_run_complete")
+
+# Errors which may well not recur if a job is tried again later. Jobs which fail with any other
+# error (e.g. a recipe which doesn't parse) are not retried.
+RETRYABLE_ERRORS = (
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+    GitHubBroken,
+    RateLimitExceeded,
+    OperationalError,
+)
+
+
+def encode_job_arg(arg: Any) -> Any:
+    # Database models are passed to jobs by id, and re-read when the job is run.
+    if isinstance(arg, MODELS["recipe_run"].table):
+        return {"recipe_run_id": arg.id}
+    return arg
+
+
+async def decode_job_arg(arg: Any, db_session: AsyncSession) -> Any:
+    if isinstance(arg, dict) and list(arg) == ["recipe_run_id"]:
+        return await db_session.get(MODELS["recipe_run"].table, arg["recipe_run_id"])
+    return arg
+
+
+async def enqueue_task(
+    task,
+    *args,
+    db_session: AsyncSession,
+    background_tasks: BackgroundTasks,
+    installation_id: Optional[int] = None,
+    bakery_id: Optional[int] = None,
+) -> jobs.Job:
+    """Enqueue ``task(*args)`` to be run by a worker. The task is also passed the ``gh`` kwarg, and
+    (if it accepts them) ``gh_kws`` authenticated as ``installation_id`` and ``db_session``, when
+    it's run. Unless it's one of the ``RETRYABLE_TASKS``, it's only attempted once.
+
+    :param installation_id: The GitHub App installation to authenticate the task as.
+    :param bakery_id: The bakery the task deploys to, if any, to limit concurrent deployments.
+    """
+
+    job = await jobs.enqueue(
+        db_session,
+        task.__name__,
+        [encode_job_arg(arg) for arg in args],
+        installation_id=installation_id,
+        bakery_id=bakery_id,
+        max_attempts=3 if task.__name__ in RETRYABLE_TASKS else 1,
+    )
+    logger.info(f"Enqueued job {job.id} to call `{job.task}`")
+    if jobs.run_jobs_inline():
+        background_tasks.add_task(run_job, job.id)
+    return job
+
+
+async def run_job(job_id: int):
+    """Claim and run a job in this process. Used when ``jobs.run_jobs_inline()``."""
+
+    async with AsyncSession(async_engine, expire_on_commit=False) as db_session:
+        if job := await jobs.claim(db_session, job_id=job_id):
+            await execute_job(job, db_session, retry=False)
+
+
+async def keep_lease(job_id: int):
+    """Renew a running job's lease until cancelled, so that however long it runs, it isn't taken
+    for abandoned, and run again (see ``jobs.requeue_abandoned``)."""
+
+    while True:
+        await asyncio.sleep(jobs.get_lease_renewal_interval())
+        try:
+            # In a session of its own, because the job's session is in use by its task.
+            async with AsyncSession(async_engine, expire_on_commit=False) as db_session:
+                await jobs.renew_lease(db_session, job_id)
+        except Exception as e:
+            logger.error(f"Failed to renew lease of job {job_id}: {e!r}")
+
+
+async def execute_job(job: jobs.Job, db_session: AsyncSession, retry: bool = True):
+    """Run a claimed job, and record the outcome. Errors are re-raised after they're recorded.
+
+    :param retry: If True, requeue the job if it fails with one of the ``RETRYABLE_ERRORS``.
+    """
+
+    try:
+        task = JOB_TASKS[job.task]
+        gh = get_github_session(http_session())
+        args = [await decode_job_arg(arg, db_session) for arg in json.loads(job.args)]
+        kws: dict[str, Any] = dict(gh=gh)
+        parameters = inspect.signature(task).parameters
+        if "gh_kws" in parameters:
+            # Tokens are minted when the job is run, because one minted when it was enqueued may
+            # have expired by now, if the job was delayed or retried.
+            token = await get_access_token(gh, installation_id=job.installation_id)
+            kws["gh_kws"] = dict(oauth_token=token, accept=ACCEPT)
+        if "db_session" in parameters:
+            kws["db_session"] = db_session
+        lease = asyncio.create_task(keep_lease(job.id))
+        try:
+            await task(*args, **kws)
+        finally:
+            lease.cancel()
+            # The task may have changed rows which cached responses were read from.
+            await response_cache.invalidate()
+    except (Exception, asyncio.CancelledError) as e:
+        # Rolling back expires all loaded models, so reload the job before updating it.
+        await db_session.rollback()
+        await db_session.refresh(job)
+        if isinstance(e, asyncio.CancelledError) and job.max_attempts > 1:
+            logger.info(f"Job {job.id} cancelled, returning it to the queue.")
+            await jobs.release(db_session, job)
+        elif isinstance(e, asyncio.CancelledError):
+            logger.error(f"Job {job.id} cancelled, and can't be retried.")
+            await jobs.fail(db_session, job, repr(e), retry=False)
+        else:
+            logger.error(f"Job {job.id} failed with {e!r}")
+            await jobs.fail(
+                db_session, job, repr(e), retry=retry and isinstance(e, RETRYABLE_ERRORS)
+            )
+        if job.status == jobs.JobStatus.failed:
+            await job_finished(job, e)
+        raise e
+    await jobs.complete(db_session, job)
+    await job_finished(job)
+
+
+async def job_finished(job: jobs.Job, error: Optional[BaseException] = None):
+    """Follow up on a job which has completed, or (if ``error`` is given) failed and won't be
+    retried."""
+
+    if job.task != "handle_hook":
+        return
+    if error is not None and (key := json.loads(job.args)[2]) is not None:
+        # Only now can the webhook be redelivered, without risking it being handled twice.
+        await release_idempotency_key(key)
+    # The status code the webhook would have been answered with, had it been handled before then.
+    if error is None:
+        status_code = status.HTTP_202_ACCEPTED
+    elif isinstance(error, HTTPException):
+        status_code = error.status_code
+    else:
+        status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    try:
+        async with AsyncSession(async_engine, expire_on_commit=False) as log_session:
+            await deliveries.record_job_outcome(log_session, job.id, status_code)
+    except Exception as e:
+        logger.error(f"Failed to record outcome of webhook delivery job {job.id}: {e!r}")
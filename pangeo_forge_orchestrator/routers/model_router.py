@@ -1,11 +1,19 @@
-from typing import Literal
+import base64
+import json
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import and_
-from sqlalchemy.orm import load_only
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, load_only, selectinload, with_parent
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlmodel import Session, asc, desc, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from ..dependencies import check_authentication_header, get_session
+from ..database import bulk_create
+from ..dependencies import check_authentication_header, get_async_session, get_session
 from ..models import MODELS
 
 QUERY_LIMIT = Query(default=100, lte=100, description="Limit the number of results")
@@ -22,41 +30,215 @@ def make_create_endpoint(model):
     ):
         db_model = model.table.from_orm(new_model)
         session.add(db_model)
-        session.commit()
+        try:
+            session.commit()
+        except IntegrityError as e:
+            raise HTTPException(status_code=409, detail=str(e.orig))
         session.refresh(db_model)
         return db_model
 
     return create
 
 
+def make_batch_create_endpoint(model):
+    async def batch_create(
+        *,
+        new_models: list[model.creation],  # type: ignore
+        db_session: AsyncSession = Depends(get_async_session),
+        authorized_user=Depends(check_authentication_header),
+    ):
+        db_models = [model.table.from_orm(nm) for nm in new_models]
+        try:
+            return await bulk_create(db_session, model.table, db_models)
+        except IntegrityError as e:
+            raise HTTPException(status_code=409, detail=str(e.orig))
+
+    return batch_create
+
+
+async def get_batch(db_session: AsyncSession, model, ids: list[int]) -> list:
+    """Get the rows of ``model.table`` with ``ids``, in that order, with a single query. If any of
+    them do not exist, raise a 404 listing every missing id (and its index in ``ids``), so that
+    callers can report all of the failures in a batch at once, rather than just the first.
+    """
+
+    statement = select(model.table).where(model.table.id.in_(ids))
+    db_models = {m.id: m for m in (await db_session.exec(statement)).all()}
+    missing = [dict(index=i, id=id) for i, id in enumerate(ids) if id not in db_models]
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=dict(msg=f"{len(missing)} {model.descriptive_name}(s) not found", items=missing),
+        )
+    return [db_models[id] for id in ids]
+
+
+def make_batch_update_endpoint(model):
+    async def batch_update(
+        *,
+        updated_models: list[model.batch_update],  # type: ignore
+        db_session: AsyncSession = Depends(get_async_session),
+        authorized_user=Depends(check_authentication_header),
+    ):
+        ids = [um.id for um in updated_models]
+        db_models = await get_batch(db_session, model, ids)
+        for db_model, updated_model in zip(db_models, updated_models):
+            model_data = updated_model.dict(exclude_unset=True, exclude={"id"})
+            for key, value in model_data.items():
+                setattr(db_model, key, value)
+            db_session.add(db_model)
+        try:
+            await db_session.commit()
+        except IntegrityError as e:
+            await db_session.rollback()
+            raise HTTPException(status_code=409, detail=str(e.orig))
+        # Reload the updated rows (as stored) with one query, rather than refreshing each in turn.
+        db_session.expire_all()
+        return await get_batch(db_session, model, ids)
+
+    return batch_update
+
+
+def make_batch_delete_endpoint(model):
+    async def batch_delete(
+        *,
+        ids: list[int] = Body(..., description="The ids of the rows to delete"),
+        db_session: AsyncSession = Depends(get_async_session),
+        authorized_user=Depends(check_authentication_header),
+    ):
+        db_models = await get_batch(db_session, model, ids)
+        for db_model in db_models:
+            await db_session.delete(db_model)
+        try:
+            await db_session.commit()
+        except IntegrityError as e:
+            await db_session.rollback()
+            raise HTTPException(status_code=409, detail=str(e.orig))
+        return {"ok": True, "deleted": len(set(ids))}
+
+    return batch_delete
+
+
+def encode_cursor(order_by: str, sort: str, last_row) -> str:
+    """Encode the position after ``last_row`` in a listing, as an opaque string for clients to pass
+    back to get the next page."""
+
+    position = dict(
+        order_by=order_by,
+        sort=sort,
+        value=jsonable_encoder(getattr(last_row, order_by)),
+        id=last_row.id,
+    )
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        position = None
+    if not isinstance(position, dict) or set(position) != {"order_by", "sort", "value", "id"}:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+
+def keyset_filter(model, column, sort: str, value, id: int):
+    """Filter for the rows which follow the position ``(value, id)`` in a listing ordered by
+    ``column`` (with nulls last) and then ``id``, in the ``sort`` direction."""
+
+    def after(a, b):
+        return a > b if sort == "asc" else a < b
+
+    if column is model.table.id:
+        return after(column, id)
+    if value is None:
+        return and_(column.is_(None), after(model.table.id, id))
+    return or_(
+        after(column, value), and_(column == value, after(model.table.id, id)), column.is_(None)
+    )
+
+
 def make_read_range_endpoint(model):
     def read_range(
         *,
         session: Session = Depends(get_session),
+        filters: list = Depends(model.filters),
+        response: Response,
         offset: int = 0,
         limit: int = QUERY_LIMIT,
         order_by: str = Query(None, description="Order by this column"),
         sort: Literal["asc", "desc"] = Query("asc", description="Sort in this direction"),
+        cursor: Optional[str] = Query(
+            None,
+            description=(
+                "Return the page following this cursor, as given in the ``X-Next-Cursor`` header "
+                "of the response for the previous page. Unlike ``offset``, the time this takes does "
+                "not grow with the depth of the page, and pages are consistent under inserts."
+            ),
+        ),
     ):
-        statement = select(model.table)
-        if order_by:
-            column = (
-                asc(getattr(model.table, order_by))
-                if sort == "asc"
-                else desc(getattr(model.table, order_by))
-            )
-            statement = statement.order_by(column)
-        statement = statement.offset(offset).limit(limit)
-        return session.exec(statement).all()
+        order_by = order_by or "id"
+        if order_by not in model.table.__table__.columns:
+            raise HTTPException(status_code=400, detail=f"Can't order by `{order_by}`")
+        column = getattr(model.table, order_by)
+        direction = asc if sort == "asc" else desc
+        # Order by ``id`` as a tie breaker (and, for cursors, with nulls last regardless of the
+        # database's default) so that every row has a unique, stable position to resume after.
+        statement = select(model.table).where(*filters)
+        if column is not model.table.id:
+            statement = statement.order_by(direction(column).nullslast())
+        statement = statement.order_by(direction(model.table.id))
+        if cursor is not None:
+            position = decode_cursor(cursor)
+            if offset or (position["order_by"], position["sort"]) != (order_by, sort):
+                raise HTTPException(
+                    status_code=400,
+                    detail="A cursor must be used with the same `order_by` and `sort` (and no "
+                    "`offset`) as the request it was returned by",
+                )
+            value = position["value"]
+            if value is not None:
+                try:
+                    value = parse_obj_as(model.table.__fields__[order_by].outer_type_, value)
+                except ValueError:
+                    raise HTTPException(status_code=400, detail="Invalid cursor")
+            statement = statement.where(keyset_filter(model, column, sort, value, position["id"]))
+        else:
+            statement = statement.offset(offset)
+        results = session.exec(statement.limit(limit)).all()
+        if results and len(results) == limit:
+            response.headers["X-Next-Cursor"] = encode_cursor(order_by, sort, results[-1])
+        return results
 
     return read_range
 
 
 def make_read_single_endpoint(model):
+    relations = model.relations if model.extended_response else []
+
     def read_single(*, id: int, session: Session = Depends(get_session)):
-        db_model = session.get(model.table, id)
+        # Load the relations included in the extended response up front, as each ``RelationBuilder``
+        # specifies, rather than lazily (with a query per relation) during serialization.
+        loaders = dict(joined=joinedload, selectin=selectinload)
+        options = [
+            loaders[r.load](getattr(model.table, r.field)) for r in relations if r.max_items is None
+        ]
+        db_model = session.get(model.table, id, options=options)
         if not db_model:
             raise HTTPException(status_code=404, detail=f"{model_name} not found")
+        for r in relations:
+            if r.max_items is not None:
+                relation = getattr(model.table, r.field)
+                related = relation.property.mapper.class_
+                statement = (
+                    select(related)
+                    .where(with_parent(db_model, relation))
+                    .order_by(related.id.desc())
+                    .limit(r.max_items)
+                )
+                # the most recent rows, but in ascending order, as when the relation isn't bounded
+                most_recent = session.exec(statement).all()
+                set_committed_value(db_model, r.field, most_recent[::-1])
         return db_model
 
     return read_single
@@ -78,7 +260,10 @@ def make_update_endpoint(model):
         for key, value in model_data.items():
             setattr(db_model, key, value)
         session.add(db_model)
-        session.commit()
+        try:
+            session.commit()
+        except IntegrityError as e:
+            raise HTTPException(status_code=409, detail=str(e.orig))
         session.refresh(db_model)
         return db_model
 
@@ -120,6 +305,30 @@ for model_name, model in MODELS.items():
         summary=f"Read a range of {model.descriptive_name} objects",
         tags=[model.descriptive_name, "public"],
     )
+    # Batch routes must be added before the ``{id}`` routes, which would otherwise match them.
+    router.add_api_route(
+        model.path + "batch",
+        make_batch_create_endpoint(model),
+        methods=["POST"],
+        response_model=list[model.response],  # type: ignore
+        summary=f"Create multiple {model.descriptive_name} objects, in a single transaction",
+        tags=[model.descriptive_name, "admin"],
+    )
+    router.add_api_route(
+        model.path + "batch",
+        make_batch_update_endpoint(model),
+        methods=["PATCH"],
+        response_model=list[model.response],  # type: ignore
+        summary=f"Update multiple {model.descriptive_name} objects, in a single transaction",
+        tags=[model.descriptive_name, "admin"],
+    )
+    router.add_api_route(
+        model.path + "batch",
+        make_batch_delete_endpoint(model),
+        methods=["DELETE"],
+        summary=f"Delete multiple {model.descriptive_name} objects, in a single transaction",
+        tags=[model.descriptive_name, "admin"],
+    )
     router.add_api_route(
         model.path + "{id}",
         make_read_single_endpoint(model),
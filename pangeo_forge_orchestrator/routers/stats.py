@@ -1,14 +1,23 @@
+from collections import Counter
+from datetime import date, datetime
+from enum import Enum
+from typing import Optional
+
 from fastapi import APIRouter, Depends, Query
 from pydantic import BaseModel
-from sqlalchemy import and_, func
-from sqlmodel import Session
+from sqlalchemy import case, func
+from sqlmodel import Session, select
 
+from ..database import as_naive_utc
 from ..dependencies import get_session
 from ..models import MODELS
-
-# TODO: this module is untested!
-# We have deliberately accepted this techincal debt in order to get metrics up working quickly.
-# Once we have some time for maintainance, we need to write tests for these endpoints.
+from ..stats import (
+    RecipeRunDailyStats,
+    RecipeRunHourlyStats,
+    get_stats_snapshot,
+    seconds_between,
+    truncate_datetime,
+)
 
 stats_router = APIRouter()
 
@@ -17,6 +26,100 @@ class StatsResponse(BaseModel):
     count: int
 
 
+class StatsSummaryResponse(BaseModel):
+    refreshed_at: datetime
+    bakeries: int
+    feedstocks: int
+    recipe_runs: int
+    datasets: int
+    production_datasets: int
+    recipe_runs_by_bakery: dict[int, int]
+    recipe_runs_by_status: dict[str, int]
+    recipe_runs_by_conclusion: dict[str, int]
+    recipe_runs_by_day: dict[date, int]
+
+
+class Interval(str, Enum):
+    hour = "hour"
+    day = "day"
+
+
+class DurationsGroupBy(str, Enum):
+    bakery = "bakery"
+    feedstock = "feedstock"
+
+
+class TimeSeriesBucket(BaseModel):
+    bucket: datetime
+    started: int
+    completed: int
+    succeeded: int
+    success_rate: Optional[float]
+
+
+class DurationStats(BaseModel):
+    id: int
+    count: int
+    mean: float
+    p50: float
+    p95: float
+
+
+def is_production_dataset():
+    return (
+        RecipeRunDailyStats.has_dataset
+        & RecipeRunDailyStats.is_test.isnot(True)  # type: ignore
+        & (RecipeRunDailyStats.status == "completed")
+        & (RecipeRunDailyStats.conclusion == "success")
+    )
+
+
+def count_recipe_runs(session: Session, *where) -> int:
+    get_stats_snapshot(session)
+    statement = select(func.coalesce(func.sum(RecipeRunDailyStats.count), 0)).where(*where)
+    return session.exec(statement).one()
+
+
+@stats_router.get(
+    "/stats/",
+    response_model=StatsSummaryResponse,
+    summary="Get all statistics, including breakdowns of recipe runs",
+    tags=["stats"],
+)
+def get_stats_summary(*, session: Session = Depends(get_session)):
+    snapshot = get_stats_snapshot(session)
+    rows = session.exec(select(RecipeRunDailyStats)).all()
+
+    by_bakery: Counter = Counter()
+    by_status: Counter = Counter()
+    by_conclusion: Counter = Counter()
+    by_day: Counter = Counter()
+    datasets = production_datasets = 0
+    for row in rows:
+        by_bakery[row.bakery_id] += row.count
+        by_status[row.status] += row.count
+        if row.conclusion is not None:
+            by_conclusion[row.conclusion] += row.count
+        by_day[row.day] += row.count
+        if row.has_dataset:
+            datasets += row.count
+            if not row.is_test and row.status == "completed" and row.conclusion == "success":
+                production_datasets += row.count
+
+    return StatsSummaryResponse(
+        refreshed_at=snapshot.refreshed_at,
+        bakeries=snapshot.bakeries,
+        feedstocks=snapshot.feedstocks,
+        recipe_runs=sum(by_status.values()),
+        datasets=datasets,
+        production_datasets=production_datasets,
+        recipe_runs_by_bakery=dict(by_bakery),
+        recipe_runs_by_status=dict(by_status),
+        recipe_runs_by_conclusion=dict(by_conclusion),
+        recipe_runs_by_day=dict(sorted(by_day.items())),
+    )
+
+
 @stats_router.get(
     "/stats/recipe_runs",
     response_model=StatsResponse,
@@ -24,8 +127,7 @@ class StatsResponse(BaseModel):
     tags=["stats"],
 )
 def get_recipe_stats(*, session: Session = Depends(get_session)):
-    model = MODELS["recipe_run"]
-    return StatsResponse(count=session.query(func.count(model.table.id)).scalar())
+    return StatsResponse(count=count_recipe_runs(session))
 
 
 @stats_router.get(
@@ -35,8 +137,7 @@ def get_recipe_stats(*, session: Session = Depends(get_session)):
     tags=["stats"],
 )
 def get_bakery_stats(*, session: Session = Depends(get_session)):
-    model = MODELS["bakery"]
-    return StatsResponse(count=session.query(func.count(model.table.id)).scalar())
+    return StatsResponse(count=get_stats_snapshot(session).bakeries)
 
 
 @stats_router.get(
@@ -46,8 +147,7 @@ def get_bakery_stats(*, session: Session = Depends(get_session)):
     tags=["stats"],
 )
 def get_feedstock_stats(*, session: Session = Depends(get_session)):
-    model = MODELS["feedstock"]
-    return StatsResponse(count=session.query(func.count(model.table.id)).scalar())
+    return StatsResponse(count=get_stats_snapshot(session).feedstocks)
 
 
 @stats_router.get(
@@ -61,19 +161,118 @@ def get_dataset_stats(
     session: Session = Depends(get_session),
     exclude_test_runs: bool = Query(False, description="Exclude test runs"),
 ) -> StatsResponse:
-    model = MODELS["recipe_run"]
+    if exclude_test_runs:
+        count = count_recipe_runs(session, is_production_dataset())
+    else:
+        count = count_recipe_runs(session, RecipeRunDailyStats.has_dataset)
+    return StatsResponse(count=count)
+
 
+@stats_router.get(
+    "/stats/recipe_runs/timeseries",
+    response_model=list[TimeSeriesBucket],
+    summary="Get the number of recipe runs started, completed and succeeded per hour or day",
+    tags=["stats"],
+)
+def get_recipe_run_timeseries(
+    *,
+    session: Session = Depends(get_session),
+    interval: Interval = Query(Interval.day, description="Width of each bucket"),
+    start: Optional[datetime] = Query(None, description="Include runs from this hour"),
+    end: Optional[datetime] = Query(None, description="Include runs before this hour"),
+    bakery_id: Optional[int] = None,
+    feedstock_id: Optional[int] = None,
+    exclude_test_runs: bool = Query(False, description="Exclude test runs"),
+):
+    get_stats_snapshot(session)
+    start, end = as_naive_utc(start), as_naive_utc(end)
+    rollup = RecipeRunHourlyStats
+    bucket = truncate_datetime(session, rollup.hour, interval.value).label("bucket")
+    statement = (
+        select(  # type: ignore
+            bucket,
+            func.sum(rollup.started),
+            func.sum(rollup.completed),
+            func.sum(rollup.succeeded),
+        )
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+    if start is not None:
+        statement = statement.where(rollup.hour >= start)
+    if end is not None:
+        statement = statement.where(rollup.hour < end)
+    if bakery_id is not None:
+        statement = statement.where(rollup.bakery_id == bakery_id)
+    if feedstock_id is not None:
+        statement = statement.where(rollup.feedstock_id == feedstock_id)
     if exclude_test_runs:
-        statement = and_(
-            model.table.dataset_public_url.isnot(None),
-            model.table.is_test.isnot(True),
-            model.table.status == "completed",
-            model.table.conclusion == "success",
+        statement = statement.where(rollup.is_test.isnot(True))  # type: ignore
+
+    return [
+        TimeSeriesBucket(
+            bucket=bucket,
+            started=started,
+            completed=completed,
+            succeeded=succeeded,
+            success_rate=succeeded / completed if completed else None,
         )
+        for bucket, started, completed, succeeded in session.exec(statement)
+    ]
 
-        results = session.query(model.table).filter(statement).count()
 
-    else:
-        results = session.query(func.count(model.table.dataset_public_url)).scalar()
+@stats_router.get(
+    "/stats/recipe_runs/durations",
+    response_model=list[DurationStats],
+    summary="Get the mean, median and 95th percentile duration of recipe runs, in seconds",
+    tags=["stats"],
+)
+def get_recipe_run_durations(
+    *,
+    session: Session = Depends(get_session),
+    group_by: DurationsGroupBy = Query(DurationsGroupBy.bakery, description="Group runs by"),
+    start: Optional[datetime] = Query(None, description="Include runs completed from this time"),
+    end: Optional[datetime] = Query(None, description="Include runs completed before this time"),
+    exclude_test_runs: bool = Query(False, description="Exclude test runs"),
+):
+    # Percentiles can't be summed from a rollup, so these are computed from the recipe runs
+    # themselves. To find them portably (SQLite has no ``percentile_cont``), runs are ranked by
+    # duration within each group, and the nearest rank to each percentile picked out.
+    start, end = as_naive_utc(start), as_naive_utc(end)
+    recipe_run = MODELS["recipe_run"].table
+    key = {"bakery": recipe_run.bakery_id, "feedstock": recipe_run.feedstock_id}[group_by.value]
+    duration = seconds_between(session, recipe_run.started_at, recipe_run.completed_at)
+    ranked = select(  # type: ignore
+        key.label("key"),
+        duration.label("duration"),
+        func.row_number().over(partition_by=key, order_by=duration).label("rank"),
+        func.count().over(partition_by=key).label("n"),
+    ).where(recipe_run.status == "completed", recipe_run.completed_at.isnot(None))
+    if start is not None:
+        ranked = ranked.where(recipe_run.completed_at >= start)
+    if end is not None:
+        ranked = ranked.where(recipe_run.completed_at < end)
+    if exclude_test_runs:
+        ranked = ranked.where(recipe_run.is_test.isnot(True))
+    ranked = ranked.subquery()
 
-    return StatsResponse(count=results)
+    def percentile(p: int):
+        # the nearest rank is ceil(p / 100 * n), in integer arithmetic
+        nearest_rank = (p * ranked.c.n + 99) / 100
+        return func.max(case((ranked.c.rank == nearest_rank, ranked.c.duration)))
+
+    statement = (
+        select(  # type: ignore
+            ranked.c.key,
+            func.count(),
+            func.avg(ranked.c.duration),
+            percentile(50),
+            percentile(95),
+        )
+        .group_by(ranked.c.key)
+        .order_by(ranked.c.key)
+    )
+    return [
+        DurationStats(id=id, count=count, mean=mean, p50=p50, p95=p95)
+        for id, count, mean, p50, p95 in session.exec(statement)
+    ]
@@ -1,18 +1,68 @@
 import hmac
+import time
+from typing import Optional
 
 from fastapi import Depends, HTTPException
 from fastapi.security import APIKeyHeader
 from starlette import status
 
-from .config import get_fastapi_config
+from .config import get_app_config_fingerprint, get_fastapi_config
 
 X_API_KEY = APIKeyHeader(name="X-API-Key")
 
 
+class APIKeyStore:
+    """In-memory copy of the currently active API keys, so that authenticating an admin request
+    does not require reading and parsing the secret config file. The keys are reloaded if the
+    config file has changed on disk, which is checked at most once every ``check_interval``
+    seconds (a single ``os.stat`` call).
+
+    :param check_interval: Minimum number of seconds between checks of the config file.
+    """
+
+    def __init__(self, check_interval: float = 5.0):
+        self.check_interval = check_interval
+        self._keys: tuple[bytes, ...] = ()
+        self._fingerprint: Optional[tuple] = None
+        self._checked_at = float("-inf")
+
+    def load(self) -> None:
+        # Fingerprint first, so a change made while we're reading is picked up on the next check.
+        fingerprint = get_app_config_fingerprint()
+        keys = get_fastapi_config().active_api_keys()
+        self._keys = tuple(bytes(k, encoding="utf-8") for k in keys)
+        self._fingerprint = fingerprint
+
+    def clear(self) -> None:
+        self._keys = ()
+        self._fingerprint = None
+        self._checked_at = float("-inf")
+
+    def keys(self) -> tuple[bytes, ...]:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            if self._fingerprint is None or self._fingerprint != get_app_config_fingerprint():
+                self.load()
+        return self._keys
+
+    def is_valid(self, api_key: str) -> bool:
+        candidate = bytes(api_key, encoding="utf-8")
+        # Compare against every active key without short-circuiting, so that response timing
+        # doesn't reveal how many keys there are, or which one (if any) matched.
+        valid = False
+        for key in self.keys():
+            valid |= hmac.compare_digest(candidate, key)
+        return valid
+
+
+api_key_store = APIKeyStore()
+
+
 def check_authentication_header(x_api_key: str = Depends(X_API_KEY)) -> bool:
-    """Takes the X-API-Key header and securely compares it to the current api key."""
+    """Takes the X-API-Key header and securely compares it to the current api key(s)."""
 
-    if hmac.compare_digest(x_api_key, get_fastapi_config().PANGEO_FORGE_API_KEY):
+    if api_key_store.is_valid(x_api_key):
         return True
 
     raise HTTPException(
@@ -0,0 +1,188 @@
+"""Summary tables from which the ``/stats`` routes are served, so that reading stats doesn't require
+counting every recipe run.
+
+``RecipeRunDailyStats`` holds the number of recipe runs for each combination of the day they
+started and the attributes which the stats are broken down by. Every count reported by the
+``/stats`` routes is a sum over (a subset of) its rows, of which there are far fewer than there are
+recipe runs. Likewise, ``RecipeRunHourlyStats`` holds the number of recipe runs started,
+completed and succeeded in each hour, from which time series are summed. The summaries are
+recomputed, with ``GROUP BY`` queries, when they're read and are older than
+``PANGEO_FORGE_STATS_MAX_AGE`` seconds (default 300), so stats may lag behind the database by up to
+that long.
+"""
+
+import os
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import DateTime, case, delete, func, insert, literal, literal_column, type_coerce
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, Session, SQLModel, select
+
+from .models import MODELS
+
+
+class RecipeRunDailyStats(SQLModel, table=True):
+    """The number of recipe runs with each combination of the other fields.
+
+    :param day: The day the recipe runs started (UTC).
+    :param bakery_id: The bakery the recipe runs ran on.
+    :param status: The recipe runs' ``status``.
+    :param conclusion: The recipe runs' ``conclusion``.
+    :param is_test: The recipe runs' ``is_test``.
+    :param has_dataset: Whether the recipe runs have a ``dataset_public_url``.
+    :param count: The number of recipe runs.
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    day: date
+    bakery_id: int
+    status: str
+    conclusion: Optional[str] = None
+    is_test: bool
+    has_dataset: bool
+    count: int
+
+
+class RecipeRunHourlyStats(SQLModel, table=True):
+    """The number of recipe runs started, completed and succeeded in each hour.
+
+    Runs are counted as started in the hour of their ``started_at``, and as completed (and
+    succeeded) in the hour of their ``completed_at``, which are counted in separate rows, so there
+    may be two rows for each combination of the other fields. Always sum over them.
+
+    :param hour: The start of the hour (UTC).
+    :param bakery_id: The bakery the recipe runs ran on.
+    :param feedstock_id: The feedstock the recipe runs belong to.
+    :param is_test: The recipe runs' ``is_test``.
+    :param started: The number of recipe runs started.
+    :param completed: The number of recipe runs completed.
+    :param succeeded: The number of recipe runs completed with a ``conclusion`` of success.
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    hour: datetime = Field(index=True)
+    bakery_id: int
+    feedstock_id: int
+    is_test: bool
+    started: int
+    completed: int
+    succeeded: int
+
+
+class StatsRefresh(SQLModel, table=True):
+    """A single row recording when ``RecipeRunDailyStats`` was last recomputed, along with the
+    totals which aren't broken down further.
+
+    :param refreshed_at: When the stats were last recomputed.
+    :param bakeries: The number of bakeries.
+    :param feedstocks: The number of feedstocks.
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    refreshed_at: datetime
+    bakeries: int
+    feedstocks: int
+
+
+def get_stats_max_age() -> timedelta:
+    return timedelta(seconds=float(os.environ.get("PANGEO_FORGE_STATS_MAX_AGE", 5 * 60)))
+
+
+def truncate_datetime(session: Session, column, interval: str):
+    """Round ``column`` down to the start of the ``interval``, which is "hour" or "day"."""
+
+    if session.get_bind().dialect.name == "postgresql":
+        # Inlined rather than bound, so the expression is identical wherever it's repeated (e.g.
+        # in both SELECT and GROUP BY), as Postgres requires.
+        return func.date_trunc(literal_column(f"'{interval}'"), column)
+    # SQLite compares timestamps as strings, so these must match the format they're stored in
+    fmt = {"hour": "%Y-%m-%d %H:00:00.000000", "day": "%Y-%m-%d 00:00:00.000000"}[interval]
+    return type_coerce(func.strftime(fmt, column), DateTime)
+
+
+def seconds_between(session: Session, start, end):
+    if session.get_bind().dialect.name == "postgresql":
+        return func.extract("epoch", end - start)
+    return (func.julianday(end) - func.julianday(start)) * 86400
+
+
+def is_fresh(snapshot: Optional[StatsRefresh]) -> bool:
+    return snapshot is not None and datetime.utcnow() - snapshot.refreshed_at < get_stats_max_age()
+
+
+def refresh_stats(session: Session) -> StatsRefresh:
+    """Recompute the summary tables, in a single transaction."""
+
+    # Lock the snapshot row (on Postgres), so that concurrent refreshes are serialized rather than
+    # interleaving their deletes and inserts. Once we have the lock, another request may have just
+    # refreshed the stats, in which case there's no need to do so again.
+    snapshot = session.exec(select(StatsRefresh).with_for_update()).first()
+    if is_fresh(snapshot):
+        session.commit()
+        return snapshot  # type: ignore
+
+    recipe_run = MODELS["recipe_run"].table
+    groups = (
+        func.date(recipe_run.started_at),
+        recipe_run.bakery_id,
+        recipe_run.status,
+        recipe_run.conclusion,
+        recipe_run.is_test,
+        recipe_run.dataset_public_url.isnot(None),  # type: ignore
+    )
+    session.execute(delete(RecipeRunDailyStats))
+    session.execute(
+        insert(RecipeRunDailyStats).from_select(
+            ["day", "bakery_id", "status", "conclusion", "is_test", "has_dataset", "count"],
+            select(*groups, func.count()).group_by(*groups),  # type: ignore
+        )
+    )
+
+    hour = truncate_datetime(session, recipe_run.started_at, "hour")
+    started = (hour, recipe_run.bakery_id, recipe_run.feedstock_id, recipe_run.is_test)
+    hour = truncate_datetime(session, recipe_run.completed_at, "hour")
+    completed = (hour, recipe_run.bakery_id, recipe_run.feedstock_id, recipe_run.is_test)
+    succeeded = func.sum(case((recipe_run.conclusion == "success", 1), else_=0))
+    columns = ["hour", "bakery_id", "feedstock_id", "is_test", "started", "completed", "succeeded"]
+    session.execute(delete(RecipeRunHourlyStats))
+    session.execute(
+        insert(RecipeRunHourlyStats).from_select(
+            columns,
+            select(*started, func.count(), literal(0), literal(0)).group_by(*started),  # type: ignore
+        )
+    )
+    session.execute(
+        insert(RecipeRunHourlyStats).from_select(
+            columns,
+            select(*completed, literal(0), func.count(), succeeded)  # type: ignore
+            .where(recipe_run.status == "completed", recipe_run.completed_at.isnot(None))
+            .group_by(*completed),
+        )
+    )
+
+    snapshot = snapshot or StatsRefresh(
+        id=1, refreshed_at=datetime.utcnow(), bakeries=0, feedstocks=0
+    )
+    snapshot.refreshed_at = datetime.utcnow()
+    snapshot.bakeries = session.exec(select(func.count(MODELS["bakery"].table.id))).one()
+    snapshot.feedstocks = session.exec(select(func.count(MODELS["feedstock"].table.id))).one()
+    session.add(snapshot)
+    session.commit()
+    session.refresh(snapshot)
+    return snapshot
+
+
+def get_stats_snapshot(session: Session) -> StatsRefresh:
+    """Return the current snapshot, first refreshing the summary tables if they're out of date."""
+
+    snapshot = session.get(StatsRefresh, 1)
+    if is_fresh(snapshot):
+        return snapshot  # type: ignore
+    try:
+        return refresh_stats(session)
+    except IntegrityError:
+        # Before the first refresh there is no row to lock, so a concurrent request may have
+        # inserted it first, in which case its refresh is as good as ours.
+        session.rollback()
+        return session.get(StatsRefresh, 1)  # type: ignore
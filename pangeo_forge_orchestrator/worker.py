@@ -0,0 +1,99 @@
+"""Worker process which runs the jobs enqueued by the web app (see ``jobs.py``). Start one with::
+
+    python -m pangeo_forge_orchestrator.worker
+
+Any number of workers may be run against the same database. Each runs up to
+``PANGEO_FORGE_WORKER_CONCURRENCY`` jobs at a time, and polls for new jobs every
+``PANGEO_FORGE_WORKER_POLL_INTERVAL`` seconds while idle.
+"""
+
+import asyncio
+import os
+import signal
+from typing import Optional
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import idempotency, jobs
+from .database import async_engine
+from .http import http_session
+from .logging import logger
+from .routers.github_app import execute_job
+
+
+async def run_claimed_job(job_id: int):
+    async with AsyncSession(async_engine, expire_on_commit=False) as db_session:
+        job = await db_session.get(jobs.Job, job_id)
+        logger.info(f"Running job {job.id} (`{job.task}`, attempt {job.attempts})")
+        try:
+            await execute_job(job, db_session)
+        except Exception:
+            pass  # already logged and recorded on the job by `execute_job`
+        else:
+            logger.info(f"Job {job.id} completed")
+
+
+async def work(
+    concurrency: int = 4,
+    poll_interval: float = 2,
+    shutdown_grace: float = 20,
+    stop: Optional[asyncio.Event] = None,
+):
+    """Claim and run jobs until ``stop`` is set. Jobs still running at that point are then given
+    ``shutdown_grace`` seconds to finish, after which they're cancelled and returned to the queue.
+    """
+
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    running: set[asyncio.Task] = set()
+    next_requeue = loop.time()
+
+    while not stop.is_set():
+        job = None
+        async with AsyncSession(async_engine, expire_on_commit=False) as db_session:
+            if loop.time() >= next_requeue:
+                if n := await jobs.requeue_abandoned(db_session):
+                    logger.warning(f"Requeued {n} abandoned job(s)")
+                if n := await idempotency.prune(db_session):
+                    logger.info(f"Pruned {n} expired webhook idempotency key(s)")
+                next_requeue = loop.time() + 60
+            if len(running) < concurrency:
+                job = await jobs.claim(db_session)
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        task = asyncio.create_task(run_claimed_job(job.id))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+    if running:
+        logger.info(f"Waiting up to {shutdown_grace}s for {len(running)} running job(s)")
+        _, pending = await asyncio.wait(running, timeout=shutdown_grace)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def main():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    http_session.start()
+    try:
+        await work(
+            concurrency=int(os.environ.get("PANGEO_FORGE_WORKER_CONCURRENCY", 4)),
+            poll_interval=float(os.environ.get("PANGEO_FORGE_WORKER_POLL_INTERVAL", 2)),
+            stop=stop,
+        )
+    finally:
+        await http_session.stop()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -16,8 +16,13 @@ from sqlmodel import Session, SQLModel
 
 import pangeo_forge_orchestrator
 from pangeo_forge_orchestrator.api import app
+from pangeo_forge_orchestrator.cache import response_cache
 from pangeo_forge_orchestrator.database import maybe_create_db_and_tables
+from pangeo_forge_orchestrator.deliveries import HookDelivery
+from pangeo_forge_orchestrator.idempotency import HookIdempotencyKey, recent_keys
+from pangeo_forge_orchestrator.jobs import Job
 from pangeo_forge_orchestrator.models import MODELS
+from pangeo_forge_orchestrator.stats import RecipeRunDailyStats, RecipeRunHourlyStats, StatsRefresh
 
 from .github_app.fixtures import *  # noqa: F401 F403
 from .interfaces import FastAPITestClientCRUD
@@ -72,7 +77,13 @@ def setup_and_teardown(
     )
     session_mocker.patch.dict(
         os.environ,
-        {"PANGEO_FORGE_DEPLOYMENT": "pytest-deployment"},
+        # Run jobs in the web app process, so that tests don't need to start a worker.
+        # Refresh stats on every read, so that tests see the rows they just created.
+        {
+            "PANGEO_FORGE_DEPLOYMENT": "pytest-deployment",
+            "PANGEO_FORGE_INLINE_JOBS": "true",
+            "PANGEO_FORGE_STATS_MAX_AGE": "0",
+        },
     )
     yield
     # teardown here (none for now)
@@ -225,6 +236,10 @@ def clear_database():
     with Session(engine) as session:
         for k in MODELS:
             clear_table(session, MODELS[k].table)  # make sure the database is empty
+        clear_table(session, Job)
+        clear_table(session, HookDelivery)
+        for table in (RecipeRunDailyStats, RecipeRunHourlyStats, StatsRefresh):
+            clear_table(session, table)
 
 
 @pytest.fixture(scope="session")
@@ -239,6 +254,43 @@ def session():
     with Session(engine) as session:
         for k in MODELS:
             clear_table(session, MODELS[k].table)  # make sure the database is empty
+        clear_table(session, Job)
+        clear_table(session, HookDelivery)
+        for table in (RecipeRunDailyStats, RecipeRunHourlyStats, StatsRefresh):
+            clear_table(session, table)
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """Cached responses would otherwise outlive the database rows they were read from, which are
+    cleared between tests without going through the API."""
+
+    response_cache.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def clear_idempotency_keys():
+    """Tests reuse the same webhook payloads, which would otherwise be ignored as duplicates."""
+
+    from pangeo_forge_orchestrator.database import engine
+
+    recent_keys.clear()
+    with Session(engine) as session:
+        session.query(HookIdempotencyKey).delete()
+        session.commit()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def check_connections_returned():
+    """Every database session opened during a test must be closed by the end of it, otherwise
+    connections leak from the (finite) connection pool, and later requests time out waiting."""
+
+    from pangeo_forge_orchestrator.database import engine
+
+    yield
+    assert engine.pool.checkedout() == 0
 
 
 # the next two fixtures use the session fixture to clear the database
@@ -5,6 +5,12 @@ import json
 import pytest
 
 from pangeo_forge_orchestrator.http import HttpSession
+from pangeo_forge_orchestrator.routers.github_app import (
+    app_installations,
+    app_jwts,
+    app_webhook_url,
+    installation_tokens,
+)
 
 from .mock_gidgethub import MockGitHubAPI, _MockGitHubBackend
 
@@ -34,6 +40,17 @@ def get_mock_github_session(mock_github_backend: _MockGitHubBackend):
     return _get_mock_github_session
 
 
+@pytest.fixture(autouse=True)
+def clear_github_app_caches():
+    """GitHub App credentials are cached process-wide, but each test has its own mock backend."""
+
+    app_installations.clear()
+    app_jwts.clear()
+    app_webhook_url.clear()
+    installation_tokens.clear()
+    yield
+
+
 @pytest.fixture(params=["https://api.pangeo-forge.org", "https://api-staging.pangeo-forge.org"])
 def api_url(request):
     return request.param
@@ -25,7 +25,9 @@ class _MockGitHubBackend:
     _accessible_repos: Optional[list[dict]] = None
     _repositories: Optional[dict[str, dict]] = None
     _app_hook_deliveries: Optional[list[dict]] = None
+    _app_hook_deliveries_read: int = 0  # how many were yielded by ``getiter``
     _app_installations: Optional[list[dict]] = None
+    _repo_installations: Optional[dict[str, int]] = None
     _check_runs: Optional[list[dict]] = None
     _pulls: Optional[dict[str, dict[int, dict]]] = None
     _pulls_files: Optional[dict[str, dict[int, dict]]] = None
@@ -56,6 +58,10 @@ class MockGitHubAPI:
                 commit_sha = path.split("/commits/")[-1].split("/check-runs")[0]
                 check_runs = [c for c in self._backend._check_runs if c["head_sha"] == commit_sha]
                 return {"total_count": len(check_runs), "check_runs": check_runs}
+            elif path.endswith("/installation"):
+                # mocks getting the installation for a repo. see ``InstallationIndex``
+                repo_full_name = path.replace("/repos/", "").replace("/installation", "")
+                return {"id": self._backend._repo_installations[repo_full_name]}
             elif path.endswith("branches/main"):
                 # mocks getting a branch. used in create_feedstock_repo background task
                 return {"commit": {"sha": "abcdefg"}}
@@ -96,12 +102,13 @@ class MockGitHubAPI:
         jwt: Optional[str] = None,
         oauth_token: Optional[str] = None,
     ):
-        if path == "/app/hook/deliveries":
-            for delivery in self._backend._app_hook_deliveries:
-                yield delivery
-        elif path == "/app/installations":
+        if path == "/app/installations":
             for installation in self._backend._app_installations:
                 yield installation
+        elif path.startswith("/app/hook/deliveries?"):
+            for delivery in self._backend._app_hook_deliveries:
+                self._backend._app_hook_deliveries_read += 1
+                yield delivery
         elif path.endswith("/pulls"):
             for pr in self._backend._pulls:
                 yield pr
@@ -49,3 +49,19 @@ def mock_subprocess_check_output(cmd: list[str]):
             f"Command {cmd} does not begin with 'pangeo-forge-runner'. Currently, "
             "'pangeo-forge-runner' is the only command line mock implemented."
         )
+
+
+def mock_stream_runner_output(check_output):
+    """Adapt one of the ``check_output`` mocks above into a mock of ``stream_runner_output``."""
+
+    async def stream_runner_output(cmd: list[str]):
+        try:
+            out = check_output(cmd)
+        except CalledProcessError as e:
+            for line in e.output.splitlines():
+                yield json.loads(line)
+            raise e
+        for line in out.splitlines():
+            yield json.loads(line)
+
+    return stream_runner_output
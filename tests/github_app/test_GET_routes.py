@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 
 import pytest
@@ -62,6 +63,47 @@ async def test_get_all_deliveries(
     assert response.json() == app_hook_deliveries
 
 
+@pytest.mark.asyncio
+async def test_get_deliveries_paginated(mocker, app_hook_deliveries, async_app_client):
+    gh_backend = _MockGitHubBackend(_app_hook_deliveries=app_hook_deliveries)
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "get_github_session",
+        get_mock_github_session(gh_backend),
+    )
+    response = await async_app_client.get("/github/hooks/deliveries?limit=1")
+    assert response.json() == app_hook_deliveries[:1]
+    # deliveries stop being read from GitHub once there are enough
+    assert gh_backend._app_hook_deliveries_read == 1
+    cursor = response.headers["X-Next-Cursor"]
+    assert cursor == str(app_hook_deliveries[0]["id"])
+
+    response = await async_app_client.get(f"/github/hooks/deliveries?limit=1&cursor={cursor}")
+    assert response.json() == app_hook_deliveries[1:]
+    cursor = response.headers["X-Next-Cursor"]
+    response = await async_app_client.get(f"/github/hooks/deliveries?limit=1&cursor={cursor}")
+    assert response.json() == []
+    assert "X-Next-Cursor" not in response.headers  # that was the last page
+
+    response = await async_app_client.get("/github/hooks/deliveries?cursor=v1_abc")
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_get_deliveries_ndjson(mocker, app_hook_deliveries, async_app_client):
+    gh_backend = _MockGitHubBackend(_app_hook_deliveries=app_hook_deliveries)
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "get_github_session",
+        get_mock_github_session(gh_backend),
+    )
+    headers = {"Accept": "application/x-ndjson"}
+    response = await async_app_client.get("/github/hooks/deliveries", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == app_hook_deliveries
+
+
 @pytest_asyncio.fixture
 async def feedstock_deliveries_fixture(api_key, async_app_client, app_hook_deliveries):
     admin_headers = {"X-API-Key": api_key}
@@ -104,6 +146,21 @@ async def test_get_feedstock_deliveries(
     assert response.status_code == 200
     assert response.json() == app_hook_deliveries
 
+    # deliveries from other repositories are skipped
+    gh_backend._app_hook_deliveries = [
+        d | {"repository_id": d["repository_id"] + i} for i, d in enumerate(app_hook_deliveries)
+    ]
+    headers = {"Accept": "application/x-ndjson"}
+    response = await async_app_client.get("/feedstocks/1/deliveries", headers=headers)
+    assert [json.loads(line) for line in response.text.splitlines()] == app_hook_deliveries[:1]
+
+    # deliveries are read until there are enough from the repository
+    gh_backend._app_hook_deliveries.reverse()
+    gh_backend._app_hook_deliveries_read = 0
+    response = await async_app_client.get("/feedstocks/1/deliveries?limit=1")
+    assert response.json() == app_hook_deliveries[:1]
+    assert gh_backend._app_hook_deliveries_read == 2
+
 
 @pytest.mark.asyncio
 async def test_get_delivery(
@@ -2,6 +2,8 @@ import pytest
 import pytest_asyncio
 
 import pangeo_forge_orchestrator
+from pangeo_forge_orchestrator.http import http_session
+from pangeo_forge_orchestrator.routers.github_app import get_app_webhook_url
 
 from .fixtures import _MockGitHubBackend, add_hash_signature, get_mock_github_session
 
@@ -36,3 +38,37 @@ async def test_receive_check_suite_request(
         headers=check_suite_request["headers"],
     )
     assert response.json() == {"status": "ok"}
+
+
+@pytest_asyncio.fixture
+async def meta_request_fixture(webhook_secret):
+    headers = {"X-GitHub-Event": "meta"}
+    payload = {"action": "deleted", "hook_id": 123456}
+    event_request = {"headers": headers, "payload": payload}
+    gh_backend_kws = {"_app_hook_config_url": "https://api.pangeo-forge.org/github/hooks/"}
+    yield add_hash_signature(event_request, webhook_secret), _MockGitHubBackend(**gh_backend_kws)
+
+
+@pytest.mark.asyncio
+async def test_receive_meta_request_clears_webhook_url(
+    mocker,
+    async_app_client,
+    meta_request_fixture,
+):
+    meta_request, gh_backend = meta_request_fixture
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "get_github_session",
+        get_mock_github_session(gh_backend),
+    )
+    mock_gh = get_mock_github_session(gh_backend)(http_session)
+    assert await get_app_webhook_url(mock_gh) == "https://api.pangeo-forge.org/github/hooks/"
+
+    gh_backend._app_hook_config_url = "https://api-new.pangeo-forge.org/github/hooks/"
+    response = await async_app_client.post(
+        "/github/hooks/",
+        json=meta_request["payload"],
+        headers=meta_request["headers"],
+    )
+    assert response.json() == {"status": "ok"}
+    assert await get_app_webhook_url(mock_gh) == "https://api-new.pangeo-forge.org/github/hooks/"
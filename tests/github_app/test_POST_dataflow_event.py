@@ -4,8 +4,11 @@ from urllib.parse import parse_qs, urlencode
 
 import pytest
 import pytest_asyncio
+from sqlmodel import Session, select
 
 import pangeo_forge_orchestrator
+from pangeo_forge_orchestrator.database import engine
+from pangeo_forge_orchestrator.jobs import Job, JobStatus
 
 from ..conftest import clear_database
 from .fixtures import _MockGitHubBackend, add_hash_signature, get_mock_github_session
@@ -198,3 +201,54 @@ async def test_receive_dataflow_request(
         assert recipe_run_response.status_code == 200
         assert recipe_run_response.json()["status"] == "completed"
         assert recipe_run_response.json()["conclusion"] == decoded_payload["conclusion"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "dataflow_request_fixture",
+    [
+        dict(
+            feedstock_spec="pangeo-forge/staged-recipes",
+            recipe_run_id=1,
+            is_test=True,
+            recipe_run_message=None,
+            conclusion="success",
+        ),
+    ],
+    indirect=True,
+)
+async def test_receive_dataflow_request_fast_ack(
+    mocker,
+    monkeypatch,
+    async_app_client,
+    dataflow_request_fixture,
+):
+    monkeypatch.setenv("PANGEO_FORGE_FAST_ACK_HOOKS", "true")
+    dataflow_request, gh_backend = dataflow_request_fixture
+    # dataflow events don't say which installation they're for, so it must be found from the
+    # recipe run's feedstock, rather than guessed
+    gh_backend._app_installations = [{"id": 1234567}, {"id": 7654321}]
+    gh_backend._repo_installations = {"pangeo-forge/staged-recipes": 1234567}
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "get_github_session",
+        get_mock_github_session(gh_backend),
+    )
+
+    response = await async_app_client.post(
+        "/github/hooks/",
+        data=dataflow_request["payload"],
+        headers=dataflow_request["headers"],
+    )
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+
+    recipe_run_response = await async_app_client.get("/recipe_runs/1")
+    assert recipe_run_response.json()["status"] == "completed"
+    assert recipe_run_response.json()["conclusion"] == "success"
+    with Session(engine) as session:
+        handled = session.exec(select(Job).order_by(Job.id)).all()
+    assert [(job.task, job.installation_id, job.status) for job in handled] == [
+        ("handle_hook", None, JobStatus.completed),
+        ("triage_test_run_complete", 1234567, JobStatus.completed),
+    ]
@@ -0,0 +1,92 @@
+import pytest
+import pytest_asyncio
+
+import pangeo_forge_orchestrator
+from pangeo_forge_orchestrator.http import http_session
+from pangeo_forge_orchestrator.routers.github_app import (
+    CachedToken,
+    app_installations,
+    installation_tokens,
+)
+
+from .fixtures import _MockGitHubBackend, add_hash_signature, get_mock_github_session
+
+
+@pytest_asyncio.fixture
+async def installation_request_fixture(webhook_secret, request):
+    headers = {"X-GitHub-Event": request.param["event"]}
+    payload = {"action": request.param["action"], "installation": {"id": 7654321}}
+    payload |= request.param.get("payload", {})
+    event_request = {"headers": headers, "payload": payload}
+
+    gh_backend_kws = {
+        "_app_installations": [{"id": 1234567}],
+    }
+    yield add_hash_signature(event_request, webhook_secret), _MockGitHubBackend(**gh_backend_kws)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "installation_request_fixture",
+    [
+        dict(
+            event="installation",
+            action="created",
+            payload={"repositories": [{"full_name": "pforgetest/gpcp-feedstock"}]},
+        ),
+        dict(event="installation", action="deleted"),
+        dict(
+            event="installation_repositories",
+            action="added",
+            payload={"repositories_added": [{"full_name": "pforgetest/gpcp-feedstock"}]},
+        ),
+        dict(
+            event="installation_repositories",
+            action="removed",
+            payload={"repositories_removed": [{"full_name": "pforgetest/gpcp-feedstock"}]},
+        ),
+    ],
+    indirect=True,
+)
+async def test_receive_installation_request(
+    mocker,
+    async_app_client,
+    installation_request_fixture,
+):
+    installation_request, gh_backend = installation_request_fixture
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "get_github_session",
+        get_mock_github_session(gh_backend),
+    )
+    mock_gh = get_mock_github_session(gh_backend)(http_session)
+    # populate the index (and token cache) before the event arrives
+    assert await app_installations.get_installation_ids(mock_gh) == [1234567]
+    installation_tokens._tokens[7654321] = CachedToken(token="ghs_abc", expires_at=2e9)
+
+    response = await async_app_client.post(
+        "/github/hooks/",
+        json=installation_request["payload"],
+        headers=installation_request["headers"],
+    )
+    assert response.status_code == 202
+    assert response.json() == {"status": "ok"}
+
+    event = installation_request["headers"]["X-GitHub-Event"]
+    action = installation_request["payload"]["action"]
+    gpcp_installation_id = await app_installations.get_installation_id(
+        mock_gh, "pforgetest/gpcp-feedstock"
+    )
+    if event == "installation" and action == "created":
+        assert await app_installations.get_installation_ids(mock_gh) == [1234567, 7654321]
+        assert gpcp_installation_id == 7654321
+    elif event == "installation" and action == "deleted":
+        assert await app_installations.get_installation_ids(mock_gh) == [1234567]
+        assert 7654321 not in installation_tokens._tokens
+    elif action == "added":
+        assert gpcp_installation_id == 7654321
+    elif action == "removed":
+        # falls back to the app's only installation
+        assert gpcp_installation_id == 1234567
+    # none of these events should have caused another call to `/app/installations`
+    assert app_installations.lookups == 1
@@ -1,5 +1,3 @@
-import subprocess
-
 import pytest
 import pytest_asyncio
 
@@ -7,7 +5,10 @@ import pangeo_forge_orchestrator
 
 from ..conftest import clear_database
 from .fixtures import _MockGitHubBackend, add_hash_signature, get_mock_github_session
-from .mock_pangeo_forge_runner import mock_subprocess_check_output
+from .mock_pangeo_forge_runner import (
+    mock_stream_runner_output,
+    mock_subprocess_check_output,
+)
 
 
 @pytest.fixture
@@ -201,7 +202,11 @@ async def test_receive_pr_merged_request(
         existing_feedstocks = await async_app_client.get("/feedstocks/")
         assert existing_feedstocks.json() == []
     elif base_repo_full_name.endswith("-feedstock"):
-        mocker.patch.object(subprocess, "check_output", mock_subprocess_check_output)
+        mocker.patch.object(
+            pangeo_forge_orchestrator.routers.github_app,
+            "stream_runner_output",
+            mock_stream_runner_output(mock_subprocess_check_output),
+        )
 
     response = await async_app_client.post(
         "/github/hooks/",
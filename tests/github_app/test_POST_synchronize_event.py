@@ -10,7 +10,10 @@ from pangeo_forge_orchestrator.routers.github_app import DEFAULT_BACKEND_NETLOC
 
 from ..conftest import clear_database
 from .fixtures import _MockGitHubBackend, add_hash_signature, get_mock_github_session
-from .mock_pangeo_forge_runner import mock_subprocess_check_output
+from .mock_pangeo_forge_runner import (
+    mock_stream_runner_output,
+    mock_subprocess_check_output,
+)
 
 
 @pytest_asyncio.fixture
@@ -191,7 +194,11 @@ async def test_receive_synchronize_request(
             output = "\n".join([json.dumps(line) for line in loglines])
             raise subprocess.CalledProcessError(1, cmd, output)
 
-        mocker.patch.object(subprocess, "check_output", mock_subprocess_check_output_raises)
+        mocker.patch.object(
+            pangeo_forge_orchestrator.routers.github_app,
+            "stream_runner_output",
+            mock_stream_runner_output(mock_subprocess_check_output_raises),
+        )
         with pytest.raises(ValueError, match=rf"{error_type}: error msg"):
             response = await async_app_client.post(
                 "/github/hooks/",
@@ -199,7 +206,11 @@ async def test_receive_synchronize_request(
                 headers=synchronize_request["headers"],
             )
     else:
-        mocker.patch.object(subprocess, "check_output", mock_subprocess_check_output)
+        mocker.patch.object(
+            pangeo_forge_orchestrator.routers.github_app,
+            "stream_runner_output",
+            mock_stream_runner_output(mock_subprocess_check_output),
+        )
         response = await async_app_client.post(
             "/github/hooks/",
             json=synchronize_request["payload"],
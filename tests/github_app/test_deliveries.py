@@ -0,0 +1,181 @@
+import json
+from datetime import timedelta
+
+import pytest
+import pytest_asyncio
+from sqlmodel import Session, select
+
+import pangeo_forge_orchestrator
+from pangeo_forge_orchestrator.database import engine
+from pangeo_forge_orchestrator.deliveries import HookDelivery
+
+from ..conftest import clear_database
+from .fixtures import _MockGitHubBackend, add_hash_signature, get_mock_github_session
+
+
+@pytest_asyncio.fixture
+async def post_hook(mocker, async_app_client, webhook_secret):
+    clear_database()
+    gh_backend = _MockGitHubBackend(_app_installations=[{"id": 1234567}])
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "get_github_session",
+        get_mock_github_session(gh_backend),
+    )
+
+    async def _post_hook(event: str, guid: str, repository: str = "pangeo-forge/a-feedstock"):
+        payload = {
+            "action": "requested",
+            "installation": {"id": 1234567},
+            "repository": {"id": len(repository), "full_name": repository},
+        }
+        request = {"headers": {"X-GitHub-Event": event, "X-GitHub-Delivery": guid}}
+        request = add_hash_signature(request | {"payload": payload}, webhook_secret)
+        return await async_app_client.post(
+            "/github/hooks/", json=request["payload"], headers=request["headers"]
+        )
+
+    yield _post_hook
+    clear_database()
+
+
+@pytest.mark.asyncio
+async def test_deliveries_are_logged(async_app_client, post_hook):
+    assert (await post_hook("check_suite", "guid-0")).status_code == 202
+    assert (await post_hook("not_an_event", "guid-1")).status_code == 501
+
+    response = await async_app_client.get("/github/hooks/deliveries?source=local")
+    assert response.status_code == 200
+    logged = response.json()
+    assert [(d["guid"], d["event"], d["status_code"]) for d in logged] == [
+        ("guid-1", "not_an_event", 501),
+        ("guid-0", "check_suite", 202),
+    ]
+    assert logged[0]["action"] == "requested"
+    assert logged[0]["installation_id"] == 1234567
+    assert logged[0]["repository"] == "pangeo-forge/a-feedstock"
+    assert logged[0]["duration"] >= 0
+    assert len(logged[0]["payload_sha256"]) == 64
+    assert "payload" not in logged[0]
+
+
+@pytest.mark.asyncio
+async def test_logged_deliveries_paginated(async_app_client, post_hook):
+    for i in range(3):
+        await post_hook("check_suite", f"guid-{i}")
+
+    guids, cursor = [], ""
+    while True:
+        response = await async_app_client.get(
+            f"/github/hooks/deliveries?source=local&limit=2{cursor}"
+        )
+        guids += [d["guid"] for d in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        cursor = f"&cursor={response.headers['X-Next-Cursor']}"
+    assert guids == ["guid-2", "guid-1", "guid-0"]
+
+    response = await async_app_client.get("/github/hooks/deliveries?source=local&cursor=v1_abc")
+    assert response.status_code == 422
+
+    headers = {"Accept": "application/x-ndjson"}
+    response = await async_app_client.get("/github/hooks/deliveries?source=local", headers=headers)
+    assert [json.loads(line)["guid"] for line in response.text.splitlines()] == guids
+
+
+@pytest.mark.asyncio
+async def test_feedstock_logged_deliveries(async_app_client, post_hook, api_key):
+    response = await async_app_client.post(
+        "/feedstocks/",
+        json={"spec": "pangeo-forge/a-feedstock"},
+        headers={"X-API-Key": api_key},
+    )
+    feedstock_id = response.json()["id"]
+    await post_hook("check_suite", "guid-0")
+    await post_hook("check_suite", "guid-1", repository="pangeo-forge/b-feedstock")
+
+    response = await async_app_client.get(f"/feedstocks/{feedstock_id}/deliveries?source=local")
+    assert [d["guid"] for d in response.json()] == ["guid-0"]
+
+    response = await async_app_client.get(f"/feedstocks/{feedstock_id + 1}/deliveries?source=local")
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("retain", [True, False])
+@pytest.mark.asyncio
+async def test_payload_retention(post_hook, monkeypatch, retain):
+    monkeypatch.setenv("PANGEO_FORGE_RETAIN_HOOK_PAYLOADS", str(retain).lower())
+    await post_hook("check_suite", "guid-0")
+
+    with Session(engine) as session:
+        delivery = session.exec(select(HookDelivery)).one()
+    if retain:
+        assert json.loads(delivery.payload)["repository"]["full_name"] == "pangeo-forge/a-feedstock"
+    else:
+        assert delivery.payload is None
+
+
+@pytest_asyncio.fixture
+async def replayable(post_hook, monkeypatch):
+    monkeypatch.setenv("PANGEO_FORGE_RETAIN_HOOK_PAYLOADS", "true")
+    await post_hook("check_suite", "guid-0")
+    await post_hook("not_an_event", "guid-1")
+    with Session(engine) as session:
+        return session.exec(select(HookDelivery).order_by(HookDelivery.id)).all()
+
+
+@pytest.mark.asyncio
+async def test_replay_requires_authentication(async_app_client, replayable):
+    response = await async_app_client.post("/github/hooks/replay", json={})
+    assert response.status_code in (401, 403)
+
+
+@pytest.mark.asyncio
+async def test_replay_dry_run(async_app_client, replayable, api_key):
+    response = await async_app_client.post(
+        "/github/hooks/replay",
+        json={"failed": True, "dry_run": True},
+        headers={"X-API-Key": api_key},
+    )
+    assert response.status_code == 200
+    assert [d["guid"] for d in response.json()["deliveries"]] == ["guid-1"]
+    assert response.json()["results"] == []
+    with Session(engine) as session:
+        assert len(session.exec(select(HookDelivery)).all()) == 2  # nothing replayed
+
+
+@pytest.mark.asyncio
+async def test_replay(async_app_client, replayable, api_key):
+    response = await async_app_client.post(
+        "/github/hooks/replay",
+        json={"repeat": 2, "rate": 20},
+        headers={"X-API-Key": api_key},
+    )
+    assert response.status_code == 200
+    replay = response.json()
+    ids = [d.id for d in replayable]
+    assert [(r["delivery_id"], r["status_code"]) for r in replay["results"]] == [
+        (ids[0], 202),
+        (ids[1], 501),
+        (ids[0], 202),
+        (ids[1], 501),
+    ]
+    assert 0 <= replay["duration_p50"] <= replay["duration_p95"]
+
+    with Session(engine) as session:
+        redeliveries = session.exec(select(HookDelivery).where(HookDelivery.redelivery)).all()
+    assert sorted(d.guid for d in redeliveries) == ["guid-0", "guid-0", "guid-1", "guid-1"]
+    assert {d.payload_sha256 for d in redeliveries} == {d.payload_sha256 for d in replayable}
+    # started at 20 per second
+    assert max(d.delivered_at for d in redeliveries) - min(
+        d.delivered_at for d in redeliveries
+    ) >= timedelta(seconds=0.14)
+
+
+@pytest.mark.asyncio
+async def test_deliveries_without_payloads_are_not_replayed(async_app_client, post_hook, api_key):
+    await post_hook("check_suite", "guid-0")
+    response = await async_app_client.post(
+        "/github/hooks/replay", json={}, headers={"X-API-Key": api_key}
+    )
+    assert response.json()["deliveries"] == []
@@ -0,0 +1,194 @@
+from datetime import timedelta
+from http import HTTPStatus
+
+import pytest
+import pytest_asyncio
+from gidgethub import GitHubBroken
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import pangeo_forge_orchestrator
+from pangeo_forge_orchestrator import deliveries, jobs
+from pangeo_forge_orchestrator.database import async_engine, engine
+from pangeo_forge_orchestrator.routers.github_app import JOB_TASKS, execute_job
+
+from ..conftest import clear_database
+from .fixtures import _MockGitHubBackend, add_hash_signature, get_mock_github_session
+
+
+def pr_payload(title: str) -> dict:
+    repo = "pangeo-forge/a-feedstock"
+    return {
+        "action": "synchronize",
+        "installation": {"id": 1234567},
+        "repository": {"id": 1, "full_name": repo},
+        "pull_request": {
+            "number": 1,
+            "title": title,
+            "base": {
+                "repo": {
+                    "full_name": repo,
+                    "url": f"https://api.github.com/repos/{repo}",
+                },
+            },
+            "head": {
+                "repo": {"html_url": "https://github.com/contributor/a-feedstock"},
+                "sha": "abc",
+            },
+        },
+    }
+
+
+@pytest_asyncio.fixture
+async def post_hook(mocker, async_app_client, webhook_secret, monkeypatch):
+    clear_database()
+    monkeypatch.setenv("PANGEO_FORGE_FAST_ACK_HOOKS", "true")
+    gh_backend = _MockGitHubBackend(_app_installations=[{"id": 1234567}])
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "get_github_session",
+        get_mock_github_session(gh_backend),
+    )
+
+    async def _post_hook(event: str, guid: str, payload: dict):
+        request = {"headers": {"X-GitHub-Event": event, "X-GitHub-Delivery": guid}}
+        request = add_hash_signature(request | {"payload": payload}, webhook_secret)
+        return await async_app_client.post(
+            "/github/hooks/", json=request["payload"], headers=request["headers"]
+        )
+
+    yield _post_hook
+    clear_database()
+
+
+@pytest.fixture
+def get_access_token(mocker):
+    return mocker.spy(pangeo_forge_orchestrator.routers.github_app, "get_access_token")
+
+
+@pytest.mark.asyncio
+async def test_acknowledged_before_calling_github(
+    async_app_client, post_hook, get_access_token, monkeypatch, api_key
+):
+    monkeypatch.setenv("PANGEO_FORGE_INLINE_JOBS", "false")
+    response = await post_hook("pull_request", "guid-0", pr_payload("Cleanup a-feedstock"))
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    assert get_access_token.call_count == 0
+
+    async with AsyncSession(async_engine, expire_on_commit=False) as db_session:
+        job = await jobs.claim(db_session)
+        assert job.id == response.json()["job_id"]
+        assert job.task == "handle_hook"
+        await execute_job(job, db_session)
+        assert job.status == jobs.JobStatus.completed
+    assert get_access_token.call_count > 0
+
+    response = await async_app_client.get("/github/hooks/latency", headers={"X-API-Key": api_key})
+    assert response.status_code == 200
+    latency = response.json()
+    for stage in ("ack", "queued", "processing"):
+        assert latency[stage]["count"] == latency[stage]["buckets"]["+Inf"] == 1
+        assert latency[stage]["sum"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_jobs_enqueued_by_handler_are_run(post_hook, mocker):
+    calls = []
+
+    async def synchronize(*args, gh, gh_kws):
+        calls.append(args)
+
+    mocker.patch.dict(JOB_TASKS, {"synchronize": synchronize})
+    response = await post_hook("pull_request", "guid-0", pr_payload("Add a dataset"))
+    assert response.json()["status"] == "queued"
+    assert calls == [
+        (
+            "https://github.com/contributor/a-feedstock",
+            "abc",
+            1,
+            "https://api.github.com/repos/pangeo-forge/a-feedstock",
+            "pangeo-forge/a-feedstock",
+        )
+    ]
+
+
+@pytest.mark.asyncio
+async def test_failed_handling_releases_idempotency_key(post_hook, mocker):
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "handle_pr_event",
+        side_effect=ValueError("error msg"),
+    )
+    # Jobs run inline in tests, so the handler's error is raised here, after acknowledgement.
+    with pytest.raises(ValueError, match="error msg"):
+        await post_hook("pull_request", "guid-0", pr_payload("Add a dataset"))
+    with pytest.raises(ValueError, match="error msg"):
+        await post_hook("pull_request", "guid-0", pr_payload("Add a dataset"))  # not a duplicate
+
+    with Session(engine) as session:
+        handled = session.exec(select(jobs.Job)).all()
+    assert [job.status for job in handled] == [jobs.JobStatus.failed] * 2
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_kept_while_job_may_be_retried(post_hook, mocker, monkeypatch):
+    monkeypatch.setenv("PANGEO_FORGE_INLINE_JOBS", "false")
+    monkeypatch.setattr(jobs, "backoff", lambda attempts: timedelta(0))
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "handle_pr_event",
+        side_effect=GitHubBroken(HTTPStatus.SERVICE_UNAVAILABLE),
+    )
+    payload = pr_payload("Add a dataset")
+    job_id = (await post_hook("pull_request", "guid-0", payload)).json()["job_id"]
+
+    async with AsyncSession(async_engine, expire_on_commit=False) as db_session:
+        for _ in range(jobs.Job().max_attempts):
+            # redeliveries are duplicates while the job is queued (again) to be retried
+            assert (await post_hook("pull_request", "guid-0", payload)).json() == {
+                "status": "duplicate"
+            }
+            job = await jobs.claim(db_session)
+            assert job.id == job_id
+            with pytest.raises(GitHubBroken):
+                await execute_job(job, db_session)
+        assert job.status == jobs.JobStatus.failed
+
+    # but once it has failed for good, they're handled again
+    response = await post_hook("pull_request", "guid-0", payload)
+    assert response.json()["status"] == "queued"
+    assert response.json()["job_id"] != job_id
+
+
+@pytest.mark.asyncio
+async def test_deliveries_record_outcome_of_their_job(post_hook, mocker, monkeypatch):
+    monkeypatch.setenv("PANGEO_FORGE_INLINE_JOBS", "false")
+    monkeypatch.setenv("PANGEO_FORGE_RETAIN_HOOK_PAYLOADS", "true")
+    async with AsyncSession(async_engine, expire_on_commit=False) as db_session:
+        await post_hook("pull_request", "guid-0", pr_payload("Cleanup a-feedstock"))
+        await execute_job(await jobs.claim(db_session), db_session)
+
+        mocker.patch.object(
+            pangeo_forge_orchestrator.routers.github_app,
+            "handle_pr_event",
+            side_effect=ValueError("error msg"),
+        )
+        response = await post_hook("pull_request", "guid-1", pr_payload("Add a dataset"))
+        assert response.status_code == 202
+        with pytest.raises(ValueError, match="error msg"):
+            await execute_job(await jobs.claim(db_session), db_session)
+
+        logged = await deliveries.list_deliveries(db_session, limit=10)
+        assert [(d.guid, d.status_code) for d in logged] == [("guid-1", 500), ("guid-0", 202)]
+        assert logged[0].job_id == response.json()["job_id"]
+        # so the delivery whose job failed can be found to be replayed
+        failed = await deliveries.list_replayable(db_session, limit=10, failed=True)
+        assert [d.guid for d in failed] == ["guid-1"]
+
+
+@pytest.mark.asyncio
+async def test_other_events_are_handled_without_calling_github(post_hook, get_access_token):
+    assert (await post_hook("check_suite", "guid-0", {})).json() == {"status": "ok"}
+    assert (await post_hook("not_an_event", "guid-1", {})).status_code == 501
+    assert get_access_token.call_count == 0
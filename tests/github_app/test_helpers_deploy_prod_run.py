@@ -0,0 +1,107 @@
+"""Tests the concurrency of `deploy_prod_run`, which submits every recipe in a feedstock."""
+
+import asyncio
+import json
+import time
+
+import pytest
+import pytest_asyncio
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import pangeo_forge_orchestrator
+from pangeo_forge_orchestrator.database import async_engine, engine
+from pangeo_forge_orchestrator.http import http_session
+from pangeo_forge_orchestrator.models import MODELS
+from pangeo_forge_orchestrator.routers.github_app import deploy_prod_run
+
+from ..conftest import clear_database
+from .fixtures import _MockGitHubBackend, get_mock_github_session
+
+N_RECIPES = 12
+BAKE_SECONDS = 0.2
+
+
+@pytest_asyncio.fixture
+async def deploy_prod_run_fixture(api_key, async_app_client):
+    admin_headers = {"X-API-Key": api_key}
+    for path, json_ in [
+        (
+            "/bakeries/",
+            {"region": "us-central1", "name": "pangeo-ldeo-nsf-earthcube", "description": "..."},
+        ),
+        ("/feedstocks/", {"spec": "pangeo-forge/gpcp-feedstock"}),
+    ]:
+        response = await async_app_client.post(path, json=json_, headers=admin_headers)
+        assert response.status_code == 200
+
+    gh_backend = _MockGitHubBackend(
+        _app_hook_config_url="https://api.pangeo-forge.org/github/hooks/"
+    )
+    mock_gh = get_mock_github_session(gh_backend)(http_session)
+    async with AsyncSession(async_engine, expire_on_commit=False) as db_session:
+        yield dict(
+            base_html_url="https://github.com/pangeo-forge/gpcp-feedstock",
+            merge_commit_sha="abc",
+            base_full_name="pangeo-forge/gpcp-feedstock",
+            base_api_url="/repos/pangeo-forge/gpcp-feedstock",
+            base_ref="main",
+            gh=mock_gh,
+            db_session=db_session,
+            gh_kws={},
+        )
+
+    clear_database()
+
+
+@pytest.fixture
+def mock_runner(mocker):
+    """Mock `pangeo-forge-runner` with a feedstock of many recipes, each of which takes a while to
+    submit, recording the most bakes that were ever running at once."""
+
+    state = {"running": 0, "max_running": 0}
+
+    async def stream_runner_output(cmd: list[str]):
+        if cmd[1] == "expand-meta":
+            recipes = [{"id": f"recipe-{i}", "object": "recipe:recipe"} for i in range(N_RECIPES)]
+            meta = {"recipes": recipes, "bakery": {"id": "pangeo-ldeo-nsf-earthcube"}}
+            yield {"status": "completed", "meta": meta}
+        elif cmd[1] == "bake":
+            state["running"] += 1
+            state["max_running"] = max(state["running"], state["max_running"])
+            await asyncio.sleep(BAKE_SECONDS)
+            state["running"] -= 1
+            yield {"status": "submitted", "job_name": "a", "job_id": "b"}
+
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "stream_runner_output",
+        stream_runner_output,
+    )
+    return state
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+@pytest.mark.asyncio
+async def test_deploy_prod_run_concurrency(
+    deploy_prod_run_fixture, mock_runner, monkeypatch, concurrency
+):
+    monkeypatch.setenv("PANGEO_FORGE_BAKE_CONCURRENCY", str(concurrency))
+
+    start = time.monotonic()
+    await deploy_prod_run(**deploy_prod_run_fixture)
+    elapsed = time.monotonic() - start
+
+    assert mock_runner["max_running"] == concurrency
+    # submission time scales with the number of recipes divided by the concurrency
+    assert elapsed >= BAKE_SECONDS * N_RECIPES / concurrency
+    assert elapsed < BAKE_SECONDS * (N_RECIPES / concurrency + 2)
+
+    with Session(engine) as db_session:
+        recipe_runs = db_session.exec(select(MODELS["recipe_run"].table)).all()
+    # recipe runs are created in the order the recipes are listed in meta.yaml
+    assert [rr.recipe_id for rr in recipe_runs] == [f"recipe-{i}" for i in range(N_RECIPES)]
+    for rr in recipe_runs:
+        assert rr.status == "in_progress"
+        assert json.loads(rr.message)["job_id"] == "b"
+        assert "environment_url" in json.loads(rr.message)
@@ -1,13 +1,22 @@
+import asyncio
+import json
+import subprocess
+import sys
+import time
 from urllib.parse import urlparse
 
 import jwt
 import pytest
 from gidgethub.aiohttp import GitHubAPI
 
+import pangeo_forge_orchestrator
 from pangeo_forge_orchestrator.config import get_config
 from pangeo_forge_orchestrator.http import http_session
 from pangeo_forge_orchestrator.models import MODELS
 from pangeo_forge_orchestrator.routers.github_app import (
+    AppJWTCache,
+    InstallationIndex,
+    InstallationTokenCache,
     get_access_token,
     get_app_webhook_url,
     get_github_session,
@@ -18,6 +27,7 @@ from pangeo_forge_orchestrator.routers.github_app import (
     html_url_to_repo_full_name,
     list_accessible_repos,
     make_dataflow_job_name,
+    stream_runner_output,
 )
 
 from .fixtures import _MockGitHubBackend, get_mock_github_session
@@ -31,6 +41,31 @@ def test_get_jwt(rsa_key_pair):
     assert all([isinstance(v, int) for v in decoded.values()])
 
 
+def test_app_jwt_cache(mocker, rsa_key_pair):
+    _, public_key = rsa_key_pair
+    cache = AppJWTCache(lifetime=10 * 60, reuse_for=8 * 60)
+    encode = mocker.spy(jwt, "encode")
+    encoded_jwts = {cache.get() for _ in range(10)}
+    assert len(encoded_jwts) == 1
+    assert encode.call_count == 1
+    assert cache.stats() == {"hits": 9, "signs": 1}
+    decoded = jwt.decode(encoded_jwts.pop(), public_key, algorithms=["RS256"])
+    assert decoded["exp"] - decoded["iat"] == 10 * 60
+
+    # once the reuse period has elapsed, a new jwt is signed with the already-parsed key
+    load_pem_private_key = mocker.spy(
+        pangeo_forge_orchestrator.routers.github_app, "load_pem_private_key"
+    )
+    later = time.time() + 8 * 60
+    mocker.patch.object(pangeo_forge_orchestrator.routers.github_app.time, "time", lambda: later)
+    decoded = jwt.decode(
+        cache.get(), public_key, algorithms=["RS256"], options={"verify_iat": False}
+    )
+    assert decoded["iat"] == int(later)
+    assert cache.stats() == {"hits": 9, "signs": 2}
+    assert load_pem_private_key.call_count == 0
+
+
 def test_get_github_session():
     gh = get_github_session(http_session)
     assert isinstance(gh, GitHubAPI)
@@ -84,6 +119,104 @@ async def test_get_access_token():
     assert len(token) == 40  # "ghs_" (4 chars) + 36 character token
 
 
+@pytest.mark.asyncio
+async def test_get_access_token_is_cached():
+    gh_backend = _MockGitHubBackend(_app_installations=[{"id": 1234567}])
+    mock_gh = get_mock_github_session(gh_backend)(http_session)
+    tokens = {await get_access_token(mock_gh) for _ in range(5)}
+    assert len(tokens) == 1
+    stats = pangeo_forge_orchestrator.routers.github_app.installation_tokens.stats()
+    assert stats == {"hits": 4, "misses": 1, "mints": 1, "cached": 1}
+
+
+@pytest.mark.asyncio
+async def test_installation_index():
+    gh_backend = _MockGitHubBackend(_app_installations=[{"id": 1234567}])
+    mock_gh = get_mock_github_session(gh_backend)(http_session)
+    index = InstallationIndex()
+    for repo in (None, "pangeo-forge/staged-recipes", "pangeo-forge/gpcp-feedstock"):
+        assert await index.get_installation_id(mock_gh, repo) == 1234567
+    # with only one installation, there's no need to look up which one a repo belongs to
+    assert index.lookups == 1
+
+
+@pytest.mark.asyncio
+async def test_installation_index_multiple_installations():
+    gh_backend = _MockGitHubBackend(
+        _app_installations=[{"id": 1234567}, {"id": 7654321}],
+        _repo_installations={"pforgetest/gpcp-feedstock": 7654321},
+    )
+    mock_gh = get_mock_github_session(gh_backend)(http_session)
+    index = InstallationIndex()
+    with pytest.raises(ValueError, match="2 installations"):
+        await index.get_installation_id(mock_gh)  # ambiguous without a repo
+    for _ in range(3):
+        assert await index.get_installation_id(mock_gh, "pforgetest/gpcp-feedstock") == 7654321
+    assert index.lookups == 2
+
+    index.remove_installation(7654321)
+    assert await index.get_installation_ids(mock_gh) == [1234567]
+    index.add_installation(7654321)
+    index.add_repos(7654321, ["pforgetest/GPCP-feedstock"])
+    assert await index.get_installation_id(mock_gh, "pforgetest/gpcp-feedstock") == 7654321
+    assert index.lookups == 2
+
+
+@pytest.fixture
+def mock_mint(mocker):
+    """Mints sequentially numbered tokens, which expire after ``state["ttl"]`` seconds."""
+
+    state = {"n": 0, "ttl": 60 * 60}
+
+    async def mint_installation_token(gh, installation_id):
+        await asyncio.sleep(0.01)  # give concurrent callers a chance to pile up
+        state["n"] += 1
+        expires_at = time.gmtime(time.time() + state["ttl"])
+        return {
+            "token": f"token-{state['n']}",
+            "expires_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", expires_at),
+        }
+
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "mint_installation_token",
+        mint_installation_token,
+    )
+    return state
+
+
+@pytest.mark.asyncio
+async def test_installation_token_cache_single_flight(mock_mint):
+    cache = InstallationTokenCache()
+    tokens = await asyncio.gather(*[cache.get(None, 1234567) for _ in range(10)])
+    assert set(tokens) == {"token-1"}
+    assert cache.mints == 1
+    # tokens for different installations are cached separately
+    assert await cache.get(None, 7654321) == "token-2"
+
+
+@pytest.mark.asyncio
+async def test_installation_token_cache_refreshes_before_expiry(mock_mint):
+    cache = InstallationTokenCache(expiry_margin=60, refresh_window=5 * 60)
+    mock_mint["ttl"] = 3 * 60  # inside refresh window, but outside expiry margin
+    assert await cache.get(None, 1234567) == "token-1"
+
+    # the cached token is still returned, but a refresh is started in the background
+    mock_mint["ttl"] = 60 * 60
+    assert await cache.get(None, 1234567) == "token-1"
+    await asyncio.sleep(0.05)
+    assert await cache.get(None, 1234567) == "token-2"
+    assert cache.mints == 2
+    assert cache.misses == 1
+
+    # tokens inside the expiry margin are never returned
+    mock_mint["ttl"] = 30
+    cache.clear()
+    assert await cache.get(None, 1234567) == "token-3"
+    assert await cache.get(None, 1234567) == "token-4"
+    assert cache.misses == 2
+
+
 @pytest.mark.asyncio
 async def test_get_app_webhook_url(app_hook_config_url):
     gh_backend_kws = {
@@ -95,6 +228,24 @@ async def test_get_app_webhook_url(app_hook_config_url):
     assert url == app_hook_config_url
 
 
+@pytest.mark.asyncio
+async def test_get_app_webhook_url_is_cached(mocker, app_hook_config_url):
+    gh_backend = _MockGitHubBackend(_app_hook_config_url=app_hook_config_url)
+    mock_gh = get_mock_github_session(gh_backend)(http_session)
+    getitem = mocker.spy(mock_gh, "getitem")
+    for _ in range(5):
+        assert await get_app_webhook_url(mock_gh) == app_hook_config_url
+    assert getitem.call_count == 1
+
+    # after the ttl has elapsed, the url is fetched again
+    cache = pangeo_forge_orchestrator.routers.github_app.app_webhook_url
+    fetched_at, url = cache._url
+    cache._url = (fetched_at - cache.ttl, url)
+    gh_backend._app_hook_config_url = "https://new-url.org/github/hooks/"
+    assert await get_app_webhook_url(mock_gh) == "https://new-url.org/github/hooks/"
+    assert getitem.call_count == 2
+
+
 @pytest.mark.parametrize("repo_full_name", ["pangeo-forge/staged-recipes"])
 @pytest.mark.asyncio
 async def test_get_repo_id(repo_full_name):
@@ -229,3 +380,95 @@ def test_html_to_api_url(html_url, expected_api_url):
 def test_html_url_to_repo_full_name(html_url, expected_repo_full_name):
     actual_repo_full_name = html_url_to_repo_full_name(html_url)
     assert actual_repo_full_name == expected_repo_full_name
+
+
+def python_cmd(script: str) -> list[str]:
+    return [sys.executable, "-c", script]
+
+
+@pytest.mark.asyncio
+async def test_stream_runner_output():
+    script = "import json; [print(json.dumps({'status': 'running', 'i': i})) for i in range(3)]"
+    lines = [p async for p in stream_runner_output(python_cmd(script))]
+    assert lines == [{"status": "running", "i": i} for i in range(3)]
+
+
+@pytest.mark.asyncio
+async def test_stream_runner_output_raises_called_process_error():
+    script = "import json, sys; print(json.dumps({'status': 'failed'})); sys.exit(2)"
+    lines = []
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        async for p in stream_runner_output(python_cmd(script)):
+            lines.append(p)
+    assert lines == [{"status": "failed"}]
+    assert e.value.returncode == 2
+    assert e.value.output.strip() == b'{"status": "failed"}'
+
+
+@pytest.mark.asyncio
+async def test_stream_runner_output_timeout(monkeypatch):
+    monkeypatch.setenv("PANGEO_FORGE_RUNNER_TIMEOUT", "0.5")
+    script = "import json, time; print(json.dumps({}), flush=True); time.sleep(60)"
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired) as e:
+        async for _ in stream_runner_output(python_cmd(script)):
+            pass
+    assert time.monotonic() - start < 10
+    assert e.value.output.strip() == b"{}"
+
+
+@pytest.mark.asyncio
+async def test_stream_runner_output_long_lines(monkeypatch):
+    # longer than asyncio's default limit of 64 KiB
+    script = "import json; print(json.dumps({'status': 'completed', 'meta': 'x' * 2**20}))"
+    lines = [p async for p in stream_runner_output(python_cmd(script))]
+    assert len(lines[0]["meta"]) == 2**20
+
+    monkeypatch.setenv("PANGEO_FORGE_RUNNER_LINE_LIMIT", str(2**16))
+    script += "; import time; time.sleep(60)"
+    start = time.monotonic()
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        async for _ in stream_runner_output(python_cmd(script)):
+            pass
+    assert time.monotonic() - start < 10  # the subprocess was killed
+    assert e.value.returncode != 0
+    failed = json.loads(e.value.output.splitlines()[-1])
+    assert failed["status"] == "failed"
+    assert "longer than 65536 bytes" in failed["exc_info"]
+
+
+@pytest.mark.asyncio
+async def test_stream_runner_output_does_not_block_event_loop():
+    script = "import json, time; time.sleep(0.5); print(json.dumps({'status': 'completed'}))"
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.create_task(tick())
+    lines = [p async for p in stream_runner_output(python_cmd(script))]
+    ticker.cancel()
+    assert lines == [{"status": "completed"}]
+    assert ticks > 10  # the loop kept running while the subprocess was sleeping
+
+
+@pytest.mark.asyncio
+async def test_stream_runner_output_cancelled_kills_subprocess(mocker):
+    create_subprocess_exec = mocker.spy(asyncio, "create_subprocess_exec")
+    script = "import time; time.sleep(60)"
+
+    async def consume():
+        async for _ in stream_runner_output(python_cmd(script)):
+            pass
+
+    task = asyncio.create_task(consume())
+    while not create_subprocess_exec.spy_return:
+        await asyncio.sleep(0.01)
+    proc = create_subprocess_exec.spy_return
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert proc.returncode is not None
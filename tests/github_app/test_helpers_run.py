@@ -2,13 +2,13 @@
 This module tests the `run` function, which is a special case.
 """
 
-import subprocess
-
 import pytest
 import pytest_asyncio
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from pangeo_forge_orchestrator.database import engine
+import pangeo_forge_orchestrator
+from pangeo_forge_orchestrator.database import async_engine, engine
 from pangeo_forge_orchestrator.http import http_session
 from pangeo_forge_orchestrator.models import MODELS
 from pangeo_forge_orchestrator.routers.github_app import run
@@ -16,6 +16,7 @@ from pangeo_forge_orchestrator.routers.github_app import run
 from ..conftest import clear_database
 from .fixtures import _MockGitHubBackend, get_mock_github_session
 from .mock_pangeo_forge_runner import (
+    mock_stream_runner_output,
     mock_subprocess_check_output,
     mock_subprocess_check_output_raises_called_process_error,
 )
@@ -89,7 +90,7 @@ async def run_fixture(
     gh_backend = _MockGitHubBackend(**gh_backend_kws)
     mock_gh = get_mock_github_session(gh_backend)(http_session)
 
-    with Session(engine) as db_session:
+    async with AsyncSession(async_engine, expire_on_commit=False) as db_session:
         run_kws = dict(
             html_url=f"{request.param['feedstock_spec']}",
             ref=db_model.head_sha,
@@ -108,7 +109,11 @@ async def run_fixture(
 @pytest.mark.asyncio
 async def test_run(mocker, run_fixture):
     run_kws = run_fixture
-    mocker.patch.object(subprocess, "check_output", mock_subprocess_check_output)
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "stream_runner_output",
+        mock_stream_runner_output(mock_subprocess_check_output),
+    )
     await run(**run_kws)
 
 
@@ -120,8 +125,8 @@ async def test_run_raises_called_process_error(
 ):
     run_kws = run_fixture
     mocker.patch.object(
-        subprocess,
-        "check_output",
-        mock_subprocess_check_output_raises_called_process_error,
+        pangeo_forge_orchestrator.routers.github_app,
+        "stream_runner_output",
+        mock_stream_runner_output(mock_subprocess_check_output_raises_called_process_error),
     )
     await run(**run_kws)
@@ -0,0 +1,101 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import pangeo_forge_orchestrator
+from pangeo_forge_orchestrator import idempotency
+from pangeo_forge_orchestrator.database import async_engine
+
+from ..conftest import clear_database
+from .fixtures import _MockGitHubBackend, add_hash_signature, get_mock_github_session
+
+
+@pytest_asyncio.fixture
+async def post_hook(mocker, async_app_client, webhook_secret):
+    gh_backend = _MockGitHubBackend(_app_installations=[{"id": 1234567}])
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "get_github_session",
+        get_mock_github_session(gh_backend),
+    )
+
+    async def _post_hook(event: str, guid: str):
+        request = {"headers": {"X-GitHub-Event": event, "X-GitHub-Delivery": guid}, "payload": {}}
+        request = add_hash_signature(request, webhook_secret)
+        return await async_app_client.post(
+            "/github/hooks/", json=request["payload"], headers=request["headers"]
+        )
+
+    yield _post_hook
+    clear_database()
+
+
+@pytest_asyncio.fixture
+async def db_session():
+    async with AsyncSession(async_engine, expire_on_commit=False) as db_session:
+        yield db_session
+
+
+@pytest.mark.asyncio
+async def test_duplicates_are_not_handled(post_hook):
+    assert (await post_hook("check_suite", "guid-0")).json() == {"status": "ok"}
+    response = await post_hook("check_suite", "guid-0")
+    assert response.status_code == 202
+    assert response.json() == {"status": "duplicate"}
+    assert idempotency.recent_keys.hits == 1  # recognised without querying the database
+
+    idempotency.recent_keys.clear()  # e.g. the duplicate is received by another process
+    assert (await post_hook("check_suite", "guid-0")).json() == {"status": "duplicate"}
+    assert (await post_hook("check_suite", "guid-1")).json() == {"status": "ok"}
+
+
+@pytest.mark.asyncio
+async def test_failed_deliveries_can_be_retried(post_hook):
+    assert (await post_hook("not_an_event", "guid-0")).status_code == 501
+    assert (await post_hook("not_an_event", "guid-0")).status_code == 501  # handled again
+
+
+@pytest.mark.asyncio
+async def test_keys_released_by_another_process(db_session):
+    async with AsyncSession(async_engine, expire_on_commit=False) as other_process:
+        assert await idempotency.claim(other_process, "github:guid-0")
+        idempotency.recent_keys.clear()  # i.e., only the other process remembers its claim
+
+        assert not await idempotency.claim(db_session, "github:guid-0")
+        # e.g. the other process's job for the delivery failed for good. Its release only forgets
+        # the key in its own memory, so here, it's just deleted from the database.
+        key = idempotency.HookIdempotencyKey.key
+        await other_process.execute(
+            delete(idempotency.HookIdempotencyKey).where(key == "github:guid-0")
+        )
+        await other_process.commit()
+    assert await idempotency.claim(db_session, "github:guid-0")
+
+
+@pytest.mark.asyncio
+async def test_expired_keys(post_hook, db_session, monkeypatch):
+    assert (await post_hook("check_suite", "guid-0")).json() == {"status": "ok"}
+    monkeypatch.setenv("PANGEO_FORGE_HOOK_IDEMPOTENCY_TTL", "0")
+    assert (await post_hook("check_suite", "guid-0")).json() == {"status": "ok"}
+
+    assert await idempotency.prune(db_session) == 1
+    assert await idempotency.claim(db_session, "github:guid-0")
+
+
+@pytest.mark.parametrize(
+    "event, guid, payload, expected",
+    [
+        ("pull_request", "abc", {"action": "synchronize"}, "github:abc"),
+        ("pull_request", None, {"action": "synchronize"}, None),
+        (
+            "dataflow",
+            None,
+            {"action": "completed", "recipe_run_id": "1", "conclusion": "success"},
+            "dataflow:1:success",
+        ),
+        ("dataflow", None, {"action": "started", "recipe_run_id": "1"}, None),
+    ],
+)
+def test_get_idempotency_key(event, guid, payload, expected):
+    assert idempotency.get_idempotency_key(event, guid, payload) == expected
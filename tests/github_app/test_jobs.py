@@ -0,0 +1,280 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import aiohttp
+import pytest
+import pytest_asyncio
+from fastapi import BackgroundTasks
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import pangeo_forge_orchestrator
+from pangeo_forge_orchestrator import jobs
+from pangeo_forge_orchestrator.cache import response_cache
+from pangeo_forge_orchestrator.database import async_engine
+from pangeo_forge_orchestrator.routers.github_app import (
+    JOB_TASKS,
+    deploy_prod_run,
+    enqueue_task,
+    execute_job,
+    synchronize,
+    triage_prod_run_complete,
+)
+from pangeo_forge_orchestrator.worker import work
+
+from ..conftest import clear_database
+from .fixtures import _MockGitHubBackend, get_mock_github_session
+
+
+@pytest_asyncio.fixture
+async def db_session():
+    clear_database()
+    async with AsyncSession(async_engine, expire_on_commit=False) as db_session:
+        yield db_session
+    clear_database()
+
+
+@pytest.fixture
+def mock_tasks(mocker):
+    """Replace the job tasks with ones which record their calls, or fail as instructed."""
+
+    mocker.patch.object(
+        pangeo_forge_orchestrator.routers.github_app,
+        "get_github_session",
+        get_mock_github_session(_MockGitHubBackend(_app_installations=[{"id": 1234567}])),
+    )
+    calls = []
+
+    async def record(*args, gh, gh_kws):
+        calls.append(args)
+
+    async def fail(error, *, gh, gh_kws):
+        raise {"transient": aiohttp.ClientError, "fatal": ValueError}[error]()
+
+    async def sleep(seconds, *, gh, gh_kws):
+        await asyncio.sleep(seconds)
+        calls.append(seconds)
+
+    mocker.patch.dict(JOB_TASKS, {"record": record, "fail": fail, "sleep": sleep})
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_claim_in_order(db_session):
+    first = await jobs.enqueue(db_session, "record", [1])
+    second = await jobs.enqueue(db_session, "record", [2])
+
+    claimed = await jobs.claim(db_session)
+    assert claimed.id == first.id
+    assert claimed.status == jobs.JobStatus.in_progress
+    assert claimed.attempts == 1
+    assert (await jobs.claim(db_session)).id == second.id
+    assert await jobs.claim(db_session) is None
+
+
+@pytest.mark.asyncio
+async def test_claim_specific_job(db_session):
+    _ = await jobs.enqueue(db_session, "record", [1])
+    second = await jobs.enqueue(db_session, "record", [2])
+
+    assert (await jobs.claim(db_session, job_id=second.id)).id == second.id
+    assert await jobs.claim(db_session, job_id=second.id) is None  # can't be claimed twice
+
+
+@pytest.mark.asyncio
+async def test_claim_limits_concurrency_per_bakery(db_session, monkeypatch):
+    monkeypatch.setenv("PANGEO_FORGE_JOBS_PER_BAKERY", "1")
+    a1 = await jobs.enqueue(db_session, "record", [], bakery_id=1)
+    _ = await jobs.enqueue(db_session, "record", [], bakery_id=1)
+    b = await jobs.enqueue(db_session, "record", [], bakery_id=2)
+    unlimited = await jobs.enqueue(db_session, "record", [])
+
+    assert (await jobs.claim(db_session)).id == a1.id
+    # the second job for bakery 1 is skipped while the first is in progress
+    assert (await jobs.claim(db_session)).id == b.id
+    assert (await jobs.claim(db_session)).id == unlimited.id
+    assert await jobs.claim(db_session) is None
+
+    await jobs.complete(db_session, a1)
+    assert (await jobs.claim(db_session)).bakery_id == 1
+
+
+@pytest.mark.asyncio
+async def test_fail_retries_with_backoff(db_session):
+    job = await jobs.enqueue(db_session, "record", [], max_attempts=2)
+
+    job = await jobs.claim(db_session)
+    await jobs.fail(db_session, job, "oops")
+    assert job.status == jobs.JobStatus.queued
+    assert job.run_after > datetime.utcnow() + jobs.backoff(1) - timedelta(seconds=5)
+    assert await jobs.claim(db_session) is None  # not until backoff has elapsed
+
+    job.run_after = datetime.utcnow()
+    db_session.add(job)
+    await db_session.commit()
+    job = await jobs.claim(db_session)
+    assert job.attempts == 2
+    await jobs.fail(db_session, job, "oops again")
+    assert job.status == jobs.JobStatus.failed  # out of attempts
+    assert job.error == "oops again"
+
+
+def test_backoff():
+    assert [jobs.backoff(n).total_seconds() for n in range(1, 5)] == [30, 60, 120, 240]
+    assert jobs.backoff(100) == timedelta(hours=1)
+
+
+@pytest.mark.asyncio
+async def test_requeue_abandoned(db_session, monkeypatch):
+    monkeypatch.setenv("PANGEO_FORGE_JOB_LEASE", "0")
+    _ = await jobs.enqueue(db_session, "record", [], max_attempts=2)
+    _ = await jobs.enqueue(db_session, "record", [], max_attempts=1)
+    first = await jobs.claim(db_session)
+    second = await jobs.claim(db_session)
+
+    assert await jobs.requeue_abandoned(db_session) == 2
+    await db_session.refresh(first)
+    await db_session.refresh(second)
+    assert first.status == jobs.JobStatus.queued
+    assert second.status == jobs.JobStatus.failed
+
+
+@pytest.mark.asyncio
+async def test_requeue_only_lapsed_leases(db_session, monkeypatch):
+    monkeypatch.setenv("PANGEO_FORGE_JOB_LEASE", "60")
+    _ = await jobs.enqueue(db_session, "record", [])
+    job = await jobs.claim(db_session)
+    job.started_at = datetime.utcnow() - timedelta(hours=1)  # long running, but still leased
+    db_session.add(job)
+    await db_session.commit()
+    assert await jobs.requeue_abandoned(db_session) == 0
+
+    job.heartbeat_at = datetime.utcnow() - timedelta(minutes=2)
+    db_session.add(job)
+    await db_session.commit()
+    assert await jobs.requeue_abandoned(db_session) == 1
+
+
+@pytest.mark.asyncio
+async def test_execute_job_renews_lease(db_session, mock_tasks, async_app_client, monkeypatch):
+    monkeypatch.setenv("PANGEO_FORGE_JOB_LEASE", "0.4")  # renewed every 0.1s
+    _ = await jobs.enqueue(db_session, "sleep", [0.5])
+    job = await jobs.claim(db_session)
+    await execute_job(job, db_session)
+    await db_session.refresh(job)
+    assert job.status == jobs.JobStatus.completed
+    assert job.heartbeat_at - job.started_at >= timedelta(seconds=0.2)
+
+
+@pytest.mark.parametrize(
+    "task, max_attempts",
+    [(triage_prod_run_complete, 3), (synchronize, 1), (deploy_prod_run, 1)],
+)
+@pytest.mark.asyncio
+async def test_only_idempotent_tasks_are_retried(db_session, monkeypatch, task, max_attempts):
+    monkeypatch.setenv("PANGEO_FORGE_INLINE_JOBS", "false")
+    job = await enqueue_task(task, db_session=db_session, background_tasks=BackgroundTasks())
+    assert job.max_attempts == max_attempts
+
+    job = await jobs.claim(db_session)
+    await jobs.fail(db_session, job, "transient")
+    assert job.status == (jobs.JobStatus.queued if max_attempts > 1 else jobs.JobStatus.failed)
+
+
+@pytest.mark.asyncio
+async def test_execute_job(db_session, mock_tasks, async_app_client):
+    _ = await jobs.enqueue(db_session, "record", ["a", 1], installation_id=1234567)
+    job = await jobs.claim(db_session)
+    await execute_job(job, db_session)
+    assert mock_tasks == [("a", 1)]
+    assert job.status == jobs.JobStatus.completed
+    # the task may have changed rows, so cached responses are invalidated
+    assert response_cache.stats()["invalidations"] == 1
+
+
+@pytest.mark.parametrize("error, status", [("transient", "queued"), ("fatal", "failed")])
+@pytest.mark.asyncio
+async def test_execute_job_retries_transient_errors(
+    db_session, mock_tasks, async_app_client, error, status
+):
+    _ = await jobs.enqueue(db_session, "fail", [error])
+    job = await jobs.claim(db_session)
+    with pytest.raises(Exception):
+        await execute_job(job, db_session)
+    assert job.status == status
+
+
+@pytest.mark.asyncio
+async def test_worker(db_session, mock_tasks, async_app_client):
+    for i in range(5):
+        await jobs.enqueue(db_session, "record", [i])
+    await jobs.enqueue(db_session, "fail", ["fatal"])
+
+    stop = asyncio.Event()
+    worker = asyncio.create_task(work(concurrency=2, poll_interval=0.05, stop=stop))
+    while (await jobs.get_queue_stats(db_session)).counts[jobs.JobStatus.queued]:
+        await asyncio.sleep(0.05)
+    stop.set()
+    await worker
+
+    assert sorted(mock_tasks) == [(i,) for i in range(5)]
+    counts = (await jobs.get_queue_stats(db_session)).counts
+    assert counts[jobs.JobStatus.completed] == 5
+    assert counts[jobs.JobStatus.failed] == 1
+
+
+@pytest.mark.asyncio
+async def test_worker_shutdown_returns_running_jobs_to_queue(
+    db_session, mock_tasks, async_app_client
+):
+    await jobs.enqueue(db_session, "sleep", [60])
+
+    stop = asyncio.Event()
+    worker = asyncio.create_task(
+        work(concurrency=1, poll_interval=0.05, shutdown_grace=0.1, stop=stop)
+    )
+    while not (await jobs.get_queue_stats(db_session)).counts[jobs.JobStatus.in_progress]:
+        await asyncio.sleep(0.05)
+    stop.set()
+    await worker
+
+    job = await jobs.claim(db_session)
+    assert job.task == "sleep"
+    assert job.attempts == 1  # the interrupted attempt didn't count
+
+
+@pytest.mark.asyncio
+async def test_worker_shutdown_fails_running_jobs_which_cant_be_retried(
+    db_session, mock_tasks, async_app_client
+):
+    await jobs.enqueue(db_session, "sleep", [60], max_attempts=1)
+
+    stop = asyncio.Event()
+    worker = asyncio.create_task(
+        work(concurrency=1, poll_interval=0.05, shutdown_grace=0.1, stop=stop)
+    )
+    while not (await jobs.get_queue_stats(db_session)).counts[jobs.JobStatus.in_progress]:
+        await asyncio.sleep(0.05)
+    stop.set()
+    await worker
+
+    assert (await jobs.get_queue_stats(db_session)).counts[jobs.JobStatus.failed] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_job_queue_stats(db_session, async_app_client, api_key):
+    await jobs.enqueue(db_session, "record", [], bakery_id=1)
+    await jobs.enqueue(db_session, "record", [])
+    await jobs.enqueue(db_session, "sleep", [])
+    await jobs.claim(db_session)
+
+    response = await async_app_client.get("/github/jobs/stats")
+    assert response.status_code == 403
+
+    response = await async_app_client.get("/github/jobs/stats", headers={"X-API-Key": api_key})
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["counts"] == {"queued": 2, "in_progress": 1, "completed": 0, "failed": 0}
+    assert stats["queued_by_task"] == {"record": 1, "sleep": 1}
+    assert stats["in_progress_by_bakery"] == {"1": 1}
+    assert stats["oldest_queued_age"] >= 0
+    assert stats["mean_latency"] >= 0
@@ -1,3 +1,4 @@
+import itertools
 from datetime import datetime
 
 
@@ -33,12 +34,31 @@ def compare_response(response_fixture, reponse_data):
             assert actual == expected
 
 
-def create_with_dependencies(create_opts, mf, client):
+def create_dependencies(mf, client):
     for dep in mf.dependencies:
         dep_create_opts = dep.model_fixture.create_opts[0]  # just use first create_opts
-        dep_create_response = client.create(dep.model_fixture.path, dep_create_opts)
+        try:
+            dep_create_response = client.create(dep.model_fixture.path, dep_create_opts)
+        except client.error_cls as e:
+            if e.response.status_code == 409:
+                continue  # the dependency was already created (e.g. for a previous model)
+            raise
         compare_response(dep_create_opts, dep_create_response)
 
+
+def create_with_dependencies(create_opts, mf, client):
+    create_dependencies(mf, client)
+
     data = client.create(mf.path, create_opts)
 
     return data
+
+
+def distinct_create_opts(mf, n: int) -> list:
+    """Return ``n`` of ``mf``'s ``create_opts`` (cycling through them as needed), with the values of
+    any ``unique_fields`` made distinct."""
+
+    return [
+        opts | {f: f"{opts[f]}-{i}" for f in mf.unique_fields}
+        for i, opts in zip(range(n), itertools.cycle(mf.create_opts))
+    ]
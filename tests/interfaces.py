@@ -40,6 +40,12 @@ class FastAPITestClientCRUD:
         data = response.json()
         return data
 
+    def create_batch(self, path: str, json: list[dict]) -> list[dict]:
+        response = self.client.post(f"{path}batch", json=json)
+        response.raise_for_status()
+        data = response.json()
+        return data
+
     def read_range(self, path: str) -> dict:
         response = self.client.get(path)
         return response.json()
@@ -61,6 +67,18 @@ class FastAPITestClientCRUD:
         data = response.json()
         return data
 
+    def update_batch(self, path: str, update_with: list[dict]) -> list[dict]:
+        response = self.client.patch(f"{path}batch", json=update_with)
+        response.raise_for_status()
+        data = response.json()
+        return data
+
+    def delete_batch(self, path: str, ids: list[int]) -> dict:
+        response = self.client.request("DELETE", f"{path}batch", json=ids)
+        response.raise_for_status()
+        data = response.json()
+        return data
+
     def delete(self, path: str, id: int) -> None:
         delete_response = self.client.delete(f"{path}{id}")
         # `assert delete_response.status_code == 200`, indicating successful deletion,
@@ -17,6 +17,7 @@ class ModelFixture:
     update_opts: Sequence[APIOpts]  # setting these on update should be valid
     dependencies: list["ModelRelationFixture"] = field(default_factory=list)  # req to create model
     optional_relations: list["ModelRelationFixture"] = field(default_factory=list)  # not required
+    unique_fields: Sequence[str] = ()  # no two rows can have the same value for these fields
 
     @property
     def all_relations(self):
@@ -116,6 +117,7 @@ bakery_fixture = ModelFixture(
         {"region": "x", "name": "y", "description": "z"},
         {"region": "q", "name": "r", "description": "s"},
     ],
+    unique_fields=["name"],
 )
 
 feedstock_fixture = ModelFixture(
@@ -127,6 +129,7 @@ feedstock_fixture = ModelFixture(
         dict(provider="not a valid RepoProvider"),
     ],
     update_opts=[{"spec": "c"}, {"spec": "d"}],
+    unique_fields=["spec"],
 )
 
 recipe_run_fixture.dependencies += [
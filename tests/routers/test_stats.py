@@ -1,5 +1,7 @@
 import pytest
 
+from pangeo_forge_orchestrator.cache import response_cache
+
 from ..helpers import create_with_dependencies
 from ..model_fixtures import recipe_run_fixture
 
@@ -38,3 +40,98 @@ def test_dataset_stats(client, authorized_client, model_fixture, query):
 
     response = client.read_range(path)
     assert response == {"count": 1}
+
+
+@pytest.mark.parametrize("model_fixture", [recipe_run_fixture])
+def test_stats_summary(client, authorized_client, model_fixture):
+    first = create_with_dependencies(model_fixture.create_opts[0], model_fixture, authorized_client)
+    _ = authorized_client.create(model_fixture.path, model_fixture.create_opts[1])
+    _ = authorized_client.update(model_fixture.path, first["id"], model_fixture.update_opts[1])
+
+    response = client.read_range("/stats/")
+    assert response.pop("refreshed_at")
+    assert response == {
+        "bakeries": 1,
+        "feedstocks": 1,
+        "recipe_runs": 2,
+        "datasets": 1,
+        "production_datasets": 1,
+        "recipe_runs_by_bakery": {"1": 2},
+        "recipe_runs_by_status": {"completed": 1, "queued": 1},
+        "recipe_runs_by_conclusion": {"success": 1},
+        "recipe_runs_by_day": {"2021-01-01": 1, "2021-02-02": 1},
+    }
+
+
+@pytest.mark.parametrize("model_fixture", [recipe_run_fixture])
+def test_stats_are_refreshed_after_max_age(client, authorized_client, model_fixture, monkeypatch):
+    _ = create_with_dependencies(model_fixture.create_opts[0], model_fixture, authorized_client)
+    assert client.read_range("/stats/recipe_runs") == {"count": 1}
+
+    monkeypatch.setenv("PANGEO_FORGE_STATS_MAX_AGE", "3600")
+    _ = authorized_client.create(model_fixture.path, model_fixture.create_opts[1])
+    assert client.read_range("/stats/recipe_runs") == {"count": 1}  # not yet refreshed
+
+    monkeypatch.setenv("PANGEO_FORGE_STATS_MAX_AGE", "0")
+    response_cache.clear()  # otherwise the previous response is served from the cache
+    assert client.read_range("/stats/recipe_runs") == {"count": 2}
+
+
+def create_runs(authorized_client, runs):
+    """Create recipe runs with the given ``(started_at, completed_at, conclusion)``."""
+
+    _ = create_with_dependencies(
+        recipe_run_fixture.create_opts[1], recipe_run_fixture, authorized_client
+    )  # queued, started 2021-02-02T00:00:00Z
+    for started_at, completed_at, conclusion in runs:
+        opts = recipe_run_fixture.create_opts[0] | dict(
+            started_at=started_at, completed_at=completed_at, conclusion=conclusion
+        )
+        _ = authorized_client.create(recipe_run_fixture.path, opts)
+
+
+RUNS = [
+    ("2021-01-01T00:00:00Z", "2021-01-01T01:01:01Z", "success"),
+    ("2021-01-01T00:30:00Z", "2021-01-01T00:31:00Z", "failure"),
+    ("2021-01-01T23:00:00Z", "2021-01-02T00:02:00Z", "success"),
+    ("2021-01-02T00:00:00Z", "2021-01-02T00:10:00Z", "success"),
+]
+
+
+def test_recipe_run_timeseries(client, authorized_client):
+    create_runs(authorized_client, RUNS)
+
+    response = client.read_range("/stats/recipe_runs/timeseries?interval=day")
+    assert response == [
+        dict(bucket="2021-01-01T00:00:00", started=3, completed=2, succeeded=1, success_rate=0.5),
+        dict(bucket="2021-01-02T00:00:00", started=1, completed=2, succeeded=2, success_rate=1.0),
+        dict(bucket="2021-02-02T00:00:00", started=1, completed=0, succeeded=0, success_rate=None),
+    ]
+
+    query = "interval=hour&start=2021-01-01T00:00:00Z&end=2021-01-02T00:00:00Z"
+    response = client.read_range(f"/stats/recipe_runs/timeseries?{query}")
+    assert [(b["bucket"], b["started"], b["completed"]) for b in response] == [
+        ("2021-01-01T00:00:00", 2, 1),
+        ("2021-01-01T01:00:00", 0, 1),
+        ("2021-01-01T23:00:00", 1, 0),
+    ]
+
+    response = client.read_range("/stats/recipe_runs/timeseries?bakery_id=2")
+    assert response == []
+
+
+def test_recipe_run_durations(client, authorized_client):
+    create_runs(authorized_client, RUNS)
+
+    for group_by in ["bakery", "feedstock"]:
+        response = client.read_range(f"/stats/recipe_runs/durations?group_by={group_by}")
+        assert len(response) == 1
+        durations = response[0]
+        assert (durations["id"], durations["count"]) == (1, 4)
+        # the durations are 60, 600, 3661 and 3720 seconds
+        assert durations["mean"] == pytest.approx(8041 / 4, abs=0.01)
+        assert durations["p50"] == pytest.approx(600, abs=0.01)
+        assert durations["p95"] == pytest.approx(3720, abs=0.01)
+
+    response = client.read_range("/stats/recipe_runs/durations?end=2021-01-01T02:00:00Z")
+    assert [(d["count"], round(d["p50"])) for d in response] == [(2, 60)]
@@ -1,7 +1,23 @@
-import pytest
+import base64
 
-from .helpers import compare_response, create_with_dependencies
-from .model_fixtures import ALL_MODEL_FIXTURES, APIOpts
+import pytest
+from sqlalchemy import event
+
+from pangeo_forge_orchestrator.models import MODELS
+
+from .helpers import (
+    compare_response,
+    create_dependencies,
+    create_with_dependencies,
+    distinct_create_opts,
+)
+from .model_fixtures import (
+    ALL_MODEL_FIXTURES,
+    APIOpts,
+    bakery_fixture,
+    feedstock_fixture,
+    recipe_run_fixture,
+)
 
 create_params = [(create_opts, mf) for mf in ALL_MODEL_FIXTURES for create_opts in mf.create_opts]
 
@@ -15,6 +31,53 @@ def test_create(create_opts: APIOpts, model_fixture, client):
     assert data["id"] > 0
 
 
+@pytest.mark.parametrize("model_fixture", ALL_MODEL_FIXTURES)
+def test_create_batch(model_fixture, client, authorized_client):
+    mf = model_fixture
+    create_dependencies(mf, authorized_client)
+    with client.auth_required():
+        data = client.create_batch(mf.path, mf.create_opts)
+
+    assert len(data) == len(mf.create_opts)
+    for create_opts, response in zip(mf.create_opts, data):
+        compare_response(create_opts, response)
+    assert len(authorized_client.read_range(mf.path)) == len(mf.create_opts)
+
+
+def test_create_batch_offset_datetimes(authorized_client):
+    rr = recipe_run_fixture
+    create_dependencies(rr, authorized_client)
+    opts = rr.create_opts[0] | {"started_at": "2021-01-01T02:00:00+02:00"}
+    (data,) = authorized_client.create_batch(rr.path, [opts])
+    # stored (and returned) as naive UTC
+    assert data["started_at"] == "2021-01-01T00:00:00"
+    assert authorized_client.read_single(rr.path, data["id"])["started_at"] == "2021-01-01T00:00:00"
+
+
+@pytest.mark.parametrize("model_fixture", ALL_MODEL_FIXTURES)
+def test_create_batch_invalid(model_fixture, client, authorized_client):
+    mf = model_fixture
+    create_dependencies(mf, authorized_client)
+    invalid = mf.create_opts[1] | mf.invalid_opts[0]
+    with pytest.raises(client.error_cls, match="Client error '422 Unprocessable Entity' for url"):
+        with client.auth_required():
+            _ = client.create_batch(mf.path, [mf.create_opts[0], invalid])
+    assert authorized_client.read_range(mf.path) == []  # nothing from the batch was created
+
+
+@pytest.mark.parametrize("model_fixture", [mf for mf in ALL_MODEL_FIXTURES if mf.unique_fields])
+def test_create_duplicate(model_fixture, client, authorized_client):
+    mf = model_fixture
+    _ = authorized_client.create(mf.path, mf.create_opts[0])
+    with pytest.raises(client.error_cls, match="Client error '409 Conflict' for url"):
+        with client.auth_required():
+            _ = client.create(mf.path, mf.create_opts[0])
+    with pytest.raises(client.error_cls, match="Client error '409 Conflict' for url"):
+        with client.auth_required():
+            _ = client.create_batch(mf.path, [mf.create_opts[1], mf.create_opts[0]])
+    assert len(authorized_client.read_range(mf.path)) == 1  # nothing from the batch was created
+
+
 create_params_incomplete = [
     (mf.path, create_opts, required_arg)
     for mf in ALL_MODEL_FIXTURES
@@ -82,6 +145,147 @@ def test_read_range_with_sort_ordering(model_fixture, client, authorized_client,
         assert item["id"] > 0
 
 
+def read_pages(client, path: str, limit: int, query: str = "") -> list[list[dict]]:
+    """Read every page of ``path``, by following the ``X-Next-Cursor`` of each response."""
+
+    pages = []
+    cursor_query = ""
+    while True:
+        response = client.client.get(f"{path}?limit={limit}{query}{cursor_query}")
+        response.raise_for_status()
+        pages.append(response.json())
+        if "X-Next-Cursor" not in response.headers:
+            return pages
+        cursor_query = f"&cursor={response.headers['X-Next-Cursor']}"
+
+
+@pytest.mark.parametrize("sort", ["asc", "desc"])
+@pytest.mark.parametrize(
+    "model_fixture, order_by",
+    [(mf, "id") for mf in ALL_MODEL_FIXTURES]
+    + [(recipe_run_fixture, "completed_at"), (recipe_run_fixture, "version")],
+)
+def test_read_range_with_cursor(model_fixture, client, authorized_client, order_by, sort):
+    mf = model_fixture
+    create_dependencies(mf, authorized_client)
+    _ = authorized_client.create_batch(mf.path, distinct_create_opts(mf, 7))
+
+    query = f"&order_by={order_by}&sort={sort}"
+    pages = read_pages(client, mf.path, limit=2, query=query)
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    everything = client.read_range(f"{mf.path}?limit=100{query}")
+    assert [item for page in pages for item in page] == everything
+
+
+def test_read_range_with_cursor_is_consistent_under_inserts(client, authorized_client):
+    mf = recipe_run_fixture
+    _ = create_with_dependencies(mf.create_opts[0], mf, authorized_client)
+    _ = authorized_client.create_batch(mf.path, 3 * list(mf.create_opts))
+
+    response = client.client.get(f"{mf.path}?limit=4&sort=desc")
+    first_page = response.json()
+    cursor = response.headers["X-Next-Cursor"]
+    # new rows are listed first, which would shift every later page if we were using offsets
+    _ = authorized_client.create_batch(mf.path, list(mf.create_opts))
+    second_page = client.read_range(f"{mf.path}?limit=4&sort=desc&cursor={cursor}")
+
+    ids = [item["id"] for item in first_page + second_page]
+    assert ids == list(range(7, 0, -1))
+
+
+def test_read_range_with_cursor_does_not_offset(client, authorized_client):
+    from pangeo_forge_orchestrator.database import engine
+
+    mf = recipe_run_fixture
+    _ = create_with_dependencies(mf.create_opts[0], mf, authorized_client)
+    _ = authorized_client.create_batch(mf.path, list(mf.create_opts))
+    cursor = client.client.get(f"{mf.path}?limit=1").headers["X-Next-Cursor"]
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, *args):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        _ = client.read_range(f"{mf.path}?limit=1&cursor={cursor}")
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    # the position is found by an (indexed) comparison with the cursor, not by skipping rows.
+    # note that sqlite always renders an offset after a limit, so check that it's zero.
+    selects = [(s, p) for s, p in statements if s.startswith("SELECT")]
+    assert len(selects) == 1
+    statement, parameters = selects[0]
+    assert "WHERE reciperun.id > ?" in statement
+    assert "OFFSET" not in statement or parameters[-1] == 0
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "cursor=not-a-cursor",
+        f"cursor={base64.urlsafe_b64encode(b'[1, 2]').decode()}",
+        "order_by=not_a_column",
+    ],
+)
+def test_read_range_invalid(query, client):
+    response = client.client.get(f"{recipe_run_fixture.path}?{query}")
+    assert response.status_code == 400
+
+
+def test_read_range_cursor_with_different_ordering(client, authorized_client):
+    mf = recipe_run_fixture
+    _ = create_with_dependencies(mf.create_opts[0], mf, authorized_client)
+    _ = authorized_client.create_batch(mf.path, list(mf.create_opts))
+    cursor = client.client.get(f"{mf.path}?limit=1").headers["X-Next-Cursor"]
+
+    for query in ["sort=desc", "order_by=version", "offset=1"]:
+        response = client.client.get(f"{mf.path}?limit=1&cursor={cursor}&{query}")
+        assert response.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "query, expected_recipe_ids",
+    [
+        ("", ["test-recipe-0", "test-recipe-1", "test-recipe-2"]),
+        ("status=completed", ["test-recipe-0", "test-recipe-2"]),
+        ("status=completed&status=queued", ["test-recipe-0", "test-recipe-1", "test-recipe-2"]),
+        ("status=completed&conclusion=failure", ["test-recipe-2"]),
+        ("recipe_id=test-recipe-1&recipe_id=test-recipe-2", ["test-recipe-1", "test-recipe-2"]),
+        ("is_test=true", ["test-recipe-2"]),
+        ("is_test=false&feedstock_id=1", ["test-recipe-0", "test-recipe-1"]),
+        ("feedstock_id=2", []),
+        ("started_at__gte=2021-02-02T00:00:00Z", ["test-recipe-1", "test-recipe-2"]),
+        ("started_at__lt=2021-02-02T00:00:00Z", ["test-recipe-0"]),
+        (
+            "started_at__gte=2021-01-15T00:00:00Z&started_at__lt=2021-03-01T00:00:00Z",
+            ["test-recipe-1"],
+        ),
+        ("completed_at__gte=2021-01-01T01:01:01Z", ["test-recipe-0", "test-recipe-2"]),
+    ],
+)
+def test_read_range_with_filters(query, expected_recipe_ids, client, authorized_client):
+    mf = recipe_run_fixture
+    _ = create_with_dependencies(mf.create_opts[0], mf, authorized_client)
+    _ = authorized_client.create(mf.path, mf.create_opts[1])
+    extra = dict(
+        recipe_id="test-recipe-2",
+        started_at="2021-03-03T00:00:00Z",
+        completed_at="2021-03-03T01:00:00Z",
+        conclusion="failure",
+        is_test=True,
+    )
+    _ = authorized_client.create(mf.path, mf.create_opts[0] | extra)
+
+    response = client.read_range(f"{mf.path}?{query}")
+    assert [r["recipe_id"] for r in response] == expected_recipe_ids
+
+
+def test_read_range_with_invalid_filter(client):
+    response = client.client.get(f"{recipe_run_fixture.path}?status=not-a-status")
+    assert response.status_code == 422
+
+
 @pytest.mark.parametrize("model_fixture", ALL_MODEL_FIXTURES)
 def test_read_single(model_fixture, client, authorized_client):
     # first create some data
@@ -110,6 +314,36 @@ def test_read_single(model_fixture, client, authorized_client):
                 )
 
 
+@pytest.mark.parametrize(
+    "model_fixture, n_queries",
+    [(recipe_run_fixture, 1), (bakery_fixture, 2), (feedstock_fixture, 2)],
+)
+def test_read_single_queries(model_fixture, n_queries, client, authorized_client, monkeypatch):
+    from pangeo_forge_orchestrator.database import engine
+
+    monkeypatch.setattr(MODELS["feedstock"].relations[0], "max_items", 3)
+    monkeypatch.setattr(MODELS["bakery"].relations[0], "max_items", 3)
+    rr = recipe_run_fixture
+    _ = create_with_dependencies(rr.create_opts[0], rr, authorized_client)
+    _ = authorized_client.create_batch(rr.path, 4 * list(rr.create_opts))
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        data = client.read_single(model_fixture.path, 1)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    # relations are loaded up front, rather than lazily with a query each
+    assert len([s for s in statements if s.startswith("SELECT")]) == n_queries
+    if "recipe_runs" in data:
+        # only the most recent are included, in the same (ascending) order as an unbounded relation
+        assert [r["id"] for r in data["recipe_runs"]] == [7, 8, 9]
+
+
 @pytest.mark.parametrize("model_fixtures", ALL_MODEL_FIXTURES)
 def test_read_nonexistent(model_fixtures, client):
     # first create some data
@@ -147,6 +381,47 @@ def test_update(create_opts: APIOpts, update_opts, model_fixture, client, author
     compare_response(update_opts, response)
 
 
+@pytest.mark.parametrize("model_fixture", ALL_MODEL_FIXTURES)
+def test_update_batch(model_fixture, client, authorized_client):
+    mf = model_fixture
+    create_dependencies(mf, authorized_client)
+    ids = [d["id"] for d in authorized_client.create_batch(mf.path, mf.create_opts)]
+    update_with = [dict(id=id, **opts) for id, opts in zip(ids, mf.update_opts)]
+    with client.auth_required():
+        data = client.update_batch(mf.path, update_with)
+
+    assert [d["id"] for d in data] == ids
+    for update_opts, response in zip(mf.update_opts, data):
+        compare_response(update_opts, response)
+    for update_opts, id in zip(mf.update_opts, ids):
+        compare_response(update_opts, authorized_client.read_single(mf.path, id))
+
+
+def test_update_batch_offset_datetimes(authorized_client):
+    rr = recipe_run_fixture
+    data = create_with_dependencies(rr.create_opts[0], rr, authorized_client)
+    update_with = [dict(id=data["id"], completed_at="2021-01-01T02:00:00+02:00")]
+    (updated,) = authorized_client.update_batch(rr.path, update_with)
+    # stored (and returned) as naive UTC
+    assert updated["completed_at"] == "2021-01-01T00:00:00"
+    assert (
+        authorized_client.read_single(rr.path, data["id"])["completed_at"] == "2021-01-01T00:00:00"
+    )
+
+
+@pytest.mark.parametrize("model_fixture", ALL_MODEL_FIXTURES)
+def test_update_batch_nonexistent(model_fixture, client, authorized_client):
+    mf = model_fixture
+    data = create_with_dependencies(mf.create_opts[0], mf, authorized_client)
+    update_with = [dict(id=data["id"], **mf.update_opts[0]), dict(id=99999999, **mf.update_opts[1])]
+    with pytest.raises(client.error_cls, match="Client error '404 Not Found' for url") as e:
+        with client.auth_required():
+            _ = client.update_batch(mf.path, update_with)
+    assert e.value.response.json()["detail"]["items"] == [dict(index=1, id=99999999)]
+    # the update to the row which does exist was not applied either
+    compare_response(mf.create_opts[0], authorized_client.read_single(mf.path, data["id"]))
+
+
 @pytest.mark.parametrize("create_opts,model_fixture", create_params)
 def test_delete(create_opts: APIOpts, model_fixture, client, authorized_client):
     data = create_with_dependencies(create_opts, model_fixture, authorized_client)
@@ -163,3 +438,29 @@ def test_delete_invalid(model_fixtures, client):
     with pytest.raises(client.error_cls):
         with client.auth_required():
             _ = client.delete(model_fixtures.path, id)
+
+
+@pytest.mark.parametrize("model_fixture", ALL_MODEL_FIXTURES)
+def test_delete_batch(model_fixture, client, authorized_client):
+    mf = model_fixture
+    create_dependencies(mf, authorized_client)
+    ids = [d["id"] for d in authorized_client.create_batch(mf.path, mf.create_opts)]
+    with client.auth_required():
+        data = client.delete_batch(mf.path, ids)
+
+    assert data == {"ok": True, "deleted": len(ids)}
+    assert authorized_client.read_range(mf.path) == []
+
+
+@pytest.mark.parametrize("model_fixture", ALL_MODEL_FIXTURES)
+def test_delete_batch_nonexistent(model_fixture, client, authorized_client):
+    mf = model_fixture
+    data = create_with_dependencies(mf.create_opts[0], mf, authorized_client)
+    with pytest.raises(client.error_cls, match="Client error '404 Not Found' for url") as e:
+        with client.auth_required():
+            _ = client.delete_batch(mf.path, [99999998, data["id"], 99999999])
+    assert e.value.response.json()["detail"]["items"] == [
+        dict(index=0, id=99999998),
+        dict(index=2, id=99999999),
+    ]
+    _ = authorized_client.read_single(mf.path, data["id"])  # not deleted
@@ -0,0 +1,148 @@
+import pytest
+
+from pangeo_forge_orchestrator.cache import (
+    MemoryBackend,
+    ResponseCache,
+    etag_matches,
+    is_cacheable,
+    response_cache,
+)
+
+from .model_fixtures import bakery_fixture
+
+
+@pytest.fixture
+def bakery(authorized_client):
+    return authorized_client.create(bakery_fixture.path, bakery_fixture.create_opts[0])
+
+
+def test_get_is_cached(authorized_client, bakery):
+    http = authorized_client.client
+    first = http.get(f"/bakeries/{bakery['id']}")
+    second = http.get(f"/bakeries/{bakery['id']}")
+
+    assert first.headers["x-cache"] == "miss"
+    assert second.headers["x-cache"] == "hit"
+    assert first.json() == second.json()
+    assert first.headers["etag"] == second.headers["etag"]
+    assert second.headers["content-type"] == "application/json"
+    assert response_cache.stats() == dict(hits=1, misses=1, invalidations=1)  # 1 from the create
+
+
+def test_get_with_query_is_cached_separately(authorized_client, bakery):
+    http = authorized_client.client
+    assert http.get("/bakeries/").headers["x-cache"] == "miss"
+    assert http.get("/bakeries/?sort=desc").headers["x-cache"] == "miss"
+    assert http.get("/bakeries/?sort=desc").headers["x-cache"] == "hit"
+
+
+@pytest.mark.parametrize("cached", [True, False])
+def test_if_none_match(authorized_client, bakery, cached):
+    http = authorized_client.client
+    etag = http.get("/bakeries/").headers["etag"]
+    if not cached:
+        response_cache.clear()
+
+    response = http.get("/bakeries/", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_write_invalidates(authorized_client, bakery):
+    http = authorized_client.client
+    before = http.get(f"/bakeries/{bakery['id']}")
+
+    authorized_client.update(bakery_fixture.path, bakery["id"], bakery_fixture.update_opts[0])
+    after = http.get(f"/bakeries/{bakery['id']}")
+    assert after.headers["x-cache"] == "miss"
+    assert after.json()["name"] == bakery_fixture.update_opts[0]["name"]
+    assert after.headers["etag"] != before.headers["etag"]
+
+
+def test_failed_write_does_not_invalidate(fastapi_test_crud_client, authorized_client, bakery):
+    http = authorized_client.client
+    _ = http.get("/bakeries/")
+
+    response = fastapi_test_crud_client.client.post("/bakeries/", json={})  # unauthorized
+    assert response.status_code == 403
+    assert http.get("/bakeries/").headers["x-cache"] == "hit"
+
+
+def test_errors_are_not_cached(authorized_client):
+    http = authorized_client.client
+    assert http.get("/bakeries/99999999").status_code == 404
+    assert response_cache.stats()["misses"] == 1
+    assert http.get("/bakeries/99999999").status_code == 404
+    assert response_cache.stats()["misses"] == 2
+
+
+def test_caching_can_be_disabled(authorized_client, bakery, monkeypatch):
+    monkeypatch.setenv("PANGEO_FORGE_RESPONSE_CACHE_TTL", "0")
+    stats = response_cache.stats()
+    response = authorized_client.client.get("/bakeries/")
+    assert "x-cache" not in response.headers
+    authorized_client.update(bakery_fixture.path, bakery["id"], bakery_fixture.update_opts[0])
+    assert response_cache.stats() == stats
+
+
+@pytest.mark.asyncio
+async def test_memory_backend():
+    backend = MemoryBackend(max_entries=2)
+    await backend.set("a", b"1")
+    await backend.set("b", b"2", ex=0)  # expires immediately
+    assert await backend.get("a") == b"1"
+    assert await backend.get("b") is None
+
+    await backend.set("b", b"2")
+    await backend.set("c", b"3")  # evicts "a", the least recently used
+    assert [await backend.get(k) for k in "abc"] == [None, b"2", b"3"]
+
+    assert await backend.incr("n") == 1
+    assert await backend.incr("n") == 2
+
+
+class FakeRedis(MemoryBackend):
+    """Validates ``ex`` as ``redis.asyncio.Redis.set`` (and the Redis server) do."""
+
+    async def set(self, key, value, ex=None):
+        if ex is not None and (not isinstance(ex, int) or ex <= 0):
+            raise ValueError("ex must be a positive int")  # redis.DataError / ResponseError
+        await super().set(key, value, ex=ex)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ttl", ["60", "0.5", "2.5"])
+async def test_redis_backend(ttl, monkeypatch):
+    monkeypatch.setenv("PANGEO_FORGE_RESPONSE_CACHE_TTL", ttl)
+    cache = ResponseCache(FakeRedis())
+    response = dict(headers=[], body="{}", etag='"abc"')
+    await cache.set("/bakeries/", "", response)
+    assert await cache.get("/bakeries/", "") == response
+    await cache.invalidate()
+    assert await cache.get("/bakeries/", "") is None
+
+
+@pytest.mark.parametrize(
+    "if_none_match, expected",
+    [('"abc"', True), ('W/"abc"', True), ('"x", "abc"', True), ("*", True), ('"x"', False)],
+)
+def test_etag_matches(if_none_match, expected):
+    assert etag_matches('"abc"', if_none_match) is expected
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("/feedstocks/", True),
+        ("/feedstocks/1", True),
+        ("/feedstocks/1/datasets", True),
+        ("/stats/recipe_runs", True),
+        # requested from GitHub, so not invalidated by writes to this app
+        ("/feedstocks/1/deliveries", False),
+        ("/feedstocks/1/commits/abc/check-runs", False),
+        ("/github/hooks/deliveries", False),
+    ],
+)
+def test_is_cacheable(path, expected):
+    assert is_cacheable(path) == expected
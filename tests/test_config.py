@@ -1,4 +1,14 @@
-from pangeo_forge_orchestrator.config import get_config, get_fastapi_config
+import os
+
+import yaml  # type: ignore
+
+from pangeo_forge_orchestrator import config
+from pangeo_forge_orchestrator.config import (
+    clear_config_cache,
+    get_config,
+    get_fastapi_config,
+    maybe_reload_config,
+)
 
 
 def test_get_config():
@@ -13,3 +23,37 @@ def test_get_fastapi_config():
         assert not hasattr(c, attr)
     for attr in ["PANGEO_FORGE_API_KEY"]:
         assert hasattr(c, attr)
+
+
+def test_get_config_is_cached(mocker):
+    first = get_config()
+    safe_load = mocker.spy(yaml, "safe_load")
+    stat = mocker.spy(config.os, "stat")
+    for _ in range(10):
+        assert get_config() is first
+    # the hot path should not touch the filesystem or the YAML parser at all
+    assert safe_load.call_count == 0
+    assert stat.call_count == 0
+
+
+def test_clear_config_cache():
+    first = get_config()
+    clear_config_cache()
+    second = get_config()
+    assert second is not first
+    assert second == first
+
+
+def test_maybe_reload_config():
+    first = get_config()
+    assert maybe_reload_config() is False
+    assert get_config() is first
+
+    # bump the modification time of the app config, as if it was edited in place
+    path = config.get_app_config_path()  # not imported by name, because it's mocked in conftest
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    assert maybe_reload_config() is True
+    assert get_config() is not first
+    assert maybe_reload_config() is False
@@ -0,0 +1,245 @@
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import QueuePool
+from sqlmodel import Session, select
+
+from pangeo_forge_orchestrator.api import app
+from pangeo_forge_orchestrator.database import (
+    async_engine,
+    bulk_create,
+    engine,
+    get_async_database_url,
+    get_async_session,
+    get_pool_kwargs_from_env,
+)
+from pangeo_forge_orchestrator.models import MODELS
+
+from .conftest import clear_database
+
+
+def test_pool_kwargs_defaults():
+    kws = get_pool_kwargs_from_env()
+    assert kws["poolclass"] is QueuePool
+    assert kws["pool_size"] == 5
+    assert kws["max_overflow"] == 10
+    assert kws["pool_pre_ping"] is True
+
+
+def test_pool_kwargs_from_env(monkeypatch):
+    monkeypatch.setenv("DATABASE_POOL_SIZE", "2")
+    monkeypatch.setenv("DATABASE_MAX_OVERFLOW", "0")
+    monkeypatch.setenv("DATABASE_POOL_TIMEOUT", "2.5")
+    monkeypatch.setenv("DATABASE_POOL_RECYCLE", "60")
+    monkeypatch.setenv("DATABASE_POOL_PRE_PING", "false")
+    kws = get_pool_kwargs_from_env()
+    assert kws["pool_size"] == 2
+    assert kws["max_overflow"] == 0
+    assert kws["pool_timeout"] == 2.5
+    assert kws["pool_recycle"] == 60
+    assert kws["pool_pre_ping"] is False
+
+
+@pytest.mark.parametrize("path", ["/recipe_runs/", "/feedstocks/", "/bakeries/"])
+def test_connections_reused_across_requests(path):
+    connects = []
+
+    def on_connect(dbapi_connection, connection_record):
+        connects.append(connection_record)
+
+    event.listen(engine, "connect", on_connect)
+    try:
+        with TestClient(app) as client:
+            for _ in range(50):
+                response = client.get(path)
+                assert response.status_code == 200
+    finally:
+        event.remove(engine, "connect", on_connect)
+
+    # with the previous NullPool, every one of these requests opened a new connection
+    assert len(connects) <= engine.pool.size()
+    assert engine.pool.checkedout() == 0
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("sqlite:////tmp/database.sqlite", "sqlite+aiosqlite:////tmp/database.sqlite"),
+        ("postgresql://localhost/db", "postgresql+asyncpg://localhost/db"),
+    ],
+)
+def test_get_async_database_url(url, expected):
+    assert get_async_database_url(url) == expected
+
+
+@pytest.mark.asyncio
+async def test_async_session_sees_sync_writes(session):
+    bakery = MODELS["bakery"].table(region="us-central1", name="bakery", description="a bakery")
+    with Session(engine) as sync_session:
+        sync_session.add(bakery)
+        sync_session.commit()
+
+    async for async_session in get_async_session():
+        count = (await async_session.exec(select(func.count(MODELS["bakery"].table.id)))).one()
+        assert count == 1
+
+    clear_database()
+
+
+@pytest.mark.asyncio
+async def test_bulk_create(session):
+    table = MODELS["bakery"].table
+    rows = [
+        table(region="us-central1", name=f"bakery-{i}", description="a bakery") for i in range(5)
+    ]
+
+    async for async_session in get_async_session():
+        created = await bulk_create(async_session, table, rows)
+        assert [c.name for c in created] == [f"bakery-{i}" for i in range(5)]
+        assert len({c.id for c in created}) == 5
+        assert await bulk_create(async_session, table, []) == []
+
+        # if any row can't be created, none of them are
+        rows = [table(region="us-central1", name="ok", description="a bakery"), table(name="bad")]
+        with pytest.raises(IntegrityError):
+            await bulk_create(async_session, table, rows)
+        count = (await async_session.exec(select(func.count(table.id)))).one()
+        assert count == 5
+
+    clear_database()
+
+
+@pytest.fixture
+def executed_datetimes():
+    """The datetime parameters of every statement executed by ``async_engine``, as passed to it
+    (i.e., before they're converted for the driver)."""
+
+    executed: list[datetime] = []
+
+    def before_execute(conn, clauseelement, multiparams, params, execution_options):
+        rows = [params] + [p for mp in multiparams for p in (mp if isinstance(mp, list) else [mp])]
+        executed.extend(v for row in rows for v in row.values() if isinstance(v, datetime))
+
+    event.listen(async_engine.sync_engine, "before_execute", before_execute)
+    yield executed
+    event.remove(async_engine.sync_engine, "before_execute", before_execute)
+
+
+@pytest.mark.asyncio
+async def test_async_writes_are_naive_utc(session, executed_datetimes):
+    model = MODELS["recipe_run"]
+    # as built by `synchronize` and `deploy_prod_run`
+    new_model = model.creation(
+        recipe_id="gpcp",
+        bakery_id=1,
+        feedstock_id=1,
+        head_sha="abc",
+        version="",
+        started_at="2022-08-11T21:03:56Z",
+        is_test=True,
+        dataset_type="zarr",
+        status="queued",
+    )
+
+    async for async_session in get_async_session():
+        created = model.table.from_orm(new_model)
+        async_session.add(created)
+        await async_session.commit()
+        run = await async_session.get(model.table, created.id)
+        run.completed_at = datetime.fromisoformat("2022-08-11T23:03:56+02:00")
+        async_session.add(run)
+        await async_session.commit()
+
+    assert executed_datetimes
+    assert all(d.tzinfo is None for d in executed_datetimes)
+    assert created.started_at == datetime(2022, 8, 11, 21, 3, 56)
+    with Session(engine) as sync_session:
+        run = sync_session.get(model.table, created.id)
+        assert run.completed_at == datetime(2022, 8, 11, 21, 3, 56)
+
+    clear_database()
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_is_naive_utc(session, executed_datetimes):
+    model = MODELS["recipe_run"]
+    new_model = model.creation(
+        recipe_id="gpcp",
+        bakery_id=1,
+        feedstock_id=1,
+        head_sha="abc",
+        version="",
+        started_at="2022-08-11T23:03:56+02:00",
+        is_test=True,
+        dataset_type="zarr",
+        status="queued",
+    )
+
+    async for async_session in get_async_session():
+        (created,) = await bulk_create(
+            async_session, model.table, [model.table.from_orm(new_model)]
+        )
+
+    assert executed_datetimes
+    assert all(d.tzinfo is None for d in executed_datetimes)
+    assert created.started_at == datetime(2022, 8, 11, 21, 3, 56)
+
+    clear_database()
+
+
+def explain_query_plan(statement) -> str:
+    """Return sqlite's query plan for ``statement``, e.g. ``"SEARCH bakery USING INDEX ..."``."""
+
+    compiled = statement.compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as connection:
+        plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}").all()
+    return "\n".join(row[-1] for row in plan)
+
+
+recipe_run = MODELS["recipe_run"].table
+
+
+@pytest.mark.parametrize(
+    "statement, index",
+    [
+        # `synchronize` and `deploy_prod_run`
+        (
+            select(MODELS["feedstock"].table).where(MODELS["feedstock"].table.spec == "a/b"),
+            "sqlite_autoindex_feedstock_1",  # i.e. the index of `uq_feedstock_spec`
+        ),
+        (
+            select(MODELS["bakery"].table).where(MODELS["bakery"].table.name == "a"),
+            "sqlite_autoindex_bakery_1",  # i.e. the index of `uq_bakery_name`
+        ),
+        # `handle_pr_comment_event`
+        (
+            select(recipe_run).where(recipe_run.recipe_id == "a", recipe_run.head_sha == "abc"),
+            "ix_reciperun_recipe_id_head_sha",
+        ),
+        # `/feedstocks/{id}/datasets`
+        (
+            select(recipe_run).where(
+                recipe_run.feedstock_id == 1,
+                recipe_run.dataset_public_url.isnot(None),
+                recipe_run.status == "completed",
+                recipe_run.conclusion == "success",
+            ),
+            "ix_reciperun_feedstock_id_status_conclusion_is_test",
+        ),
+        # `/recipe_runs/` filters
+        (
+            select(recipe_run).where(recipe_run.bakery_id == 1, recipe_run.status == "queued"),
+            "ix_reciperun_bakery_id_status",
+        ),
+        (
+            select(recipe_run).where(recipe_run.started_at >= "2022-01-01"),
+            "ix_reciperun_started_at",
+        ),
+    ],
+)
+def test_queries_use_indexes(statement, index):
+    plan = explain_query_plan(statement)
+    assert f"USING INDEX {index} " in plan or f"USING COVERING INDEX {index} " in plan
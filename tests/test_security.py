@@ -0,0 +1,65 @@
+import pytest
+
+from pangeo_forge_orchestrator import security
+from pangeo_forge_orchestrator.config import FastAPIConfig
+from pangeo_forge_orchestrator.security import APIKeyStore
+
+
+@pytest.fixture
+def mock_fastapi_config(mocker):
+    """Patches the config file read by ``APIKeyStore``. Update the returned dict to simulate
+    editing the file on disk."""
+
+    state = {"config": FastAPIConfig(PANGEO_FORGE_API_KEY="old-key"), "fingerprint": (1,)}
+    get_fastapi_config = mocker.patch.object(
+        security, "get_fastapi_config", side_effect=lambda: state["config"]
+    )
+    mocker.patch.object(
+        security, "get_app_config_fingerprint", side_effect=lambda: state["fingerprint"]
+    )
+    return state, get_fastapi_config
+
+
+def test_api_key_store_is_memoized(mock_fastapi_config):
+    _, get_fastapi_config = mock_fastapi_config
+    store = APIKeyStore(check_interval=60)
+    for _ in range(10):
+        assert store.is_valid("old-key")
+        assert not store.is_valid("wrong-key")
+    assert get_fastapi_config.call_count == 1
+
+
+def test_api_key_store_reloads_on_change(mock_fastapi_config):
+    state, get_fastapi_config = mock_fastapi_config
+    store = APIKeyStore(check_interval=0)
+    assert store.is_valid("old-key")
+    assert not store.is_valid("new-key")
+
+    # unchanged fingerprint, so no reload
+    assert store.is_valid("old-key")
+    assert get_fastapi_config.call_count == 1
+
+    # rotate: new key is primary, old key remains active until clients migrate
+    state["config"] = FastAPIConfig(
+        PANGEO_FORGE_API_KEY="new-key",
+        PANGEO_FORGE_ADDITIONAL_API_KEYS=["old-key"],
+    )
+    state["fingerprint"] = (2,)
+    assert store.is_valid("new-key")
+    assert store.is_valid("old-key")
+    assert get_fastapi_config.call_count == 2
+
+    # rotation complete
+    state["config"] = FastAPIConfig(PANGEO_FORGE_API_KEY="new-key")
+    state["fingerprint"] = (3,)
+    assert store.is_valid("new-key")
+    assert not store.is_valid("old-key")
+
+
+def test_api_key_store_clear(mock_fastapi_config):
+    _, get_fastapi_config = mock_fastapi_config
+    store = APIKeyStore(check_interval=60)
+    assert store.is_valid("old-key")
+    store.clear()
+    assert store.is_valid("old-key")
+    assert get_fastapi_config.call_count == 2